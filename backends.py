@@ -0,0 +1,389 @@
+"""
+Backendy wyszukiwania hybrydowego (dense + sparse, fuzja RRF) z filtrami metadanych.
+
+`utils.py` nie rozmawia bezpośrednio z klientem Qdranta, tylko z `config.search_backend`:
+  - `QdrantBackend` - zdalny (lub lokalny) Qdrant, prefetch dense/sparse + RRF po stronie serwera,
+  - `numpy_index.NumpyBackend` - dokładne wyszukiwanie w procesie na plikach z `numpy_index.py`.
+
+Filtry są przekazywane jako `models.Filter` z `utils.build_qdrant_filter`, a wyniki jako
+`models.ScoredPoint` / `models.Record`, więc reszta kodu nie zależy od wybranego backendu.
+"""
+
+import asyncio
+import math
+from abc import ABC, abstractmethod
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from qdrant_client import models
+
+from config import (
+    COLLECTION_NAME,
+    DENSE_DIM,
+    DENSE_QUANTIZATION,
+    QUANTIZATION_OVERSAMPLING,
+)
+
+# Liczba kandydatów z każdej gałęzi (dense / sparse) przed fuzją RRF
+PREFETCH_LIMIT = 50
+# Stała RRF jak w Qdrancie: wynik punktu to suma 1 / (RRF_K + pozycja) po listach (od 0)
+RRF_K = 2
+# Skrócony (Matryoshka) wektor dense, obok pełnego "text-dense"
+COMPACT_VECTOR_NAME = "text-dense-mrl"
+
+PayloadSelector = Union[bool, Sequence[str]]
+
+
+# ===== WEKTORY KOMPAKTOWE =====
+
+
+def truncate_dense(vector, dim: int) -> np.ndarray:
+    """Pierwsze `dim` wymiarów embeddingu Matryoshka, ponownie znormalizowane (wektor albo macierz)."""
+    truncated = np.asarray(vector, dtype=np.float32)[..., :dim]
+    norms = np.linalg.norm(truncated, axis=-1, keepdims=True)
+    return truncated / np.where(norms == 0, 1.0, norms)
+
+
+def compact_dim(full_dim: int, dim: int = DENSE_DIM) -> Optional[int]:
+    """Wymiar wektora kompaktowego albo None, gdy skracanie jest wyłączone."""
+    return dim if 0 < dim < full_dim else None
+
+
+def quantization_config(kind: str = DENSE_QUANTIZATION):
+    if kind == "none":
+        return None
+    if kind == "scalar":
+        return models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(
+                type=models.ScalarType.INT8, quantile=0.99, always_ram=True
+            )
+        )
+    if kind == "binary":
+        return models.BinaryQuantization(
+            binary=models.BinaryQuantizationConfig(always_ram=True)
+        )
+    raise ValueError(f"Nieznany rodzaj kwantyzacji: {kind}")
+
+
+def dense_vectors_config(
+    full_dim: int, dim: int = DENSE_DIM, quantization: str = DENSE_QUANTIZATION
+) -> Dict[str, models.VectorParams]:
+    """
+    Konfiguracja wektorów dense kolekcji. Przy włączonej kompresji oryginały leżą na dysku
+    (potrzebne tylko do rescoringu), a w RAM zostaje wektor skrócony i/lub skwantyzowany.
+    """
+    quantization_cfg = quantization_config(quantization)
+    dim = compact_dim(full_dim, dim)
+    if dim is None:
+        return {
+            "text-dense": models.VectorParams(
+                size=full_dim,
+                distance=models.Distance.COSINE,
+                on_disk=True if quantization_cfg else None,
+                quantization_config=quantization_cfg,
+            )
+        }
+    return {
+        "text-dense": models.VectorParams(
+            size=full_dim, distance=models.Distance.COSINE, on_disk=True
+        ),
+        COMPACT_VECTOR_NAME: models.VectorParams(
+            size=dim,
+            distance=models.Distance.COSINE,
+            on_disk=True if quantization_cfg else None,
+            quantization_config=quantization_cfg,
+        ),
+    }
+
+
+def dense_point_vectors(dense, dim: int = DENSE_DIM) -> Dict[str, List[float]]:
+    """Wektory dense jednego punktu: pełny i (opcjonalnie) skrócony."""
+    vectors = {"text-dense": np.asarray(dense, dtype=np.float32).tolist()}
+    dim = compact_dim(len(vectors["text-dense"]), dim)
+    if dim is not None:
+        vectors[COMPACT_VECTOR_NAME] = truncate_dense(dense, dim).tolist()
+    return vectors
+
+
+def dense_prefetch(
+    query_dense: List[float],
+    qdrant_filter: Optional[models.Filter],
+    limit: int = PREFETCH_LIMIT,
+    dim: int = DENSE_DIM,
+    quantization: str = DENSE_QUANTIZATION,
+    oversampling: float = QUANTIZATION_OVERSAMPLING,
+) -> models.Prefetch:
+    """
+    Gałąź dense zapytania. Z wektorem skróconym: kandydaci (limit * oversampling) z wektora
+    kompaktowego, ranking pełnym wektorem. Z samą kwantyzacją: Qdrant sam nadpróbkowuje
+    i przelicza wyniki na oryginałach.
+    """
+    quantized = quantization != "none"
+    dim = compact_dim(len(query_dense), dim)
+    if dim is None:
+        return models.Prefetch(
+            query=query_dense,
+            using="text-dense",
+            filter=qdrant_filter,
+            limit=limit,
+            params=(
+                models.SearchParams(
+                    quantization=models.QuantizationSearchParams(
+                        rescore=True, oversampling=oversampling
+                    )
+                )
+                if quantized
+                else None
+            ),
+        )
+
+    candidates = models.Prefetch(
+        query=truncate_dense(query_dense, dim).tolist(),
+        using=COMPACT_VECTOR_NAME,
+        filter=qdrant_filter,
+        limit=math.ceil(limit * oversampling),
+        params=(
+            # Ranking i tak poprawia pełny wektor - bez drugiego rescoringu
+            models.SearchParams(
+                quantization=models.QuantizationSearchParams(rescore=False)
+            )
+            if quantized
+            else None
+        ),
+    )
+    return models.Prefetch(
+        prefetch=candidates,
+        query=query_dense,
+        using="text-dense",
+        filter=qdrant_filter,
+        limit=limit,
+    )
+
+
+class SearchBackend(ABC):
+    """Interfejs backendu: wyszukiwanie hybrydowe kilku filtrów naraz i pobieranie payloadów."""
+
+    @abstractmethod
+    def search_batch(
+        self,
+        query_dense: List[float],
+        query_sparse: models.SparseVector,
+        filters: List[Optional[models.Filter]],
+        limit: int = 20,
+        with_payload: PayloadSelector = True,
+    ) -> List[List[models.ScoredPoint]]:
+        """Dla każdego filtra zwraca `limit` najlepszych punktów po fuzji RRF."""
+
+    def search_many(
+        self,
+        queries: List[Tuple[List[float], models.SparseVector]],
+        filters: List[Optional[models.Filter]],
+        limit: int = 20,
+        with_payload: PayloadSelector = True,
+    ) -> List[List[List[models.ScoredPoint]]]:
+        """Kilka zapytań (dense, sparse) naraz; wynik [zapytanie][filtr]."""
+        return [
+            self.search_batch(dense, sparse, filters, limit, with_payload)
+            for dense, sparse in queries
+        ]
+
+    @abstractmethod
+    def retrieve(
+        self, point_ids: List[int], with_payload: PayloadSelector = True
+    ) -> List[models.Record]:
+        """Punkty o podanych id (pominięte, jeśli ich nie ma w kolekcji)."""
+
+    @abstractmethod
+    def scroll_payloads(
+        self, with_payload: PayloadSelector = True
+    ) -> Iterator[Tuple[int, dict]]:
+        """Wszystkie punkty kolekcji jako (id, payload) - do budowy indeksów pomocniczych."""
+
+    # Wersje async dla grafu uruchamianego przez `ainvoke` / `astream`. Domyślnie w wątku -
+    # backend w procesie (NumPy) i tak liczy na CPU; Qdrant nadpisuje je klientem async.
+
+    async def asearch_batch(
+        self,
+        query_dense: List[float],
+        query_sparse: models.SparseVector,
+        filters: List[Optional[models.Filter]],
+        limit: int = 20,
+        with_payload: PayloadSelector = True,
+    ) -> List[List[models.ScoredPoint]]:
+        return await asyncio.to_thread(
+            self.search_batch, query_dense, query_sparse, filters, limit, with_payload
+        )
+
+    async def asearch_many(
+        self,
+        queries: List[Tuple[List[float], models.SparseVector]],
+        filters: List[Optional[models.Filter]],
+        limit: int = 20,
+        with_payload: PayloadSelector = True,
+    ) -> List[List[List[models.ScoredPoint]]]:
+        return await asyncio.to_thread(
+            self.search_many, queries, filters, limit, with_payload
+        )
+
+    async def aretrieve(
+        self, point_ids: List[int], with_payload: PayloadSelector = True
+    ) -> List[models.Record]:
+        return await asyncio.to_thread(self.retrieve, point_ids, with_payload)
+
+
+class QdrantBackend(SearchBackend):
+    """
+    Metody async idą przez `async_client` (`AsyncQdrantClient`), a bez niego - przez
+    klienta synchronicznego w wątku, jak w pozostałych backendach.
+    """
+
+    def __init__(
+        self, client, collection_name: str = COLLECTION_NAME, async_client=None
+    ):
+        self.client = client
+        self.collection_name = collection_name
+        self.async_client = async_client
+
+    @staticmethod
+    def _hybrid_prefetch(
+        query_dense: List[float],
+        query_sparse: models.SparseVector,
+        qdrant_filter: Optional[models.Filter],
+    ) -> List[models.Prefetch]:
+        return [
+            dense_prefetch(query_dense, qdrant_filter),
+            models.Prefetch(
+                query=query_sparse,
+                using="text-sparse",
+                filter=qdrant_filter,
+                limit=PREFETCH_LIMIT,
+            ),
+        ]
+
+    def _hybrid_query(
+        self, query_dense, query_sparse, qdrant_filter, limit, with_payload
+    ) -> dict:
+        """Argumenty zapytania hybrydowego - dla `query_points` i `models.QueryRequest`."""
+        return dict(
+            prefetch=self._hybrid_prefetch(query_dense, query_sparse, qdrant_filter),
+            query=models.FusionQuery(fusion=models.Fusion.RRF),
+            limit=limit,
+            with_payload=with_payload,
+        )
+
+    def _batch_requests(self, queries, filters, limit, with_payload):
+        # Wszystkie pary (zapytanie, filtr) w jednym żądaniu batch
+        return [
+            models.QueryRequest(
+                **self._hybrid_query(dense, sparse, qdrant_filter, limit, with_payload)
+            )
+            for dense, sparse in queries
+            for qdrant_filter in filters
+        ]
+
+    @staticmethod
+    def _per_query(responses, filters) -> List[List[List[models.ScoredPoint]]]:
+        points = [response.points for response in responses]
+        return [
+            points[i : i + len(filters)] for i in range(0, len(points), len(filters))
+        ]
+
+    def search_batch(
+        self,
+        query_dense,
+        query_sparse,
+        filters,
+        limit=20,
+        with_payload=True,
+    ):
+        if len(filters) == 1:
+            # Pojedyncze zapytanie bez narzutu endpointu batch
+            results = self.client.query_points(
+                collection_name=self.collection_name,
+                **self._hybrid_query(
+                    query_dense, query_sparse, filters[0], limit, with_payload
+                ),
+            )
+            return [results.points]
+        return self.search_many(
+            [(query_dense, query_sparse)], filters, limit, with_payload
+        )[0]
+
+    def search_many(self, queries, filters, limit=20, with_payload=True):
+        responses = self.client.query_batch_points(
+            collection_name=self.collection_name,
+            requests=self._batch_requests(queries, filters, limit, with_payload),
+        )
+        return self._per_query(responses, filters)
+
+    def retrieve(self, point_ids, with_payload=True):
+        if not point_ids:
+            return []
+        return self.client.retrieve(
+            collection_name=self.collection_name,
+            ids=point_ids,
+            with_payload=with_payload,
+            with_vectors=False,
+        )
+
+    async def asearch_batch(
+        self,
+        query_dense,
+        query_sparse,
+        filters,
+        limit=20,
+        with_payload=True,
+    ):
+        if self.async_client is None:
+            return await super().asearch_batch(
+                query_dense, query_sparse, filters, limit, with_payload
+            )
+        if len(filters) == 1:
+            results = await self.async_client.query_points(
+                collection_name=self.collection_name,
+                **self._hybrid_query(
+                    query_dense, query_sparse, filters[0], limit, with_payload
+                ),
+            )
+            return [results.points]
+        return (
+            await self.asearch_many(
+                [(query_dense, query_sparse)], filters, limit, with_payload
+            )
+        )[0]
+
+    async def asearch_many(self, queries, filters, limit=20, with_payload=True):
+        if self.async_client is None:
+            return await super().asearch_many(queries, filters, limit, with_payload)
+        responses = await self.async_client.query_batch_points(
+            collection_name=self.collection_name,
+            requests=self._batch_requests(queries, filters, limit, with_payload),
+        )
+        return self._per_query(responses, filters)
+
+    async def aretrieve(self, point_ids, with_payload=True):
+        if self.async_client is None:
+            return await super().aretrieve(point_ids, with_payload)
+        if not point_ids:
+            return []
+        return await self.async_client.retrieve(
+            collection_name=self.collection_name,
+            ids=point_ids,
+            with_payload=with_payload,
+            with_vectors=False,
+        )
+
+    def scroll_payloads(self, with_payload=True, batch_size: int = 1024):
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                self.collection_name,
+                limit=batch_size,
+                offset=offset,
+                with_payload=with_payload,
+                with_vectors=False,
+            )
+            for point in points:
+                yield point.id, point.payload
+            if offset is None:
+                break
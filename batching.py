@@ -0,0 +1,151 @@
+"""
+Mikro-batching wywołań modeli między współbieżnymi zapytaniami.
+
+Każde uruchomienie grafu koduje jedno zapytanie i ocenia ~20 par rerankerem. Przy wielu
+równoległych sesjach `MicroBatcher` zbiera takie pojedyncze żądania przez kilka milisekund
+i wykonuje je jednym wywołaniem modelu. Każdy wywołujący dostaje swój wynik przez `Future`.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List, Sequence, Tuple
+
+import numpy as np
+
+
+class MicroBatcher:
+    """
+    Kolejka żądań obsługiwana przez jeden wątek roboczy.
+
+    Wątek czeka na pierwsze żądanie, a potem dobiera kolejne przez `max_wait_ms`
+    (albo do `max_batch_size`). Zebrane elementy są sortowane po długości i dzielone
+    na kubełki po `bucket_size`, żeby krótkie teksty nie były dopełniane do najdłuższego.
+    """
+
+    def __init__(
+        self,
+        fn: Callable[[List[Any]], Sequence[Any]],
+        max_batch_size: int = 64,
+        max_wait_ms: float = 5.0,
+        bucket_size: int = 32,
+        length_key: Callable[[Any], int] = len,
+        name: str = "micro-batcher",
+    ):
+        self.fn = fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.bucket_size = bucket_size
+        self.length_key = length_key
+
+        self.batches = 0
+        self.items = 0
+
+        self._queue: "queue.Queue[Tuple[Any, Future]]" = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name=name, daemon=True)
+        self._worker.start()
+
+    def submit(self, item: Any) -> Future:
+        future: Future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def map(self, items: Sequence[Any]) -> List[Any]:
+        """Wysyła wszystkie elementy naraz i czeka na ich wyniki (w tej samej kolejności)."""
+        futures = [self.submit(item) for item in items]
+        return [future.result() for future in futures]
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+            "queue_depth": self._queue.qsize(),
+        }
+
+    def _collect(self) -> List[Tuple[Any, Future]]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            self.batches += 1
+            self.items += len(batch)
+
+            batch.sort(key=lambda entry: self.length_key(entry[0]))
+            for start in range(0, len(batch), self.bucket_size):
+                bucket = batch[start : start + self.bucket_size]
+                try:
+                    results = self.fn([item for item, _ in bucket])
+                except BaseException as e:
+                    for _, future in bucket:
+                        future.set_exception(e)
+                    continue
+                for (_, future), result in zip(bucket, results):
+                    future.set_result(result)
+
+
+class BatchedDenseEncoder:
+    """
+    Nakładka na SentenceTransformer z tym samym `encode`. Wywołania z dodatkowymi
+    argumentami (np. batch_size przy indeksowaniu) trafiają bezpośrednio do modelu.
+    """
+
+    def __init__(self, model, **batcher_kwargs):
+        self.model = model
+        self.batcher = MicroBatcher(
+            self._encode_batch, name="dense-batcher", **batcher_kwargs
+        )
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        return self.model.encode(texts, batch_size=len(texts), show_progress_bar=False)
+
+    def encode(self, sentences, **kwargs):
+        if kwargs:
+            return self.model.encode(sentences, **kwargs)
+        if isinstance(sentences, str):
+            return self.batcher.submit(sentences).result()
+        if not len(sentences):
+            dim = self.model.get_sentence_embedding_dimension() or 0
+            return np.empty((0, dim), dtype=np.float32)
+        return np.stack(self.batcher.map(list(sentences)))
+
+    def __getattr__(self, name: str):
+        return getattr(self.model, name)
+
+
+class BatchedReranker:
+    """Nakładka na CrossEncoder: pary (zapytanie, fragment) od wielu wywołujących oceniane razem."""
+
+    def __init__(self, model, **batcher_kwargs):
+        self.model = model
+        self.batcher = MicroBatcher(
+            self._predict_batch,
+            name="rerank-batcher",
+            length_key=lambda pair: len(pair[0]) + len(pair[1]),
+            **batcher_kwargs,
+        )
+
+    def _predict_batch(self, pairs: List[Sequence[str]]) -> np.ndarray:
+        return self.model.predict(pairs, batch_size=len(pairs), show_progress_bar=False)
+
+    def predict(self, sentences, **kwargs):
+        if kwargs:
+            return self.model.predict(sentences, **kwargs)
+        if not len(sentences):
+            return np.array([], dtype=np.float32)
+        return np.asarray(self.batcher.map(list(sentences)))
+
+    def __getattr__(self, name: str):
+        return getattr(self.model, name)
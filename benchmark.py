@@ -0,0 +1,734 @@
+"""
+Offline benchmark opóźnień `film_agent.app` - bez Groqa, serwera Qdranta i GPU.
+
+Benchmark buduje małą kolekcję w lokalnym trybie Qdranta (w pamięci albo w katalogu
+`--qdrant-path`) z próbki wierszy TMDB (`--csv`) lub z syntetycznych wierszy w tym samym
+formacie. Wiersze przechodzą przez te same funkcje co w `ingest.py`. Modele i LLM-y są
+podmieniane przez `config.override` na deterministyczne atrapy, więc mierzymy wyłącznie
+narzut naszego kodu: grafu, węzłów, filtrów, zapytań do Qdranta i cache'y.
+
+Każdy scenariusz wymusza jedną ścieżkę grafu (vectorstore, pętla rewrite - udana
+i wyczerpana, luzowanie filtrów, web_search, general_chat); `refine` i `more` mierzą dopytanie po turze
+`vectorstore` w tym samym wątku (zawężenie filtrów i kolejna strona wyników). Raport zawiera p50/p95/p99 dla każdego węzła
+i każdej ścieżki. Cache'e zapytań i rerankera są czyszczone przed każdym uruchomieniem,
+a cache odpowiedzi jest wyłączony, więc powtórzenia nie zamieniają się w trafienia cache'a.
+
+Użycie:
+    python benchmark.py
+    python benchmark.py --iterations 200 --llm-latency-ms 50 --json wyniki.json
+    python benchmark.py --csv TMDB_movie_dataset_v11.csv --sample 2000
+    python benchmark.py --async              # graf przez app.astream (węzły async)
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+import types
+import uuid
+import zlib
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.runnables import RunnableLambda
+from qdrant_client import QdrantClient, models
+
+import config
+import telemetry
+from backends import dense_point_vectors
+from cache import QueryEmbeddingCache, RerankScoreCache
+from film_agent import app
+from ingest import ensure_collection, prepare_chunk
+from title_index import build_title_index
+from models import (
+    GradeDocuments,
+    MovieSearchIntent,
+    RewrittenQueries,
+    RouteQuery,
+    RoutedSearchIntent,
+)
+from utils import build_qdrant_filter
+
+FAKE_DENSE_DIM = 128
+FAKE_ANSWER = "Polecam te filmy: " + " ".join(["opis"] * 60)
+FAKE_WEB_RESULTS = "Repertuar kin na ten tydzień: Film A, Film B, Film C."
+
+
+# ===== ATRAPY MODELI =====
+
+
+def _tokens(text: str) -> List[str]:
+    return "".join(c if c.isalnum() else " " for c in text.lower()).split()
+
+
+def _hash(token: str) -> int:
+    # crc32 zamiast hash(), który w Pythonie jest losowany per proces
+    return zlib.crc32(token.encode("utf-8"))
+
+
+class FakeDenseEncoder:
+    """Haszowany worek słów - teksty o wspólnych słowach mają podobne wektory."""
+
+    def encode(self, sentences, **kwargs):
+        if isinstance(sentences, str):
+            return self._encode_one(sentences)
+        return np.stack([self._encode_one(s) for s in sentences])
+
+    def _encode_one(self, text: str) -> np.ndarray:
+        vector = np.zeros(FAKE_DENSE_DIM, dtype=np.float32)
+        for token in _tokens(text):
+            h = _hash(token)
+            vector[h % FAKE_DENSE_DIM] += 1.0 if h & 1 << 16 else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return FAKE_DENSE_DIM
+
+
+class FakeSparseEncoder:
+    """Liczności słów pod haszowanymi indeksami, jak wyjście BM25 z fastembed."""
+
+    def embed(self, texts, **kwargs):
+        for text in texts:
+            counts = defaultdict(float)
+            for token in _tokens(text):
+                counts[_hash(token) % 2**20] += 1.0
+            indices = sorted(counts)
+            yield types.SimpleNamespace(
+                indices=np.array(indices, dtype=np.int64),
+                values=np.array([counts[i] for i in indices], dtype=np.float32),
+            )
+
+
+class FakeReranker:
+    """
+    Wynik rośnie z odsetkiem słów zapytania obecnych we fragmencie: brak wspólnych słów
+    daje -6 (szybki sędzia odrzuca), pełne pokrycie daje 10 (szybki sędzia akceptuje).
+    """
+
+    def predict(self, pairs, **kwargs):
+        scores = []
+        for query, passage in pairs:
+            query_tokens = set(_tokens(query))
+            passage_tokens = set(_tokens(passage))
+            overlap = len(query_tokens & passage_tokens) / max(len(query_tokens), 1)
+            scores.append(16.0 * overlap - 6.0)
+        return np.array(scores, dtype=np.float32)
+
+
+# ===== DANE =====
+
+GENRES = [
+    "Action",
+    "Comedy",
+    "Drama",
+    "Horror",
+    "Science Fiction",
+    "Romance",
+    "Thriller",
+    "Animation",
+    "War",
+    "Crime",
+]
+
+THEMES = [
+    (
+        "haunted house ghost family",
+        "A family moves into an old house haunted by a vengeful ghost",
+    ),
+    (
+        "space station astronaut survival",
+        "An astronaut fights to survive after the space station is destroyed",
+    ),
+    (
+        "bank heist crew betrayal",
+        "A crew of thieves plans the perfect bank heist until one of them betrays the rest",
+    ),
+    (
+        "small town romance baker",
+        "A baker from a small town falls in love with a travelling musician",
+    ),
+    (
+        "world war soldier resistance",
+        "A young soldier joins the resistance during the second world war",
+    ),
+    (
+        "robot friendship child",
+        "A lonely child repairs a broken robot and they become best friends",
+    ),
+    (
+        "serial killer detective mask",
+        "A detective hunts a masked serial killer terrorising the city",
+    ),
+    (
+        "road trip brothers comedy",
+        "Two estranged brothers take a chaotic road trip across the country",
+    ),
+]
+
+COUNTRIES = [
+    ("United States of America", "en"),
+    ("Poland", "pl"),
+    ("France", "fr"),
+    ("United Kingdom", "en"),
+    ("South Korea", "ko"),
+]
+
+
+def synthetic_rows(n: int, seed: int = 0) -> pd.DataFrame:
+    """Wiersze w formacie CSV TMDB, deterministyczne dla danego ziarna."""
+    rng = random.Random(seed)
+    rows = []
+    for i in range(1, n + 1):
+        keywords, overview = THEMES[i % len(THEMES)]
+        country, language = COUNTRIES[i % len(COUNTRIES)]
+        rows.append(
+            {
+                "id": i,
+                "title": f"{keywords.split()[0].title()} Story {i}",
+                "original_title": f"{keywords.split()[0].title()} Story {i}",
+                "overview": f"{overview}. Episode {i} of an otherwise ordinary life.",
+                "tagline": f"Nothing is what it seems {i}",
+                "release_date": f"{rng.randint(1960, 2023)}-{rng.randint(1, 12):02d}-01",
+                "vote_average": round(rng.uniform(4.0, 9.0), 1),
+                "vote_count": rng.randint(20, 20000),
+                "popularity": round(rng.uniform(1.0, 100.0), 2),
+                "runtime": rng.randint(75, 170),
+                "adult": False,
+                "genres": ", ".join(rng.sample(GENRES, 2)),
+                "keywords": ", ".join(keywords.split()),
+                "production_companies": "Fixture Pictures",
+                "production_countries": country,
+                "spoken_languages": language,
+                "original_language": language,
+                "poster_path": None,
+                "backdrop_path": None,
+                "imdb_id": f"tt{i:07d}",
+            }
+        )
+    return pd.DataFrame(rows)
+
+
+def build_fixture_collection(
+    client: QdrantClient, df: pd.DataFrame, dense_model, sparse_model
+) -> int:
+    ids, texts, payloads = prepare_chunk(df)
+    ensure_collection(client, FAKE_DENSE_DIM, recreate=True)
+
+    dense_vectors = dense_model.encode(texts)
+    sparse_vectors = list(sparse_model.embed(texts))
+    points = [
+        models.PointStruct(
+            id=point_id,
+            vector={
+                **dense_point_vectors(dense),
+                "text-sparse": models.SparseVector(
+                    indices=sparse.indices.tolist(), values=sparse.values.tolist()
+                ),
+            },
+            payload=payload,
+        )
+        for point_id, dense, sparse, payload in zip(
+            ids, dense_vectors, sparse_vectors, payloads
+        )
+    ]
+    for start in range(0, len(points), 256):
+        client.upsert(config.COLLECTION_NAME, points=points[start : start + 256])
+    return len(points)
+
+
+# ===== SCENARIUSZE =====
+
+
+class Scenario:
+    def __init__(
+        self,
+        path: str,
+        question: str,
+        destination: str,
+        expected_nodes: List[str],
+        intent: Optional[dict] = None,
+        rewrite: Optional[str] = None,
+        previous: Optional["Scenario"] = None,
+    ):
+        self.path = path
+        self.question = question
+        self.destination = destination
+        self.expected_nodes = expected_nodes
+        self.intent = MovieSearchIntent(**intent) if intent else None
+        self.rewrite = rewrite
+        # Tura rozmowy wykonywana przed pomiarem w tym samym wątku (dopytania)
+        self.previous = previous
+
+
+RAG_NODES = ["route", "retrieve", "grade_documents", "generate"]
+# Rundy przepisywania przy ciągle odrzucanych wynikach (fan-out sprawdza wszystko w jednej)
+MAX_REWRITES = 1 if config.REWRITE_MODE == "fanout" else 3
+
+VECTORSTORE = Scenario(
+    "vectorstore",
+    "Straszny film o nawiedzonym domu",
+    "vectorstore",
+    RAG_NODES,
+    intent=dict(
+        synthesized_query="haunted house ghost family",
+        query_english="haunted house ghost family",
+    ),
+)
+
+SCENARIOS = [
+    VECTORSTORE,
+    Scenario(
+        "retry_loop",
+        "Coś jak ten film z tym aktorem, no wiesz",
+        "vectorstore",
+        [
+            "route",
+            "retrieve",
+            "grade_documents",
+            "rewrite_query",
+            "retrieve",
+            "grade_documents",
+            "generate",
+        ],
+        intent=dict(
+            synthesized_query="zqx unknown vague request",
+            query_english="zqx unknown vague request",
+        ),
+        rewrite="bank heist crew betrayal",
+    ),
+    Scenario(
+        "retry_exhausted",
+        "Ten film, no ten, wiesz który",
+        "vectorstore",
+        ["route", "retrieve", "grade_documents"]
+        + ["rewrite_query", "retrieve", "grade_documents"] * MAX_REWRITES
+        + ["generate"],
+        intent=dict(
+            synthesized_query="zqx qwv unknown",
+            query_english="zqx qwv unknown",
+        ),
+    ),
+    Scenario(
+        "relaxed_filters",
+        "Wybitny film o astronaucie z 1985 roku, bardzo krótki",
+        "vectorstore",
+        RAG_NODES,
+        intent=dict(
+            synthesized_query="space station astronaut survival",
+            query_english="space station astronaut survival",
+            year_min=1985,
+            year_max=1985,
+            min_score=8.5,
+            max_runtime=85,
+        ),
+    ),
+    Scenario(
+        "refine",
+        "A coś lepiej ocenianego?",
+        "vectorstore",
+        RAG_NODES,
+        intent=dict(
+            synthesized_query="haunted house ghost family rated at least 7",
+            query_english="haunted house ghost family",
+            min_score=7.0,
+        ),
+        previous=VECTORSTORE,
+    ),
+    Scenario(
+        "more",
+        "Pokaż więcej takich filmów",
+        "vectorstore",
+        RAG_NODES,
+        intent=VECTORSTORE.intent.model_dump(),
+        previous=VECTORSTORE,
+    ),
+    Scenario(
+        "title",
+        "Opowiedz mi o filmie Bank Story 42",
+        "vectorstore",
+        RAG_NODES,
+        intent=dict(
+            synthesized_query="Bank Story 42",
+            query_english="Bank Story 42",
+            specific_title="Bank Story 42",
+        ),
+    ),
+    Scenario(
+        "web_search",
+        "Co grają dziś w kinach?",
+        "web_search",
+        ["route", "web_search", "generate"],
+    ),
+    Scenario(
+        "general_chat",
+        "Cześć, jak się masz?",
+        "general_chat",
+        ["route", "generate"],
+    ),
+]
+
+
+class FakeLLMs:
+    """
+    Deterministyczne odpowiedzi łańcuchów LLM dla scenariuszy. Każde wywołanie czeka
+    `latency_ms`, żeby można było porównać warianty różniące się liczbą wywołań LLM.
+    """
+
+    def __init__(self, scenarios: List[Scenario], latency_ms: float = 0.0):
+        self.by_question = {s.question: s for s in scenarios}
+        self.by_question.update(
+            {s.previous.question: s.previous for s in scenarios if s.previous}
+        )
+        # Zapytanie scenariusza z pętlą rewrite -> zapytanie po przepisaniu
+        self.rewrites = {
+            s.intent.synthesized_query: s.rewrite for s in scenarios if s.rewrite
+        }
+        self.latency = latency_ms / 1000.0
+
+    def _wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _intent_for(self, query: str) -> MovieSearchIntent:
+        scenario = self.by_question.get(query)
+        if scenario is not None and scenario.intent is not None:
+            return scenario.intent
+        # Zapytanie po przepisaniu (albo nieznane) - sam temat, bez filtrów
+        return MovieSearchIntent(synthesized_query=query, query_english=query)
+
+    def route_and_analyze(self, inputs: dict) -> RoutedSearchIntent:
+        self._wait()
+        scenario = self.by_question[inputs["query"]]
+        return RoutedSearchIntent(
+            destination=scenario.destination, search_intent=scenario.intent
+        )
+
+    def route(self, inputs: dict) -> RouteQuery:
+        self._wait()
+        return RouteQuery(destination=self.by_question[inputs["question"]].destination)
+
+    def analyze(self, inputs: dict) -> MovieSearchIntent:
+        self._wait()
+        return self._intent_for(inputs["query"])
+
+    def grade(self, inputs: dict) -> GradeDocuments:
+        self._wait()
+        rejected = inputs["question"] in self.rewrites
+        return GradeDocuments(binary_score="no" if rejected else "yes")
+
+    def rewrite(self, inputs: dict) -> str:
+        self._wait()
+        return self.rewrites.get(inputs["question"], inputs["question"])
+
+    def multi_rewrite(self, inputs: dict) -> RewrittenQueries:
+        self._wait()
+        question = inputs["question"]
+        if question not in self.rewrites:
+            # Bez znanego przepisania - warianty, które nadal nic nie znajdują
+            return RewrittenQueries(queries=[f"{question} v{i}" for i in range(3)])
+        rewrite = self.rewrites[question]
+        return RewrittenQueries(
+            queries=[rewrite, f"{rewrite} crime thriller", f"{rewrite} robbery drama"]
+        )
+
+    def generate(self, prompt_value) -> AIMessage:
+        self._wait()
+        return AIMessage(content=FAKE_ANSWER)
+
+    def web_search(self, question: str) -> str:
+        self._wait()
+        return FAKE_WEB_RESULTS
+
+
+def install_fakes(client: QdrantClient, llms: FakeLLMs):
+    config.override("client", client)
+    # Lokalny Qdrant nie ma klienta async - metody async backendu idą w wątku
+    config.override("async_client", None)
+    config.reset("search_backend")
+    config.override("dense_model", FakeDenseEncoder())
+    config.override("sparse_model", FakeSparseEncoder())
+    config.override("reranker", FakeReranker())
+    config.override("route_and_analyze_chain", RunnableLambda(llms.route_and_analyze))
+    config.override("route_chain", RunnableLambda(llms.route))
+    config.override("query_analyzer", RunnableLambda(llms.analyze))
+    config.override("grader_chain", RunnableLambda(llms.grade))
+    config.override("rewriter_chain", RunnableLambda(llms.rewrite))
+    config.override("multi_rewriter_chain", RunnableLambda(llms.multi_rewrite))
+    config.override("llm_generator", RunnableLambda(llms.generate))
+    config.override("web_search_tool", RunnableLambda(llms.web_search))
+
+
+def install_model_server():
+    """Atrapy modeli za serwerem modeli w wątku tła - mierzy narzut gniazda i buforów."""
+    from model_server import (
+        ModelServer,
+        ModelServerClient,
+        RemoteDenseEncoder,
+        RemoteReranker,
+        RemoteSparseEncoder,
+    )
+
+    socket_path = os.path.join(tempfile.mkdtemp(prefix="model_server_"), "models.sock")
+    server = ModelServer(
+        socket_path, config.dense_model, config.sparse_model, config.reranker
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    model_client = ModelServerClient(socket_path)
+    config.override("dense_model", RemoteDenseEncoder(model_client))
+    config.override("sparse_model", RemoteSparseEncoder(model_client))
+    config.override("reranker", RemoteReranker(model_client))
+
+
+def reset_query_caches():
+    config.override(
+        "query_embedding_cache",
+        QueryEmbeddingCache(model_id="benchmark", maxsize=config.EMBEDDING_CACHE_SIZE),
+    )
+    config.override(
+        "rerank_score_cache",
+        RerankScoreCache(model_id="benchmark", maxsize=config.RERANK_CACHE_SIZE),
+    )
+
+
+def check_relaxed_scenario(client: QdrantClient):
+    """Ostrzega, jeśli filtry scenariusza 'relaxed_filters' zwracają dość wyników bez luzowania."""
+    for scenario in SCENARIOS:
+        if scenario.path != "relaxed_filters":
+            continue
+        strict = client.count(
+            config.COLLECTION_NAME, count_filter=build_qdrant_filter(scenario.intent)
+        ).count
+        if strict >= 3:
+            print(
+                f"⚠️  Scenariusz 'relaxed_filters' ma {strict} ścisłych wyników - "
+                "filtry nie zostaną poluzowane."
+            )
+
+
+# ===== POMIAR =====
+
+
+def _run_inputs(question: str, thread_id: Optional[str]) -> tuple:
+    inputs = {
+        "question": question,
+        "synthesized_query": question,
+        "retry_count": 0,
+        "context": "",
+        "is_relevant": "no",
+        "chat_history": [HumanMessage(content=question)],
+    }
+    return inputs, {"configurable": {"thread_id": thread_id or str(uuid.uuid4())}}
+
+
+def run_once(app, question: str, thread_id: Optional[str] = None) -> List[tuple]:
+    """Zwraca listę (węzeł, czas w ms) w kolejności wykonania oraz czas całkowity."""
+    inputs, run_config = _run_inputs(question, thread_id)
+
+    timings = []
+    start = last = time.perf_counter()
+    for event in app.stream(inputs, config=run_config):
+        now = time.perf_counter()
+        for node in event:
+            timings.append((node, (now - last) * 1000.0))
+        last = now
+    return timings, (last - start) * 1000.0
+
+
+async def arun_once(app, question: str, thread_id: Optional[str] = None) -> List[tuple]:
+    """Jak `run_once`, przez `app.astream` (węzły async)."""
+    inputs, run_config = _run_inputs(question, thread_id)
+
+    timings = []
+    start = last = time.perf_counter()
+    async for event in app.astream(inputs, config=run_config):
+        now = time.perf_counter()
+        for node in event:
+            timings.append((node, (now - last) * 1000.0))
+        last = now
+    return timings, (last - start) * 1000.0
+
+
+def run_once_async(app, question: str, thread_id: Optional[str] = None):
+    return asyncio.run(arun_once(app, question, thread_id))
+
+
+def summarize(samples: List[float]) -> dict:
+    values = np.asarray(samples)
+    return {
+        "n": len(samples),
+        "mean": float(values.mean()),
+        "p50": float(np.percentile(values, 50)),
+        "p95": float(np.percentile(values, 95)),
+        "p99": float(np.percentile(values, 99)),
+    }
+
+
+def print_table(title: str, summaries: Dict[str, dict]):
+    print(f"\n=== {title} ===")
+    print(f"{'':<18}{'n':>6}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}   [ms]")
+    for name, s in summaries.items():
+        print(
+            f"{name:<18}{s['n']:>6}{s['mean']:>10.2f}{s['p50']:>10.2f}"
+            f"{s['p95']:>10.2f}{s['p99']:>10.2f}"
+        )
+
+
+def run_benchmark(
+    iterations: int, warmup: int, scenarios: List[Scenario], run=run_once
+) -> dict:
+    node_samples = defaultdict(list)
+    path_samples = defaultdict(list)
+    mismatches = defaultdict(int)
+
+    for i in range(warmup + iterations):
+        if i == warmup:
+            # Etapy z telemetry.py liczymy tylko dla mierzonych uruchomień
+            telemetry.metrics.reset()
+        for scenario in scenarios:
+            reset_query_caches()
+            thread_id = str(uuid.uuid4())
+            if scenario.previous is not None:
+                # Poprzednia tura (niemierzona) zostawia w wątku historię i pulę kandydatów
+                run(app, scenario.previous.question, thread_id)
+            timings, total = run(app, scenario.question, thread_id)
+            if i < warmup:
+                continue
+
+            nodes = [node for node, _ in timings]
+            if nodes != scenario.expected_nodes:
+                mismatches[scenario.path] += 1
+                continue
+            path_samples[scenario.path].append(total)
+            for node, ms in timings:
+                node_samples[node].append(ms)
+
+    return {
+        "nodes": {name: summarize(v) for name, v in sorted(node_samples.items())},
+        "paths": {
+            s.path: summarize(path_samples[s.path])
+            for s in scenarios
+            if path_samples[s.path]
+        },
+        "stages": {
+            name[: -len(".ms")]: summary
+            for name, summary in telemetry.metrics.snapshot()["histograms"].items()
+            if name.endswith(".ms") and not name.startswith("node.")
+        },
+        "counters": telemetry.metrics.snapshot()["counters"],
+        "mismatches": dict(mismatches),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark grafu agenta.")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument(
+        "--csv", default=None, help="CSV TMDB; bez niego dane są syntetyczne"
+    )
+    parser.add_argument("--sample", type=int, default=500, help="Liczba wierszy")
+    parser.add_argument(
+        "--qdrant-path",
+        default=":memory:",
+        help="Katalog lokalnego Qdranta (domyślnie w pamięci)",
+    )
+    parser.add_argument(
+        "--llm-latency-ms",
+        type=float,
+        default=0.0,
+        help="Sztuczne opóźnienie każdego wywołania LLM",
+    )
+    parser.add_argument(
+        "--fast-path",
+        action="store_true",
+        help="Włącza lokalny router i reguły (ścieżki mogą wtedy różnić się od scenariuszy)",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=["qdrant", "numpy"],
+        default="qdrant",
+        help="Backend wyszukiwania: lokalny Qdrant albo indeks NumPy wyeksportowany z kolekcji",
+    )
+    parser.add_argument(
+        "--model-server",
+        action="store_true",
+        help="Modele przez serwer modeli (gniazdo Unix + pamięć współdzielona) w tle",
+    )
+    parser.add_argument(
+        "--async",
+        dest="use_async",
+        action="store_true",
+        help="Graf przez `app.astream` (węzły async, modele w puli wątków)",
+    )
+    parser.add_argument("--path", action="append", help="Tylko wybrane ścieżki")
+    parser.add_argument(
+        "--verbose", action="store_true", help="Pokazuj logi węzłów podczas pomiaru"
+    )
+    parser.add_argument("--json", default=None, help="Zapisz wyniki do pliku JSON")
+    args = parser.parse_args()
+
+    # Benchmark mierzy kod, a nie trafienia cache'a odpowiedzi
+    config.ANSWER_CACHE_SIZE = 0
+    config.FAST_PATH = args.fast_path
+
+    if args.csv:
+        df = pd.read_csv(args.csv, nrows=args.sample)
+    else:
+        df = synthetic_rows(args.sample)
+
+    if args.qdrant_path == ":memory:":
+        client = QdrantClient(location=":memory:")
+    else:
+        client = QdrantClient(path=args.qdrant_path)
+    scenarios = [s for s in SCENARIOS if not args.path or s.path in args.path]
+    install_fakes(client, FakeLLMs(scenarios, args.llm_latency_ms))
+    if args.model_server:
+        install_model_server()
+
+    n_points = build_fixture_collection(
+        client, df, config.dense_model, config.sparse_model
+    )
+    print(f"📦 Kolekcja testowa: {n_points} filmów")
+    check_relaxed_scenario(client)
+
+    if args.backend == "numpy":
+        from numpy_index import NumpyBackend, export_collection
+
+        index_dir = tempfile.mkdtemp(prefix="numpy_index_")
+        export_collection(client, index_dir)
+        config.override("search_backend", NumpyBackend(index_dir))
+    # Indeks tytułów kolekcji testowej tylko w pamięci (bez pliku TITLE_INDEX_PATH)
+    config.override("title_index", build_title_index(config.search_backend))
+
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+    results = run_benchmark(
+        args.iterations,
+        args.warmup,
+        scenarios,
+        run=run_once_async if args.use_async else run_once,
+    )
+
+    print_table("Węzły", results["nodes"])
+    print_table("Ścieżki", results["paths"])
+    print_table("Etapy", results["stages"])
+    for path, count in results["mismatches"].items():
+        print(f"⚠️  {path}: {count} uruchomień poszło inną ścieżką (pominięte)")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,332 @@
+"""
+Pamięci podręczne używane na ścieżce zapytania.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+
+def normalize_query(text: str) -> str:
+    """Normalizacja Unicode i białych znaków, żeby drobne różnice w zapisie trafiały w ten sam klucz."""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+class LRUCache:
+    """Ograniczony, bezpieczny wątkowo cache LRU z licznikami trafień."""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, value: Any):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+# Wektor gęsty oraz wektor rzadki (indeksy, wartości)
+QueryEmbedding = Tuple[List[float], List[int], List[float]]
+
+
+class QueryEmbeddingCache:
+    """
+    Dwupoziomowy cache embeddingów zapytań (dense + sparse).
+
+    Poziom 1 to LRU w pamięci procesu, poziom 2 (opcjonalny) to plik SQLite,
+    który może być współdzielony przez wiele workerów na tej samej maszynie.
+    Klucz to hash znormalizowanego tekstu oraz identyfikatorów modeli.
+    """
+
+    def __init__(
+        self,
+        model_id: str,
+        maxsize: int = 1024,
+        path: Optional[str] = None,
+    ):
+        self.model_id = model_id
+        self.memory = LRUCache(maxsize)
+        self.path = path
+        self.disk_hits = 0
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        if path:
+            self._open_db(path)
+
+    def _open_db(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=5.0)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS query_embeddings ("
+            " key TEXT PRIMARY KEY,"
+            " dense BLOB NOT NULL,"
+            " sparse_indices BLOB NOT NULL,"
+            " sparse_values BLOB NOT NULL)"
+        )
+        self._db.commit()
+
+    def key(self, text: str) -> str:
+        raw = f"{self.model_id}\x00{normalize_query(text)}".encode("utf-8")
+        return hashlib.sha1(raw).hexdigest()
+
+    def get(self, text: str) -> Optional[QueryEmbedding]:
+        key = self.key(text)
+        value = self.memory.get(key)
+        if value is not None or self._db is None:
+            return value
+
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT dense, sparse_indices, sparse_values FROM query_embeddings WHERE key = ?",
+                (key,),
+            ).fetchone()
+        if row is None:
+            return None
+
+        value = (
+            np.frombuffer(row[0], dtype=np.float32).tolist(),
+            np.frombuffer(row[1], dtype=np.int64).tolist(),
+            np.frombuffer(row[2], dtype=np.float32).tolist(),
+        )
+        self.disk_hits += 1
+        self.memory.put(key, value)
+        return value
+
+    def put(self, text: str, value: QueryEmbedding):
+        key = self.key(text)
+        self.memory.put(key, value)
+        if self._db is None:
+            return
+
+        dense, indices, values = value
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO query_embeddings VALUES (?, ?, ?, ?)",
+                (
+                    key,
+                    np.asarray(dense, dtype=np.float32).tobytes(),
+                    np.asarray(indices, dtype=np.int64).tobytes(),
+                    np.asarray(values, dtype=np.float32).tobytes(),
+                ),
+            )
+            self._db.commit()
+
+    def stats(self) -> Dict[str, float]:
+        stats = self.memory.stats()
+        # Chybienie w pamięci, które trafiło na dysku, nie jest chybieniem całego cache'a
+        stats["disk_hits"] = self.disk_hits
+        stats["misses"] = self.memory.misses - self.disk_hits
+        total = stats["hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (
+            (stats["hits"] + stats["disk_hits"]) / total if total else 0.0
+        )
+        return stats
+
+
+class RerankScoreCache:
+    """
+    Wyniki cross-encodera dla par (zapytanie, film). Pętla rewrite i luzowanie filtrów
+    często zwracają te same filmy dla tego samego zapytania - wtedy nie liczymy ich ponownie.
+    """
+
+    def __init__(self, model_id: str, maxsize: int = 8192):
+        self.model_id = model_id
+        self.memory = LRUCache(maxsize)
+
+    def query_key(self, query: str) -> str:
+        raw = f"{self.model_id}\x00{normalize_query(query)}".encode("utf-8")
+        return hashlib.sha1(raw).hexdigest()
+
+    def get(self, query_key: str, point_id: Hashable) -> Optional[float]:
+        return self.memory.get((query_key, point_id))
+
+    def put(self, query_key: str, point_id: Hashable, score: float):
+        self.memory.put((query_key, point_id), score)
+
+    def stats(self) -> Dict[str, float]:
+        return self.memory.stats()
+
+
+def touch_index_epoch(path: str):
+    """Zapisuje znacznik czasu przebudowy indeksu - cache odpowiedzi unieważnia się po jego zmianie."""
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(str(time.time()))
+
+
+class AnswerCache:
+    """
+    Semantyczny cache odpowiedzi. Wpis pasuje, gdy kanoniczne filtry intencji są identyczne,
+    a embedding zsyntezowanego zapytania jest wystarczająco podobny (kosinus >= `similarity`).
+
+    Wpisy wygasają po `ttl_seconds`, najstarsze są usuwane po przekroczeniu `maxsize`,
+    a zmiana pliku `epoch_path` (zapisywanego przez indeksowanie) czyści cały cache.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 512,
+        ttl_seconds: float = 3600.0,
+        similarity: float = 0.95,
+        epoch_path: Optional[str] = None,
+        epoch_check_interval: float = 5.0,
+    ):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self.similarity = similarity
+        self.epoch_path = epoch_path
+        self.epoch_check_interval = epoch_check_interval
+
+        # id wpisu -> (klucz filtrów, embedding, kontekst, odpowiedź, czas utworzenia)
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self._by_filters: Dict[str, set] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._epoch = self._read_epoch()
+        self._epoch_checked_at = time.monotonic()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def lookup(
+        self, filter_key: str, embedding: List[float]
+    ) -> Optional[Tuple[str, str]]:
+        self._check_epoch()
+        query = _unit(embedding)
+        now = time.time()
+        with self._lock:
+            best_id, best_similarity = None, self.similarity
+            for entry_id in list(self._by_filters.get(filter_key, ())):
+                _, vector, _, _, created_at = self._entries[entry_id]
+                if now - created_at > self.ttl_seconds:
+                    self._remove(entry_id)
+                    continue
+                similarity = float(vector @ query)
+                if similarity >= best_similarity:
+                    best_id, best_similarity = entry_id, similarity
+
+            if best_id is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._entries.move_to_end(best_id)
+            _, _, context, generation, _ = self._entries[best_id]
+            return context, generation
+
+    def put(
+        self, filter_key: str, embedding: List[float], context: str, generation: str
+    ):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (
+                filter_key,
+                _unit(embedding),
+                context,
+                generation,
+                time.time(),
+            )
+            self._by_filters.setdefault(filter_key, set()).add(entry_id)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_filters.clear()
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def _remove(self, entry_id: int):
+        filter_key = self._entries.pop(entry_id)[0]
+        ids = self._by_filters.get(filter_key)
+        if ids is not None:
+            ids.discard(entry_id)
+            if not ids:
+                del self._by_filters[filter_key]
+
+    def _read_epoch(self) -> Optional[float]:
+        if not self.epoch_path:
+            return None
+        try:
+            return os.stat(self.epoch_path).st_mtime
+        except FileNotFoundError:
+            return None
+
+    def _check_epoch(self):
+        if not self.epoch_path:
+            return
+        now = time.monotonic()
+        if now - self._epoch_checked_at < self.epoch_check_interval:
+            return
+        self._epoch_checked_at = now
+        epoch = self._read_epoch()
+        if epoch != self._epoch:
+            self._epoch = epoch
+            self.invalidate()
+
+
+def _unit(vector: List[float]) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / max(float(np.linalg.norm(vector)), 1e-12)
@@ -0,0 +1,122 @@
+"""
+Pula kandydatów sesji: ostatnio wyszukane i ocenione filmy trzymane w stanie grafu.
+
+Dopytania, które tylko zawężają filtry ("coś nowszego", "krótsze", "a z lat 90?"), nie
+potrzebują nowego wyszukiwania - wystarczy przefiltrować pulę na jej payloadach i ponownie
+ją uszeregować. Prośba o więcej wyników to kolejna strona tego samego rankingu. Pula zawiera
+komplet kandydatów dla swoich filtrów (top-N wyszukiwania), więc każde zawężenie tych filtrów
+daje poprawny podzbiór. Filtry luźniejsze albo inny temat oznaczają nowe wyszukiwanie.
+"""
+
+import re
+from typing import List
+
+from qdrant_client import models
+
+from cache import normalize_query
+from models import MovieSearchIntent
+
+# "pokaż więcej", "jakieś inne?", "następne", "coś jeszcze"
+MORE_PATTERN = re.compile(
+    r"\b(więcej|wiecej|inn[eya]\w*|kolejn\w*|następn\w*|nastepn\w*|jeszcze)\b",
+    re.IGNORECASE,
+)
+
+_LIST_FIELDS = ["genres", "production_companies", "production_countries"]
+
+
+def wants_more(question: str) -> bool:
+    return MORE_PATTERN.search(question) is not None
+
+
+def build_pool(
+    intent: MovieSearchIntent,
+    hits: List[models.ScoredPoint],
+    shown_ids: List[int],
+) -> dict:
+    """Pula w postaci zapisywalnej przez checkpointer (same typy proste)."""
+    return {
+        "intent": intent.model_dump(),
+        "topic": normalize_query(intent.query_english or ""),
+        "candidates": [
+            {"id": hit.id, "score": hit.score, "payload": hit.payload} for hit in hits
+        ],
+        "shown": list(shown_ids),
+    }
+
+
+def pool_hits(pool: dict) -> List[models.ScoredPoint]:
+    return [
+        models.ScoredPoint(
+            id=candidate["id"],
+            version=0,
+            score=candidate["score"],
+            payload=candidate["payload"],
+        )
+        for candidate in pool["candidates"]
+    ]
+
+
+def is_narrower(intent: MovieSearchIntent, base: MovieSearchIntent) -> bool:
+    """Czy każdy film spełniający filtry `intent` spełnia też filtry `base`."""
+    if intent.specific_title != base.specific_title:
+        return False
+
+    lower_bounds = ["year_min", "min_score", "min_vote_count"]
+    upper_bounds = ["year_max", "max_runtime"]
+    for field in lower_bounds + upper_bounds:
+        # Jak w build_qdrant_filter: 0 / None oznacza brak warunku
+        base_value = getattr(base, field)
+        if not base_value:
+            continue
+        value = getattr(intent, field)
+        if not value:
+            return False
+        if field in lower_bounds and value < base_value:
+            return False
+        if field in upper_bounds and value > base_value:
+            return False
+
+    for field in _LIST_FIELDS:
+        # Lista w filtrze to alternatywa - węższa lista to niepusty podzbiór
+        base_values, values = getattr(base, field), getattr(intent, field)
+        if base_values and not (values and set(values) <= set(base_values)):
+            return False
+
+    if base.original_language and intent.original_language != base.original_language:
+        return False
+    if base.include_adult is False and intent.include_adult is not False:
+        return False
+    return True
+
+
+def matches_intent(payload: dict, intent: MovieSearchIntent) -> bool:
+    """Te same warunki co `utils.build_qdrant_filter`, liczone na payloadzie kandydata."""
+
+    def at_least(key, bound):
+        return bound is None or (payload.get(key) is not None and payload[key] >= bound)
+
+    def at_most(key, bound):
+        return bound is None or (payload.get(key) is not None and payload[key] <= bound)
+
+    if not (
+        at_least("year", intent.year_min or None)
+        and at_most("year", intent.year_max or None)
+        and at_least("vote_average", intent.min_score or None)
+        and at_most("runtime", intent.max_runtime or None)
+        and at_least("vote_count", intent.min_vote_count or None)
+    ):
+        return False
+
+    for field in _LIST_FIELDS:
+        wanted = getattr(intent, field)
+        if wanted and not set(wanted) & set(payload.get(field) or []):
+            return False
+
+    if intent.original_language and (
+        payload.get("original_language") != intent.original_language
+    ):
+        return False
+    if intent.include_adult is False and payload.get("adult") is not False:
+        return False
+    return True
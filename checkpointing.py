@@ -0,0 +1,265 @@
+"""
+Checkpointery grafu z ograniczonym zużyciem pamięci.
+
+Zwykły `MemorySaver` trzyma każdy checkpoint każdej rozmowy (`thread_id`) do końca życia
+procesu, a restart kasuje wszystkie sesje. Tutaj:
+  - rozmowy nieaktywne dłużej niż `ttl_seconds` oraz najdawniej używane ponad `max_threads`
+    są usuwane (`delete_thread`),
+  - z każdej rozmowy zostaje tylko `keep_checkpoints` ostatnich checkpointów - graf wznawia
+    pracę z najnowszego, a starsze kopie stanu (z pełną historią) tylko zajmują miejsce,
+  - `CHECKPOINTER=sqlite` zapisuje rozmowy w pliku (pakiet `langgraph-checkpoint-sqlite`),
+    więc przeżywają restart procesu.
+"""
+
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from langgraph.checkpoint.memory import MemorySaver
+
+from telemetry import incr
+
+logger = logging.getLogger(__name__)
+
+
+class BoundedMemorySaver(MemorySaver):
+    """`MemorySaver` z eksmisją nieaktywnych rozmów (TTL + LRU) i przycinaniem starych checkpointów."""
+
+    def __init__(
+        self, max_threads: int = 1000, ttl_seconds: float = 0, keep_checkpoints: int = 2
+    ):
+        super().__init__()
+        self.max_threads = max_threads
+        self.ttl_seconds = ttl_seconds
+        self.keep_checkpoints = max(1, keep_checkpoints)
+        # Graf zapisuje checkpointy z wątków roboczych - słowniki MemorySaver nie są bezpieczne
+        self._lock = threading.RLock()
+        self._last_seen: "OrderedDict[str, float]" = OrderedDict()
+
+    def get_tuple(self, config):
+        with self._lock:
+            thread_id = config["configurable"]["thread_id"]
+            if thread_id in self._last_seen:
+                self._touch(thread_id)
+            return super().get_tuple(config)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        with self._lock:
+            saved = super().put(config, checkpoint, metadata, new_versions)
+            thread_id = saved["configurable"]["thread_id"]
+            self._prune(thread_id, saved["configurable"]["checkpoint_ns"])
+            self._touch(thread_id)
+            self._evict(keep=thread_id)
+            return saved
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        with self._lock:
+            super().put_writes(config, writes, task_id, task_path)
+
+    def delete_thread(self, thread_id):
+        with self._lock:
+            super().delete_thread(thread_id)
+            self._last_seen.pop(thread_id, None)
+
+    def _touch(self, thread_id: str):
+        self._last_seen[thread_id] = time.monotonic()
+        self._last_seen.move_to_end(thread_id)
+
+    def _evict(self, keep: str):
+        expired = []
+        if self.ttl_seconds > 0:
+            deadline = time.monotonic() - self.ttl_seconds
+            for thread_id, last_seen in self._last_seen.items():
+                if last_seen >= deadline:
+                    break
+                expired.append(thread_id)
+        overflow = len(self._last_seen) - len(expired) - self.max_threads
+        if self.max_threads > 0 and overflow > 0:
+            # Po wygasłych (najstarszych) kolejne w kolejności LRU
+            remaining = list(self._last_seen)[len(expired) :]
+            expired.extend(remaining[:overflow])
+
+        for thread_id in expired:
+            if thread_id != keep:
+                self.delete_thread(thread_id)
+                incr("checkpoint.evicted")
+
+    def _prune(self, thread_id: str, checkpoint_ns: str):
+        checkpoints = self.storage[thread_id][checkpoint_ns]
+        if len(checkpoints) <= self.keep_checkpoints:
+            return
+
+        # Identyfikatory checkpointów (uuid6) rosną w czasie
+        ordered = sorted(checkpoints)
+        stale, kept = (
+            ordered[: -self.keep_checkpoints],
+            ordered[-self.keep_checkpoints :],
+        )
+        for checkpoint_id in stale:
+            del checkpoints[checkpoint_id]
+        stale = set(stale)
+        for key in [k for k in self.writes if k[:2] == (thread_id, checkpoint_ns)]:
+            if key[2] in stale:
+                del self.writes[key]
+
+        # Wersje kanałów też rosną: blob starszy niż najstarsza wersja używana przez
+        # zachowane checkpointy nie jest już potrzebny
+        oldest_used = {}
+        for checkpoint_id in kept:
+            saved = self.serde.loads_typed(checkpoints[checkpoint_id][0])
+            for channel, version in saved["channel_versions"].items():
+                if channel not in oldest_used or version < oldest_used[channel]:
+                    oldest_used[channel] = version
+        for key in list(self.blobs):
+            if key[:2] != (thread_id, checkpoint_ns):
+                continue
+            channel, version = key[2], key[3]
+            if channel not in oldest_used or version < oldest_used[channel]:
+                del self.blobs[key]
+        incr("checkpoint.pruned", len(stale))
+
+
+def _sqlite_saver_class():
+    try:
+        from langgraph.checkpoint.sqlite import SqliteSaver
+    except ImportError as exc:
+        raise ImportError(
+            "CHECKPOINTER=sqlite wymaga pakietu langgraph-checkpoint-sqlite "
+            "(pip install langgraph-checkpoint-sqlite)."
+        ) from exc
+
+    class BoundedSqliteSaver(SqliteSaver):
+        """`SqliteSaver` z tą samą polityką: TTL, limit rozmów i ostatnie checkpointy."""
+
+        def __init__(
+            self,
+            conn: sqlite3.Connection,
+            max_threads: int = 1000,
+            ttl_seconds: float = 0,
+            keep_checkpoints: int = 2,
+        ):
+            super().__init__(conn)
+            self.max_threads = max_threads
+            self.ttl_seconds = ttl_seconds
+            self.keep_checkpoints = max(1, keep_checkpoints)
+
+        def setup(self):
+            if self.is_setup:
+                return
+            super().setup()
+            # Czas ostatniej aktywności w sekundach epoki - liczy się także po restarcie
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS thread_activity (
+                    thread_id TEXT PRIMARY KEY,
+                    last_seen REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS thread_activity_last_seen
+                    ON thread_activity (last_seen);
+                """)
+
+        def put(self, config, checkpoint, metadata, new_versions):
+            saved = super().put(config, checkpoint, metadata, new_versions)
+            thread_id = saved["configurable"]["thread_id"]
+            checkpoint_ns = saved["configurable"]["checkpoint_ns"]
+            with self.cursor() as cur:
+                cur.execute(
+                    "INSERT INTO thread_activity (thread_id, last_seen) VALUES (?, ?) "
+                    "ON CONFLICT(thread_id) DO UPDATE SET last_seen = excluded.last_seen",
+                    (str(thread_id), time.time()),
+                )
+                # Stan jest zapisany w całości w każdym wierszu - wystarczy usunąć stare wiersze
+                kept = (
+                    "SELECT checkpoint_id FROM checkpoints "
+                    "WHERE thread_id = ? AND checkpoint_ns = ? "
+                    "ORDER BY checkpoint_id DESC LIMIT ?"
+                )
+                for table in ("checkpoints", "writes"):
+                    cur.execute(
+                        f"DELETE FROM {table} WHERE thread_id = ? AND checkpoint_ns = ? "
+                        f"AND checkpoint_id NOT IN ({kept})",
+                        (str(thread_id), checkpoint_ns) * 2 + (self.keep_checkpoints,),
+                    )
+                expired = self._expired_threads(cur, str(thread_id))
+
+            for expired_id in expired:
+                self.delete_thread(expired_id)
+                incr("checkpoint.evicted")
+            return saved
+
+        def delete_thread(self, thread_id):
+            super().delete_thread(thread_id)
+            with self.cursor() as cur:
+                cur.execute(
+                    "DELETE FROM thread_activity WHERE thread_id = ?", (str(thread_id),)
+                )
+
+        # SqliteSaver nie ma metod async (jest do tego AsyncSqliteSaver z aiosqlite) - przy
+        # `app.ainvoke` / `astream` te same zapytania idą w wątku, na tym samym połączeniu
+
+        async def aget_tuple(self, config):
+            return await asyncio.to_thread(self.get_tuple, config)
+
+        async def alist(self, config, *, filter=None, before=None, limit=None):
+            checkpoints = await asyncio.to_thread(
+                lambda: list(
+                    self.list(config, filter=filter, before=before, limit=limit)
+                )
+            )
+            for checkpoint in checkpoints:
+                yield checkpoint
+
+        async def aput(self, config, checkpoint, metadata, new_versions):
+            return await asyncio.to_thread(
+                self.put, config, checkpoint, metadata, new_versions
+            )
+
+        async def aput_writes(self, config, writes, task_id, task_path=""):
+            return await asyncio.to_thread(
+                self.put_writes, config, writes, task_id, task_path
+            )
+
+        async def adelete_thread(self, thread_id):
+            return await asyncio.to_thread(self.delete_thread, thread_id)
+
+        def _expired_threads(self, cur, keep: str) -> list:
+            expired = []
+            if self.ttl_seconds > 0:
+                cur.execute(
+                    "SELECT thread_id FROM thread_activity WHERE last_seen < ?",
+                    (time.time() - self.ttl_seconds,),
+                )
+                expired = [row[0] for row in cur.fetchall()]
+            if self.max_threads > 0:
+                cur.execute(
+                    "SELECT thread_id FROM thread_activity "
+                    "ORDER BY last_seen DESC LIMIT -1 OFFSET ?",
+                    (self.max_threads,),
+                )
+                expired.extend(row[0] for row in cur.fetchall())
+            return [t for t in dict.fromkeys(expired) if t != keep]
+
+    return BoundedSqliteSaver
+
+
+def create_checkpointer(
+    kind: str = "memory",
+    path: str = "checkpoints.sqlite",
+    max_threads: int = 1000,
+    ttl_seconds: float = 0,
+    keep_checkpoints: int = 2,
+):
+    policy = {
+        "max_threads": max_threads,
+        "ttl_seconds": ttl_seconds,
+        "keep_checkpoints": keep_checkpoints,
+    }
+    if kind == "sqlite":
+        conn = sqlite3.connect(path, check_same_thread=False)
+        logger.info("💾 Checkpointy rozmów w pliku: %s", path)
+        return _sqlite_saver_class()(conn, **policy)
+    if kind == "memory":
+        return BoundedMemorySaver(**policy)
+    raise ValueError(f"Nieznany checkpointer: {kind}")
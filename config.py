@@ -1,39 +1,522 @@
-from qdrant_client import QdrantClient
-from sentence_transformers import SentenceTransformer, CrossEncoder
-import torch
+"""
+Konfiguracja oraz leniwy rejestr modeli, klienta Qdranta i łańcuchów LLM.
+
+Import tego modułu nie ładuje żadnego modelu. Zasób (np. `config.dense_model`) jest tworzony
+przy pierwszym użyciu, a potem zapamiętywany. `warmup()` pozwala załadować wszystko z góry.
+"""
+
+import os
+import threading
+from typing import Any, Callable, Dict, Iterable, Optional
 
-from fastembed import SparseTextEmbedding
-from langchain_groq import ChatGroq
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 
-from models import GradeDocuments, MovieSearchIntent
+from models import (
+    GradeDocuments,
+    MovieSearchIntent,
+    RewrittenQueries,
+    RouteQuery,
+    RoutedSearchIntent,
+)
+from cache import AnswerCache, QueryEmbeddingCache, RerankScoreCache
 
 from dotenv import load_dotenv
 
 load_dotenv()
 COLLECTION_NAME = "movies_db_final"
-DEVICE = "mps"
-# ===== MODELS =====
+QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
+# "qdrant": serwer Qdrant, "numpy": dokładne wyszukiwanie w procesie (indeks z numpy_index.py)
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "qdrant")
+NUMPY_INDEX_PATH = os.getenv("NUMPY_INDEX_PATH", "numpy_index")
 
-dense_model = SentenceTransformer(
-    "Qwen/Qwen3-Embedding-0.6B", trust_remote_code=True, device=DEVICE
-)
-sparse_model = SparseTextEmbedding(model_name="Qdrant/bm25")
-reranker = CrossEncoder("cross-encoder/ms-marco-MiniLM-L-6-v2", device=DEVICE)
+# Kompaktowe wektory dense (przy indeksowaniu i wyszukiwaniu): DENSE_DIM > 0 dodaje wektor
+# skrócony do tylu wymiarów (Matryoshka), DENSE_QUANTIZATION = none / scalar / binary.
+# Wyszukiwanie idzie po wektorze kompaktowym z nadpróbkowaniem, a ranking poprawia pełny wektor.
+DENSE_DIM = int(os.getenv("DENSE_DIM", "0"))
+DENSE_QUANTIZATION = os.getenv("DENSE_QUANTIZATION", "none")
+QUANTIZATION_OVERSAMPLING = float(os.getenv("QUANTIZATION_OVERSAMPLING", "2.0"))
+DENSE_MODEL_NAME = "Qwen/Qwen3-Embedding-0.6B"
+SPARSE_MODEL_NAME = "Qdrant/bm25"
+RERANKER_MODEL_NAME = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+LLM_MODEL_NAME = "llama-3.3-70b-versatile"
+
+# Inferencja embeddera i rerankera: "torch" (DEVICE) albo "onnx" - ONNX Runtime na CPU
+# (onnx_models.py). ONNX_QUANTIZATION: dynamiczny int8 dla danego zestawu instrukcji
+# (avx2 / avx512 / avx512_vnni / arm64) albo "none" (float32); ONNX_THREADS = 0 - domyślnie ORT
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "torch")
+ONNX_QUANTIZATION = os.getenv("ONNX_QUANTIZATION", "avx2")
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "onnx_models")
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0"))
+
+# Cache embeddingów zapytań: LRU w pamięci + opcjonalny plik SQLite współdzielony przez workery
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "2048"))
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH") or None
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "8192"))
+
+# Semantyczny cache odpowiedzi: te same filtry intencji + podobne zsyntezowane zapytanie
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+# Plik zapisywany przez ingest.py po każdym indeksowaniu; jego zmiana czyści cache odpowiedzi
+INDEX_EPOCH_PATH = os.getenv("INDEX_EPOCH_PATH", ".index_epoch")
+
+# Indeks tytułów: pytania o konkretny film (`specific_title`) trafiają od razu w punkt,
+# bez wyszukiwania i rerankingu. Plik zapisuje ingest.py; starszy niż INDEX_EPOCH_PATH
+# (albo brakujący) jest budowany od nowa z kolekcji przy pierwszym użyciu
+TITLE_INDEX = os.getenv("TITLE_INDEX", "1") == "1"
+TITLE_INDEX_PATH = os.getenv("TITLE_INDEX_PATH", "title_index.json")
+# Minimalne podobieństwo edycyjne (0-1) dla dopasowania przybliżonego tytułu
+TITLE_FUZZY_MIN = float(os.getenv("TITLE_FUZZY_MIN", "0.85"))
 
-client = QdrantClient(url="http://localhost:6333")
+# Pula kandydatów sesji: zawężające dopytania i "pokaż więcej" bez nowego wyszukiwania.
+# Temat nowej intencji musi być podobny do tematu puli co najmniej w CANDIDATE_POOL_SIMILARITY
+CANDIDATE_POOL = os.getenv("CANDIDATE_POOL", "1") == "1"
+CANDIDATE_POOL_SIMILARITY = float(os.getenv("CANDIDATE_POOL_SIMILARITY", "0.9"))
+# Pola payloadu, na których pula sprawdza filtry intencji
+FILTER_PAYLOAD_FIELDS = [
+    "year",
+    "vote_average",
+    "vote_count",
+    "runtime",
+    "genres",
+    "production_companies",
+    "production_countries",
+    "original_language",
+    "adult",
+]
 
-llm_grader = ChatGroq(model="llama-3.3-70b-versatile", temperature=0)
-llm_translator = ChatGroq(model="llama-3.3-70b-versatile", temperature=0, max_tokens=80)
-llm_generator = ChatGroq(
-    model="llama-3.3-70b-versatile", temperature=0, max_tokens=1024
+# Kandydaci z wyszukiwania dostają tylko pola potrzebne rerankerowi (i puli kandydatów);
+# pełny payload pobierany jest później wyłącznie dla końcowego top_k
+CANDIDATE_PAYLOAD_FIELDS = ["title", "rerank_passage"] + (
+    FILTER_PAYLOAD_FIELDS if CANDIDATE_POOL else []
 )
-llm_router = ChatGroq(model="llama-3.3-70b-versatile", temperature=0, max_tokens=80)
+# Pola, z których składany jest tekst dla rerankera w kolekcjach bez `rerank_passage`
+RERANK_SOURCE_FIELDS = ["title", "tagline", "overview", "keywords"]
 
-# ===== GRADER =====
+# Sędzia: "fast" ocenia trafność na podstawie wyników cross-encodera i woła LLM tylko
+# w niejednoznacznych przypadkach, "llm" zawsze pyta model
+GRADER_MODE = os.getenv("GRADER_MODE", "fast")
+# Logity ms-marco-MiniLM: najlepszy wynik >= ACCEPT -> 'yes', <= REJECT -> 'no', pomiędzy -> LLM
+FAST_GRADER_ACCEPT = float(os.getenv("FAST_GRADER_ACCEPT", "3.0"))
+FAST_GRADER_REJECT = float(os.getenv("FAST_GRADER_REJECT", "-4.0"))
+# 'yes' wymaga też, by najlepszy wynik odstawał od mediany o MARGIN (chyba że mediana
+# sama przekracza ACCEPT) - płaski ranking tuż nad progiem ocenia LLM
+FAST_GRADER_MARGIN = float(os.getenv("FAST_GRADER_MARGIN", "1.0"))
+
+# Po odrzuceniu wyników: "fanout" - jedno wywołanie rewritera zwraca REWRITE_FANOUT zapytań,
+# które są kodowane, wyszukiwane i oceniane razem (jedna runda), "sequential" - do 3 rund
+# przepisania jednego zapytania
+REWRITE_MODE = os.getenv("REWRITE_MODE", "fanout")
+REWRITE_FANOUT = int(os.getenv("REWRITE_FANOUT", "3"))
+
+# "combined": router zwraca od razu cel i intencję wyszukiwania (jedno wywołanie LLM),
+# "separate": osobno router i `query_analyzer`
+ROUTING_MODE = os.getenv("ROUTING_MODE", "combined")
+
+# Szybka ścieżka: lokalny router (centroidy przykładów) i reguły dla prostych filtrów;
+# LLM jest wołany tylko przy niskiej pewności
+FAST_PATH = os.getenv("FAST_PATH", "1") == "1"
+ROUTER_MIN_SIMILARITY = float(os.getenv("ROUTER_MIN_SIMILARITY", "0.5"))
+ROUTER_MIN_MARGIN = float(os.getenv("ROUTER_MIN_MARGIN", "0.05"))
+
+# "batched": ścisłe i poluzowane zapytanie idą do Qdranta jednym żądaniem,
+# "sequential": poluzowane zapytanie wysyłane jest dopiero, gdy ścisłe zwróci za mało wyników
+RELAXED_SEARCH_MODE = os.getenv("RELAXED_SEARCH_MODE", "batched")
+
+# Mikro-batching: pojedyncze wywołania embeddera i rerankera z równoległych sesji
+# są zbierane przez MICRO_BATCH_WAIT_MS i wykonywane jednym batchem
+MICRO_BATCHING = os.getenv("MICRO_BATCHING", "1") == "1"
+MICRO_BATCH_MAX_SIZE = int(os.getenv("MICRO_BATCH_MAX_SIZE", "64"))
+MICRO_BATCH_WAIT_MS = float(os.getenv("MICRO_BATCH_WAIT_MS", "5"))
+
+# Wspólny serwer modeli (model_server.py): z ustawionym gniazdem embedder, BM25 i reranker
+# nie są ładowane w tym procesie, tylko wywoływane w serwerze przez gniazdo Unix
+MODEL_SERVER_SOCKET = os.getenv("MODEL_SERVER_SOCKET") or None
+
+# Graf uruchamiany asynchronicznie (`app.ainvoke` / `film_agent.astream_answer`): LLM i Qdrant
+# przez klientów async, a embedder i reranker w puli INFERENCE_THREADS wątków (0 = liczba CPU)
+INFERENCE_THREADS = int(os.getenv("INFERENCE_THREADS", "0"))
+
+# Wspólny harmonogram wywołań Groqa (llm_scheduler.py): limity na model - zapytania i tokeny
+# na minutę (według limitów konta), priorytety i terminy przydziału. Wywołania opcjonalne
+# (sędzia, rewriter, streszczenie) są pomijane, gdy nie zmieszczą się w LLM_OPTIONAL_DEADLINE
+# albo zużyłyby ostatnie LLM_OPTIONAL_RESERVE budżetu tokenów
+LLM_SCHEDULER = os.getenv("LLM_SCHEDULER", "1") == "1"
+LLM_RPM = float(os.getenv("LLM_RPM", "30"))
+LLM_TPM = float(os.getenv("LLM_TPM", "12000"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", "30"))
+LLM_OPTIONAL_DEADLINE = float(os.getenv("LLM_OPTIONAL_DEADLINE", "3"))
+LLM_OPTIONAL_RESERVE = float(os.getenv("LLM_OPTIONAL_RESERVE", "0.2"))
+# Limit czasu jednego żądania HTTP do Groqa (sekundy)
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+
+# Telemetria: czasy etapów i liczniki w pamięci procesu, opcjonalnie spany i metryki OpenTelemetry
+TELEMETRY = os.getenv("TELEMETRY", "1") == "1"
+TELEMETRY_OTEL = os.getenv("TELEMETRY_OTEL", "0") == "1"
+TELEMETRY_WINDOW = int(os.getenv("TELEMETRY_WINDOW", "2048"))
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+
+# Stan rozmów: "memory" (w procesie) albo "sqlite" (plik CHECKPOINT_PATH, przeżywa restart).
+# Nieaktywne rozmowy wygasają po CHECKPOINT_TTL sekundach (0 = bez limitu czasu), a ponad
+# CHECKPOINT_MAX_THREADS usuwane są najdawniej używane
+CHECKPOINTER = os.getenv("CHECKPOINTER", "memory")
+CHECKPOINT_PATH = os.getenv("CHECKPOINT_PATH", "checkpoints.sqlite")
+CHECKPOINT_MAX_THREADS = int(os.getenv("CHECKPOINT_MAX_THREADS", "1000"))
+CHECKPOINT_TTL = float(os.getenv("CHECKPOINT_TTL", "86400"))
+CHECKPOINT_KEEP = int(os.getenv("CHECKPOINT_KEEP", "2"))
+# Historia dłuższa niż HISTORY_MAX_MESSAGES jest skracana do ostatnich wiadomości:
+# "drop" usuwa starsze, "summarize" zastępuje je streszczeniem LLM, "off" wyłącza
+HISTORY_MAX_MESSAGES = int(os.getenv("HISTORY_MAX_MESSAGES", "20"))
+HISTORY_COMPACTION = os.getenv("HISTORY_COMPACTION", "drop")
+
+# ===== REJESTR ZASOBÓW =====
+
+_factories: Dict[str, Callable[[], Any]] = {}
+_resources: Dict[str, Any] = {}
+_registry_lock = threading.RLock()
+_device: Optional[str] = None
+
+
+def resource(name: str):
+    """Dekorator rejestrujący fabrykę zasobu tworzonego przy pierwszym użyciu."""
+
+    def decorator(factory: Callable[[], Any]) -> Callable[[], Any]:
+        _factories[name] = factory
+        return factory
+
+    return decorator
+
+
+def get(name: str) -> Any:
+    if name in _resources:
+        return _resources[name]
+    if name not in _factories:
+        raise KeyError(f"Nieznany zasób: {name}")
+    with _registry_lock:
+        # Drugi wątek mógł utworzyć zasób, gdy czekaliśmy na blokadę
+        if name not in _resources:
+            _resources[name] = _factories[name]()
+        return _resources[name]
+
+
+def override(name: str, value: Any):
+    """Podmienia zasób (np. w benchmarkach lub przy własnym kliencie Qdranta)."""
+    with _registry_lock:
+        _resources[name] = value
+
+
+def reset(name: Optional[str] = None):
+    with _registry_lock:
+        if name is None:
+            _resources.clear()
+        else:
+            _resources.pop(name, None)
+
+
+def is_loaded(name: str) -> bool:
+    return name in _resources
+
+
+def __getattr__(name: str) -> Any:
+    # Zachowuje dotychczasowe API: `config.dense_model`, `config.grader_chain` itd.
+    if name == "DEVICE":
+        return get_device()
+    if name in _factories:
+        return get(name)
+    raise AttributeError(f"module 'config' has no attribute '{name}'")
+
+
+def get_device() -> str:
+    """Zmienna DEVICE ma pierwszeństwo, potem CUDA, MPS, a na końcu CPU."""
+    global _device
+    if _device is None:
+        device = os.getenv("DEVICE")
+        if not device:
+            import torch
+
+            if torch.cuda.is_available():
+                device = "cuda"
+            elif torch.backends.mps.is_available():
+                device = "mps"
+            else:
+                device = "cpu"
+        _device = device
+    return _device
+
+
+def warmup(names: Optional[Iterable[str]] = None):
+    """
+    Ładuje zasoby z góry (domyślnie modele i klienta Qdranta) i wykonuje na nich
+    jedno małe wywołanie, żeby pierwsze zapytanie użytkownika nie płaciło za zimny start.
+    """
+    if names is None:
+        names = ["dense_model", "sparse_model", "reranker", "search_backend"]
+        if TITLE_INDEX:
+            names.append("title_index")
+    for name in names:
+        get(name)
+
+    if is_loaded("dense_model"):
+        get("dense_model").encode("warmup")
+    if is_loaded("sparse_model"):
+        list(get("sparse_model").embed(["warmup"]))
+    if is_loaded("reranker"):
+        get("reranker").predict([["warmup", "warmup"]])
+
+
+# ===== MODELS =====
+
+
+@resource("dense_model")
+def _dense_model():
+    if MODEL_SERVER_SOCKET:
+        from model_server import RemoteDenseEncoder
+
+        return RemoteDenseEncoder(get("model_server_client"))
+    if INFERENCE_BACKEND == "onnx":
+        from onnx_models import load_model
+
+        model = load_model("dense", DENSE_MODEL_NAME)
+    else:
+        from sentence_transformers import SentenceTransformer
+
+        model = SentenceTransformer(
+            DENSE_MODEL_NAME, trust_remote_code=True, device=get_device()
+        )
+    if MICRO_BATCHING:
+        from batching import BatchedDenseEncoder
+
+        return BatchedDenseEncoder(model, **_micro_batch_kwargs())
+    return model
+
+
+@resource("sparse_model")
+def _sparse_model():
+    if MODEL_SERVER_SOCKET:
+        from model_server import RemoteSparseEncoder
+
+        return RemoteSparseEncoder(get("model_server_client"))
+    from fastembed import SparseTextEmbedding
+
+    return SparseTextEmbedding(model_name=SPARSE_MODEL_NAME)
+
+
+@resource("reranker")
+def _reranker():
+    if MODEL_SERVER_SOCKET:
+        from model_server import RemoteReranker
+
+        return RemoteReranker(get("model_server_client"))
+    if INFERENCE_BACKEND == "onnx":
+        from onnx_models import load_model
+
+        model = load_model("reranker", RERANKER_MODEL_NAME)
+    else:
+        from sentence_transformers import CrossEncoder
+
+        model = CrossEncoder(RERANKER_MODEL_NAME, device=get_device())
+    if MICRO_BATCHING:
+        from batching import BatchedReranker
+
+        return BatchedReranker(model, **_micro_batch_kwargs())
+    return model
+
+
+@resource("model_server_client")
+def _model_server_client():
+    from model_server import ModelServerClient
+
+    return ModelServerClient(MODEL_SERVER_SOCKET)
+
+
+def _micro_batch_kwargs() -> dict:
+    return {
+        "max_batch_size": MICRO_BATCH_MAX_SIZE,
+        "max_wait_ms": MICRO_BATCH_WAIT_MS,
+    }
+
+
+@resource("client")
+def _client():
+    from qdrant_client import QdrantClient
+
+    return QdrantClient(url=QDRANT_URL)
+
+
+@resource("async_client")
+def _async_client():
+    from qdrant_client import AsyncQdrantClient
+
+    return AsyncQdrantClient(url=QDRANT_URL)
+
+
+@resource("search_backend")
+def _search_backend():
+    if SEARCH_BACKEND == "numpy":
+        from numpy_index import NumpyBackend
+
+        return NumpyBackend(NUMPY_INDEX_PATH)
+
+    from backends import QdrantBackend
+
+    return QdrantBackend(get("client"), async_client=get("async_client"))
+
+
+@resource("inference_executor")
+def _inference_executor():
+    from concurrent.futures import ThreadPoolExecutor
+
+    return ThreadPoolExecutor(
+        max_workers=INFERENCE_THREADS or os.cpu_count(),
+        thread_name_prefix="inference",
+    )
+
+
+@resource("checkpointer")
+def _checkpointer():
+    from checkpointing import create_checkpointer
 
-structured_llm_grader = llm_grader.with_structured_output(GradeDocuments)
+    return create_checkpointer(
+        CHECKPOINTER,
+        path=CHECKPOINT_PATH,
+        max_threads=CHECKPOINT_MAX_THREADS,
+        ttl_seconds=CHECKPOINT_TTL,
+        keep_checkpoints=CHECKPOINT_KEEP,
+    )
+
+
+@resource("title_index")
+def _title_index():
+    from title_index import TitleIndex, build_title_index
+
+    epoch = (
+        os.path.getmtime(INDEX_EPOCH_PATH) if os.path.exists(INDEX_EPOCH_PATH) else 0
+    )
+    if os.path.exists(TITLE_INDEX_PATH) and os.path.getmtime(TITLE_INDEX_PATH) >= epoch:
+        return TitleIndex.load(TITLE_INDEX_PATH)
+    return build_title_index(get("search_backend"), TITLE_INDEX_PATH)
+
+
+def inference_variant() -> str:
+    """Backend inferencji w kluczach cache'y: wektory int8 z ONNX różnią się od float32 z PyTorcha."""
+    if INFERENCE_BACKEND == "onnx":
+        return f"onnx-{ONNX_QUANTIZATION}"
+    return INFERENCE_BACKEND
+
+
+@resource("query_embedding_cache")
+def _query_embedding_cache():
+    # Plik SQLite jest wspólny dla workerów - klucz obejmuje też backend i kwantyzację
+    return QueryEmbeddingCache(
+        model_id=f"{DENSE_MODEL_NAME}+{SPARSE_MODEL_NAME}@{inference_variant()}",
+        maxsize=EMBEDDING_CACHE_SIZE,
+        path=EMBEDDING_CACHE_PATH,
+    )
+
+
+@resource("answer_cache")
+def _answer_cache():
+    return AnswerCache(
+        maxsize=ANSWER_CACHE_SIZE,
+        ttl_seconds=ANSWER_CACHE_TTL,
+        similarity=ANSWER_CACHE_SIMILARITY,
+        epoch_path=INDEX_EPOCH_PATH,
+    )
+
+
+@resource("local_router")
+def _local_router():
+    from fast_path import CentroidRouter
+
+    return CentroidRouter(
+        get("dense_model"),
+        min_similarity=ROUTER_MIN_SIMILARITY,
+        min_margin=ROUTER_MIN_MARGIN,
+    )
+
+
+@resource("web_search_tool")
+def _web_search_tool():
+    from langchain_community.tools import DuckDuckGoSearchRun
+
+    return DuckDuckGoSearchRun()
+
+
+@resource("rerank_score_cache")
+def _rerank_score_cache():
+    return RerankScoreCache(
+        model_id=f"{RERANKER_MODEL_NAME}@{inference_variant()}",
+        maxsize=RERANK_CACHE_SIZE,
+    )
+
+
+@resource("llm_scheduler")
+def _llm_scheduler():
+    from llm_scheduler import LLMScheduler
+
+    return LLMScheduler(
+        requests_per_minute=LLM_RPM,
+        tokens_per_minute=LLM_TPM,
+        max_concurrency=LLM_MAX_CONCURRENCY,
+        deadline=LLM_DEADLINE,
+        optional_deadline=LLM_OPTIONAL_DEADLINE,
+        optional_reserve=LLM_OPTIONAL_RESERVE,
+    )
+
+
+def _chat_groq(priority: str = "route", **kwargs):
+    """
+    Model czatu dla jednej roli. `priority` (generate / route / optional) decyduje o kolejności
+    w harmonogramie i o tym, czy wywołanie może zostać pominięte przy wyczerpanym budżecie.
+    """
+    from langchain_groq import ChatGroq
+    from telemetry import llm_usage_handler
+
+    chat_class = ChatGroq
+    if LLM_SCHEDULER:
+        from llm_scheduler import scheduled_chat_class
+
+        chat_class = scheduled_chat_class(ChatGroq)
+        # Ponawia harmonogram (429 po retry-after, błędy przejściowe z przerwą), a nie klient
+        kwargs.update(scheduler=get("llm_scheduler"), priority=priority, max_retries=0)
+
+    return chat_class(
+        model=LLM_MODEL_NAME,
+        temperature=0,
+        timeout=LLM_TIMEOUT,
+        callbacks=[llm_usage_handler],
+        **kwargs,
+    )
+
+
+@resource("llm_grader")
+def _llm_grader():
+    return _chat_groq(priority="optional")
+
+
+@resource("llm_translator")
+def _llm_translator():
+    return _chat_groq(priority="optional", max_tokens=80)
+
+
+@resource("llm_generator")
+def _llm_generator():
+    return _chat_groq(priority="generate", max_tokens=1024)
+
+
+@resource("llm_router")
+def _llm_router():
+    return _chat_groq()
+
+
+@resource("llm_rewriter")
+def _llm_rewriter():
+    return _chat_groq(priority="optional")
+
+
+# ===== GRADER =====
 
 system_grader_prompt = """Jesteś pomocnym asystentem, który weryfikuje trafność wyników wyszukiwania.
 
@@ -53,7 +536,10 @@ grade_prompt = ChatPromptTemplate.from_messages(
     ]
 )
 
-grader_chain = grade_prompt | structured_llm_grader
+
+@resource("grader_chain")
+def _grader_chain():
+    return grade_prompt | get("llm_grader").with_structured_output(GradeDocuments)
 
 
 # ===== REWRITER =====
@@ -82,8 +568,34 @@ rewrite_prompt = ChatPromptTemplate.from_messages(
     ]
 )
 
+
 # Tutaj używamy parsera tekstowego, bo chcemy po prostu string
-rewriter_chain = rewrite_prompt | llm_translator | StrOutputParser()
+@resource("rewriter_chain")
+def _rewriter_chain():
+    return rewrite_prompt | get("llm_translator") | StrOutputParser()
+
+
+multi_rewrite_prompt = ChatPromptTemplate.from_messages(
+    [
+        (
+            "system",
+            system_rewriter_prompt.split("4. NIE zwracaj JSON-a")[0]
+            + "4. Zaproponuj {n} RÓŻNE zapytania - każde z innej strony (inne słowa kluczowe, "
+            "motywy, podobne znane filmy), najbardziej prawdopodobne jako pierwsze.\n",
+        ),
+        (
+            "human",
+            "Oryginalne pytanie: {question}\nPoprzednie wyniki były błędne. Podaj {n} lepsze zapytania.",
+        ),
+    ]
+)
+
+
+@resource("multi_rewriter_chain")
+def _multi_rewriter_chain():
+    return multi_rewrite_prompt.partial(n=str(REWRITE_FANOUT)) | get(
+        "llm_rewriter"
+    ).with_structured_output(RewrittenQueries)
 
 
 system_prompt_text = """
@@ -128,7 +640,76 @@ router_prompt = ChatPromptTemplate.from_messages(
     ]
 )
 
-llm_router = ChatGroq(model="llama-3.3-70b-versatile", temperature=0)
+
+@resource("query_analyzer")
+def _query_analyzer():
+    return router_prompt | get("llm_router").with_structured_output(MovieSearchIntent)
+
+
+# ===== ROUTER =====
+
+system_router_prompt = """Jesteś ekspertem kierującym ruchem w asystencie filmowym.
+    - Jeśli użytkownik prosi o rekomendację filmu, szuka fabuły, gatunku LUB pyta o szczegóły konkretnego filmu -> 'vectorstore'.
+    - Jeśli pyta o aktualności, box office, premiery z tego roku, repertuar kin -> 'web_search'.
+    - Jeśli użytkownik pyta o aktorów (nie w kontekście szukania filmu), życie prywatne reżyserów lub luźno rozmawia -> 'general_chat'.
+    """
+
+route_prompt = ChatPromptTemplate.from_messages(
+    [
+        ("system", system_router_prompt),
+        ("human", "{question}"),
+    ]
+)
+
+
+@resource("route_chain")
+def _route_chain():
+    return route_prompt | get("llm_router").with_structured_output(RouteQuery)
+
+
+routed_intent_prompt = ChatPromptTemplate.from_messages(
+    [
+        (
+            "system",
+            system_router_prompt
+            + "\nJeśli wybierzesz 'vectorstore', wypełnij również pole 'search_intent' według poniższych zasad. "
+            "W pozostałych przypadkach zostaw 'search_intent' puste.\n"
+            + system_prompt_text,
+        ),
+        ("placeholder", "{chat_history}"),
+        ("human", "{query}"),
+    ]
+)
+
+
+@resource("route_and_analyze_chain")
+def _route_and_analyze_chain():
+    return routed_intent_prompt | get("llm_router").with_structured_output(
+        RoutedSearchIntent
+    )
+
+
+# ===== KOMPAKCJA HISTORII =====
+
+summarizer_prompt = ChatPromptTemplate.from_messages(
+    [
+        (
+            "system",
+            "Streść poniższą rozmowę użytkownika z asystentem filmowym w kilku zdaniach. "
+            "Zachowaj preferencje użytkownika (gatunki, lata, oceny, długość filmów) "
+            "oraz tytuły, o które pytał lub które mu poleciłeś. Nie dodawaj nowych informacji.",
+        ),
+        ("placeholder", "{chat_history}"),
+        ("human", "Streść powyższą rozmowę."),
+    ]
+)
+
+
+@resource("llm_summarizer")
+def _llm_summarizer():
+    return _chat_groq(priority="optional", max_tokens=256)
 
 
-query_analyzer = router_prompt | llm_router.with_structured_output(MovieSearchIntent)
+@resource("summarizer_chain")
+def _summarizer_chain():
+    return summarizer_prompt | get("llm_summarizer") | StrOutputParser()
@@ -0,0 +1,345 @@
+"""
+Lokalna "szybka ścieżka" przed wywołaniami LLM.
+
+- `CentroidRouter` kieruje pytanie do najbliższego centroidu przykładowych wypowiedzi,
+  używając już załadowanego modelu dense.
+- `parse_filters` wyciąga proste filtry (lata, dekady, gatunki, oceny, czas trwania, kraj)
+  regułami i zwraca intencję tylko wtedy, gdy reguły pokryły całe pytanie.
+
+W obu przypadkach przy niskiej pewności zwracane jest None, a decyzję podejmuje LLM.
+"""
+
+import re
+import threading
+import unicodedata
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from langchain_core.messages import BaseMessage
+
+import config
+from models import MovieSearchIntent
+
+# Ile decyzji zapadło lokalnie, a ile trafiło do LLM
+fast_path_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def count(outcome: str):
+    with _stats_lock:
+        fast_path_stats[outcome] += 1
+
+
+# ===== ROUTER =====
+
+ROUTE_EXAMPLES: Dict[str, List[str]] = {
+    "vectorstore": [
+        "Poleć mi dobry horror z lat 80",
+        "Szukam komedii romantycznej",
+        "Film o podróżach w czasie",
+        "Opowiedz mi o filmie Titanic",
+        "Jakiś polski film wojenny",
+        "Coś w stylu Incepcji",
+        "Film animowany dla dzieci",
+        "Thriller z zaskakującym zakończeniem",
+        "Najlepsze filmy science fiction",
+        "O czym jest Matrix?",
+    ],
+    "web_search": [
+        "Co grają dziś w kinach?",
+        "Jakie są premiery filmowe w tym tygodniu?",
+        "Repertuar kina w Warszawie",
+        "Ile zarobił najnowszy film Marvela w box office?",
+        "Kiedy premiera nowego filmu Nolana?",
+        "Kto wygrał Oscara w tym roku?",
+        "Najnowsze wiadomości ze świata filmu",
+        "Jakie filmy wchodzą do kin w przyszłym miesiącu?",
+    ],
+    "general_chat": [
+        "Cześć, jak się masz?",
+        "Dzięki za pomoc!",
+        "Ile lat ma Brad Pitt?",
+        "Z kim jest żonaty Leonardo DiCaprio?",
+        "Jaki jest twój ulubiony aktor?",
+        "Opowiedz coś o sobie",
+        "Co sądzisz o kinie?",
+        "Gdzie urodził się Steven Spielberg?",
+    ],
+}
+
+
+def _normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class CentroidRouter:
+    """
+    Router najbliższego centroidu. Pewność to podobieństwo kosinusowe do najlepszego
+    centroidu, a margines to jego przewaga nad drugim. Oba muszą przekroczyć progi.
+    """
+
+    def __init__(
+        self,
+        dense_model,
+        examples: Dict[str, List[str]] = ROUTE_EXAMPLES,
+        min_similarity: float = 0.5,
+        min_margin: float = 0.05,
+    ):
+        self.dense_model = dense_model
+        self.labels = list(examples)
+        self.min_similarity = min_similarity
+        self.min_margin = min_margin
+
+        centroids = []
+        for label in self.labels:
+            embeddings = _normalize_rows(self.dense_model.encode(examples[label]))
+            centroids.append(embeddings.mean(axis=0))
+        self.centroids = _normalize_rows(np.stack(centroids))
+
+    def scores(self, question: str) -> Dict[str, float]:
+        query = _normalize_rows(self.dense_model.encode(question))[0]
+        similarities = self.centroids @ query
+        return dict(zip(self.labels, similarities.tolist()))
+
+    def route(self, question: str) -> Tuple[Optional[str], float]:
+        ranked = sorted(self.scores(question).items(), key=lambda x: x[1], reverse=True)
+        (best_label, best), (_, second) = ranked[0], ranked[1]
+        if best >= self.min_similarity and best - second >= self.min_margin:
+            return best_label, best
+        return None, best
+
+
+# ===== PARSER FILTRÓW =====
+
+
+def fold(text: str) -> str:
+    """Małe litery bez polskich znaków, żeby 'krótki' i 'krotki' pasowały do tych samych reguł."""
+    text = text.lower().replace("ł", "l")
+    text = unicodedata.normalize("NFKD", text)
+    return "".join(ch for ch in text if not unicodedata.combining(ch))
+
+
+GENRE_PATTERNS = {
+    "Science Fiction": r"sci-?fi|science fiction|fantastyk\w* naukow\w*|fantastycznonaukow\w*",
+    "Comedy": r"komedi\w*|komediow\w*|smieszn\w*|zabawn\w*",
+    "Horror": r"horror\w*|straszn\w*",
+    "Drama": r"dramat\w*",
+    "Thriller": r"thriller\w*|dreszczowc\w*",
+    "Crime": r"kryminal\w*|gangster\w*",
+    "Fantasy": r"fantasy",
+    "Animation": r"animowan\w*|animacj\w*|bajk\w*|kreskowk\w*",
+    "Family": r"familijn\w*|rodzinn\w*",
+    "Action": r"akcji|sensacyjn\w*",
+    "Adventure": r"przygodow\w*",
+    "War": r"wojenn\w*",
+    "Western": r"western\w*",
+    "Romance": r"romans\w*|romantyczn\w*|milosn\w*",
+    "Documentary": r"dokument\w*",
+    "Music": r"muzyczn\w*|musical\w*",
+    "History": r"historyczn\w*|kostiumow\w*",
+    "Mystery": r"detektywistyczn\w*",
+}
+
+COUNTRY_PATTERNS = {
+    "Poland": r"polsk\w*",
+    "France": r"francusk\w*",
+    "Germany": r"niemieck\w*",
+    "Italy": r"wlosk\w*",
+    "Spain": r"hiszpansk\w*",
+    "United Kingdom": r"brytyjsk\w*|angielsk\w*",
+    "United States of America": r"amerykansk\w*",
+    "Japan": r"japonsk\w*",
+    "South Korea": r"koreansk\w*",
+    "Czech Republic": r"czesk\w*",
+}
+
+# Słowa, które nie niosą informacji o filtrach ani o temacie
+FILLER_WORDS = set("""
+    film filmy filmu filmow filmem filmik kino kina produkcja produkcje produkcji
+    cos jakis jakas jakies polec polecisz polecasz polecic zaproponuj zaproponujesz
+    szukam chce chcialbym chcialabym pokaz daj znajdz wymien mi mnie dla prosze
+    z ze i oraz a w do na lat roku rok r jaki jakie jaka moze masz macie jest sa
+    obejrzec obejrzenia gatunku gatunek kilka pare raczej najlepiej by byl byly bylo
+    ktory ktore ocenie ocena ocenach
+    """.split())
+
+
+def _decade(value: str) -> Tuple[int, int]:
+    number = int(value)
+    if number < 100:
+        number = 1900 + number if number >= 20 else 2000 + number
+    return number, number + 9
+
+
+class _Match:
+    """Zbiera filtry i wycina dopasowane fragmenty z tekstu."""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.filters: dict = {}
+
+    def take(self, pattern: str, handler) -> bool:
+        matched = False
+
+        def _replace(match: re.Match) -> str:
+            nonlocal matched
+            matched = True
+            handler(match)
+            return " "
+
+        self.text = re.sub(rf"(?<!\w)(?:{pattern})(?!\w)", _replace, self.text)
+        return matched
+
+    def set(self, key: str, value):
+        self.filters[key] = value
+
+    def add(self, key: str, value):
+        values = self.filters.setdefault(key, [])
+        if value not in values:
+            values.append(value)
+
+
+def parse_filters(question: str) -> Optional[MovieSearchIntent]:
+    """
+    Reguły dla prostych pytań typu "dobry horror z lat 80" czy "krótka polska komedia po 2010".
+    Zwraca None, jeśli w pytaniu zostało cokolwiek poza rozpoznanymi filtrami i słowami
+    wypełniającymi (np. temat fabuły) - wtedy intencję musi wyciągnąć LLM.
+    """
+    # Przecinek między cyframi to ułamek dziesiętny ("7,5"), a nie interpunkcja
+    m = _Match(re.sub(r"[?!;:()\"']|,(?!\d)|(?<!\d),", " ", fold(question)))
+
+    # --- Daty (od najbardziej szczegółowych) ---
+    def _range(match):
+        m.set("year_min", int(match.group(1)))
+        m.set("year_max", int(match.group(2)))
+
+    def _decade_range(match):
+        year_min, year_max = _decade(match.group(1))
+        m.set("year_min", year_min)
+        m.set("year_max", year_max)
+
+    m.take(r"(?:od\s+)?(\d{4})\s*(?:-|do)\s*(\d{4})", _range)
+    m.take(
+        r"(?:z\s+)?lat(?:a|ach)?\s+(\d{2}|\d{4})(?:\s*-?\s*(?:tych|te|ych|ki))?\.?",
+        _decade_range,
+    )
+    m.take(
+        r"po\s+(?:roku\s+)?(\d{4})(?:\s*r(?:oku)?\.?)?",
+        lambda x: m.set("year_min", int(x.group(1)) + 1),
+    )
+    m.take(
+        r"przed\s+(?:rokiem\s+)?(\d{4})(?:\s*r(?:okiem)?\.?)?",
+        lambda x: m.set("year_max", int(x.group(1)) - 1),
+    )
+    m.take(
+        r"(?:z\s+)?(\d{4})(?:\s*r(?:oku)?\.?)?",
+        lambda x: (
+            m.set("year_min", int(x.group(1))),
+            m.set("year_max", int(x.group(1))),
+        ),
+    )
+    m.take(r"star\w*|klasyczn\w*|klasyk\w*", lambda x: m.set("year_max", 1979))
+
+    # --- Popularność ---
+    m.take(
+        r"blockbuster\w*|wielki\w* hit(?:y|ow|em)?",
+        lambda x: m.set("min_vote_count", 10000),
+    )
+    m.take(
+        r"znan\w*|popularn\w*", lambda x: m.filters.setdefault("min_vote_count", 200)
+    )
+
+    # --- Ocena ---
+    m.take(
+        r"(?:z\s+)?ocen\w*\s*(?:powyzej|ponad|od|minimum|min\.?|co najmniej|>=?)?\s*(\d+(?:[.,]\d)?)\s*\+?",
+        lambda x: m.set("min_score", float(x.group(1).replace(",", "."))),
+    )
+    m.take(
+        r"(\d(?:[.,]\d)?)\s*\+",
+        lambda x: m.set("min_score", float(x.group(1).replace(",", "."))),
+    )
+    m.take(
+        r"bardzo dobr\w*|wybitn\w*|hit(?:y|ow|em)?|najlepsz\w*|arcydziel\w*",
+        lambda x: m.set("min_score", 8.0),
+    )
+    m.take(
+        r"dobrze ocenian\w*|wysoko ocenian\w*|dobr\w*|polecan\w*|swietn\w*",
+        lambda x: m.filters.setdefault("min_score", 7.0),
+    )
+
+    # --- Czas trwania ---
+    m.take(
+        r"(?:do|ponizej|maks\w*|max\w*|nie dluzsz\w* niz)\s*(\d{2,3})\s*min\w*",
+        lambda x: m.set("max_runtime", int(x.group(1))),
+    )
+    m.take(r"bardzo krotk\w*", lambda x: m.set("max_runtime", 85))
+    m.take(r"krotk\w*", lambda x: m.filters.setdefault("max_runtime", 100))
+
+    # --- Gatunki i kraje ---
+    for genre, pattern in GENRE_PATTERNS.items():
+        m.take(pattern, lambda x, genre=genre: m.add("genres", genre))
+    for country, pattern in COUNTRY_PATTERNS.items():
+        m.take(
+            pattern, lambda x, country=country: m.add("production_countries", country)
+        )
+
+    leftover = [word for word in re.split(r"[\s.]+", m.text) if word]
+    if not m.filters or any(word not in FILLER_WORDS for word in leftover):
+        return None
+
+    return _intent_from_filters(m.filters)
+
+
+def _intent_from_filters(filters: dict) -> MovieSearchIntent:
+    genres = filters.get("genres") or []
+    topic = " ".join(genres) + " movies" if genres else "Movies"
+
+    details = []
+    if filters.get("production_countries"):
+        details.append(f"produced in {', '.join(filters['production_countries'])}")
+    year_min, year_max = filters.get("year_min"), filters.get("year_max")
+    if year_min and year_max:
+        details.append(f"released between {year_min} and {year_max}")
+    elif year_min:
+        details.append(f"released after {year_min - 1}")
+    elif year_max:
+        details.append(f"released before {year_max + 1}")
+    if filters.get("min_score"):
+        details.append(f"rated at least {filters['min_score']}")
+    if filters.get("max_runtime"):
+        details.append(f"shorter than {filters['max_runtime']} minutes")
+
+    synthesized_query = " ".join([topic] + details)
+    query_english = " ".join(genre.lower() for genre in genres) or "movies"
+
+    return MovieSearchIntent(
+        synthesized_query=synthesized_query,
+        query_english=query_english,
+        **filters,
+    )
+
+
+def local_intent(
+    question: str, chat_history: List[BaseMessage]
+) -> Optional[MovieSearchIntent]:
+    """
+    Intencja z reguł, ale tylko dla pierwszej tury rozmowy - przy dopytaniach
+    ("coś nowszego") filtry trzeba połączyć z historią, co robi analizator LLM.
+    """
+    intent = parse_filters(question) if len(chat_history) <= 1 else None
+    count("filters_local" if intent is not None else "filters_llm")
+    return intent
+
+
+def fallback_intent(question: str) -> MovieSearchIntent:
+    """
+    Intencja bez LLM, gdy harmonogram nie dał przydziału: filtry z reguł, jeśli pokryły
+    pytanie, inaczej samo pytanie jako zapytanie wyszukiwania (model dense jest wielojęzyczny).
+    """
+    return parse_filters(question) or MovieSearchIntent(
+        synthesized_query=question, query_english=question
+    )
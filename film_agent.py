@@ -1,28 +1,60 @@
 from langgraph.graph import StateGraph, END
-from langgraph.checkpoint.memory import MemorySaver
-from langchain_core.messages import HumanMessage
+from langchain_core.messages import AIMessageChunk, HumanMessage
 
 from nodes import (
     retrieve_node,
+    aretrieve_node,
     grade_documents_node,
+    agrade_documents_node,
     rewrite_query_node,
+    arewrite_query_node,
     generate_node,
+    agenerate_node,
+    compact_history_node,
+    acompact_history_node,
+    decide_after_generate,
     decide_next_step,
+    decide_after_rewrite,
+    decide_after_retrieve,
     web_search_node,
-    route_question,
+    aweb_search_node,
+    route_node,
+    aroute_node,
+    decide_route,
 )
 from models import GraphState
+from telemetry import configure_logging, traced_node
+import config
+
+configure_logging()
 
 workflow = StateGraph(GraphState)
 
-workflow.add_node("retrieve", retrieve_node)
-workflow.add_node("grade_documents", grade_documents_node)
-workflow.add_node("rewrite_query", rewrite_query_node)
-workflow.add_node("generate", generate_node)
-workflow.add_node("web_search", web_search_node)
+# Każdy węzeł mierzony jako span `node.<nazwa>` (patrz telemetry.py). Wersje async węzłów
+# obsługują `app.ainvoke` / `app.astream` (patrz `astream_answer`)
+workflow.add_node("route", traced_node("route", route_node, aroute_node))
+workflow.add_node("retrieve", traced_node("retrieve", retrieve_node, aretrieve_node))
+workflow.add_node(
+    "grade_documents",
+    traced_node("grade_documents", grade_documents_node, agrade_documents_node),
+)
+workflow.add_node(
+    "rewrite_query",
+    traced_node("rewrite_query", rewrite_query_node, arewrite_query_node),
+)
+workflow.add_node("generate", traced_node("generate", generate_node, agenerate_node))
+workflow.add_node(
+    "web_search", traced_node("web_search", web_search_node, aweb_search_node)
+)
+workflow.add_node(
+    "compact_history",
+    traced_node("compact_history", compact_history_node, acompact_history_node),
+)
 
-workflow.set_conditional_entry_point(
-    route_question,
+workflow.set_entry_point("route")
+workflow.add_conditional_edges(
+    "route",
+    decide_route,
     {
         "vectorstore": "retrieve",
         "web_search": "web_search",
@@ -32,18 +64,92 @@ workflow.set_conditional_entry_point(
 
 workflow.add_edge("web_search", "generate")
 
-workflow.add_edge("retrieve", "grade_documents")
+workflow.add_conditional_edges(
+    "retrieve",
+    decide_after_retrieve,
+    {"generate": "generate", "grade_documents": "grade_documents"},
+)
 workflow.add_conditional_edges(
     "grade_documents",
     decide_next_step,
     {"generate": "generate", "rewrite_query": "rewrite_query"},
 )
-workflow.add_edge("rewrite_query", "retrieve")  # Pętla powrotna
-workflow.add_edge("generate", END)
+# Pętla powrotna; bez budżetu LLM na rewriter - od razu odpowiedź z obecnymi wynikami
+workflow.add_conditional_edges(
+    "rewrite_query",
+    decide_after_rewrite,
+    {"retrieve": "retrieve", "generate": "generate"},
+)
+# Po odpowiedzi, gdy historia przekroczy HISTORY_MAX_MESSAGES - kompakcja
+workflow.add_conditional_edges(
+    "generate",
+    decide_after_generate,
+    {"compact_history": "compact_history", END: END},
+)
+workflow.add_edge("compact_history", END)
 
-memory = MemorySaver()
+# Ograniczony checkpointer (TTL/LRU, opcjonalnie sqlite) - patrz checkpointing.py
+memory = config.checkpointer
 app = workflow.compile(checkpointer=memory)
 
+# Węzeł, którego tokeny przekazujemy użytkownikowi na bieżąco
+STREAMED_NODE = "generate"
+
+
+def stream_answer(inputs, config):
+    """
+    Uruchamia graf i na bieżąco zwraca zdarzenia dla interfejsu:
+      ("node", nazwa_węzła, wartości) - węzeł zakończył pracę,
+      ("token", fragment, None) - kolejny fragment odpowiedzi z węzła `generate`.
+    Tokeny z pozostałych wywołań LLM (router, sędzia, rewriter) są pomijane. Odpowiedź
+    z cache'a nie ma tokenów - pełny tekst przychodzi w zdarzeniu węzła `generate`.
+    """
+    for mode, chunk in app.stream(
+        inputs, config=config, stream_mode=["updates", "messages"]
+    ):
+        yield from _answer_events(mode, chunk)
+
+
+async def astream_answer(inputs, config):
+    """
+    Wersja async `stream_answer` (te same zdarzenia) - dla serwerów asyncio: w czasie
+    oczekiwania na LLM i Qdranta proces obsługuje inne rozmowy.
+    """
+    async for mode, chunk in app.astream(
+        inputs, config=config, stream_mode=["updates", "messages"]
+    ):
+        for event in _answer_events(mode, chunk):
+            yield event
+
+
+def _answer_events(mode, chunk):
+    if mode == "messages":
+        message, metadata = chunk
+        # Pełne wiadomości (np. AIMessage dopisana do historii) dublowałyby tekst
+        if (
+            isinstance(message, AIMessageChunk)
+            and metadata.get("langgraph_node") == STREAMED_NODE
+            and message.content
+        ):
+            yield "token", message.content, None
+    else:
+        for node, values in chunk.items():
+            yield "node", node, values
+
+
+def session_messages(thread_id: str):
+    """Wiadomości rozmowy zapisane w checkpointerze (np. po restarcie z CHECKPOINTER=sqlite)."""
+    state = app.get_state({"configurable": {"thread_id": thread_id}})
+    return [
+        {
+            "role": "user" if message.type == "human" else "assistant",
+            "content": message.content,
+        }
+        for message in state.values.get("chat_history", [])
+        if message.type in ("human", "ai")
+    ]
+
+
 if __name__ == "__main__":
     user_query = "Horror o mordercy w hokejowej osłonie twarzy"
 
@@ -60,9 +166,18 @@ if __name__ == "__main__":
 
     print(f"--- Starting Agent for query: {user_query} ---")
 
-    for event in app.stream(inputs, config=config):
-        for node, values in event.items():
-            print(f"--- Node '{node}' finished ---")
-            if node == "generate":
-                print("\n" + "=" * 50)
-                print(f"FINAL ANSWER:\n{values['generation']}")
+    streamed = False
+    for kind, payload, values in stream_answer(inputs, config):
+        if kind == "token":
+            if not streamed:
+                print("\n" + "=" * 50 + "\nFINAL ANSWER:")
+                streamed = True
+            print(payload, end="", flush=True)
+            continue
+
+        if streamed:
+            print()
+        print(f"--- Node '{payload}' finished ---")
+        if payload == "generate" and not streamed:
+            print("\n" + "=" * 50)
+            print(f"FINAL ANSWER:\n{values['generation']}")
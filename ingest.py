@@ -0,0 +1,821 @@
+"""
+Strumieniowe, wznawialne indeksowanie zbioru TMDB do Qdranta.
+
+Zastępuje pętlę z `embed_films.ipynb`. CSV jest czytany porcjami (chunkami), a trzy etapy
+działają równolegle: budowanie tekstów i payloadów, kodowanie (dense + sparse) oraz
+równoległe upserty do Qdranta. Identyfikatorami punktów są stabilne ID z TMDB, a plik
+checkpointu zapamiętuje, które chunki zostały w całości zapisane, więc wznowienie jest dokładne.
+
+Odświeżenie zrzutu TMDB (`--delta`) nie przebudowuje kolekcji: każdy punkt ma w payloadzie hash
+tekstu do embeddingu i hash payloadu, więc ponownie kodowane są tylko filmy nowe i ze zmienionym
+opisem, same zmiany metadanych (oceny, liczby głosów) idą jako aktualizacja payloadu, a filmy
+nieobecne w nowym zrzucie są usuwane.
+
+Użycie:
+    python ingest.py --csv TMDB_movie_dataset_v11.csv
+    python ingest.py --csv TMDB_movie_dataset_v11.csv --recreate
+    python ingest.py --csv TMDB_movie_dataset_v11.csv --delta
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures
+from collections import Counter
+from functools import lru_cache
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+import pandas as pd
+from qdrant_client import QdrantClient, models
+
+from config import (
+    COLLECTION_NAME,
+    DENSE_MODEL_NAME,
+    INDEX_EPOCH_PATH,
+    QDRANT_URL,
+    SPARSE_MODEL_NAME,
+    TITLE_INDEX,
+    TITLE_INDEX_PATH,
+    get_device,
+)
+from backends import QdrantBackend, dense_point_vectors, dense_vectors_config
+from cache import touch_index_epoch
+from title_index import build_title_index
+from utils import build_rerank_passage
+
+# Indeksy payloadu używane przez filtry w `utils.build_qdrant_filter`
+PAYLOAD_INDEXES = {
+    "title": "text",
+    "original_title": "text",
+    "year": "integer",
+    "vote_average": "float",
+    "vote_count": "integer",
+    "runtime": "integer",
+    "popularity": "float",
+    "adult": "bool",
+    "genres": "keyword",
+    "keywords": "keyword",
+    "imdb_id": "keyword",
+    "original_language": "keyword",
+    "production_companies": "keyword",
+    "production_countries": "keyword",
+    "spoken_languages": "keyword",
+}
+
+# Hashe treści zapisywane w payloadzie - porównywane przy indeksowaniu przyrostowym (--delta)
+HASH_FIELDS = ["text_hash", "payload_hash"]
+
+_SENTINEL = None
+
+
+# ===== PRZYGOTOWANIE DANYCH =====
+
+
+@lru_cache(maxsize=None)
+def get_language_name(code) -> str:
+    if pd.isna(code):
+        return "Unknown"
+    import pycountry
+
+    try:
+        # Pobieramy język na podstawie kodu alpha_2 (np. 'en')
+        lang = pycountry.languages.get(alpha_2=code)
+        return lang.name if lang else code
+    except (AttributeError, KeyError, LookupError):
+        return code
+
+
+def parse_list(val) -> List[str]:
+    if pd.isna(val) or not val:
+        return []
+    return [x.strip() for x in str(val).split(",") if x.strip()]
+
+
+def _clean(val):
+    """NaN z pandasa nie jest poprawnym JSON-em dla Qdranta."""
+    return None if pd.isna(val) else val
+
+
+def filter_chunk(df: pd.DataFrame) -> pd.DataFrame:
+    """Te same kryteria jakościowe co w notebooku, liczone wierszowo (niezależnie od chunka)."""
+    df = df[~df["overview"].isna()]
+    df = df[df["overview"].str.len() > 50]
+    df = df[df["vote_count"] > 10]
+
+    df = df.copy()
+    df["release_date"] = pd.to_datetime(df["release_date"], errors="coerce")
+    df = df[~df["release_date"].isna()]
+    df["year"] = df["release_date"].dt.year
+
+    df["tagline"] = df["tagline"].fillna("")
+    df["genres"] = df["genres"].fillna("")
+    df["keywords"] = df["keywords"].fillna("")
+    df["original_language"] = df["original_language"].apply(get_language_name)
+    return df
+
+
+def create_text_chunk(row) -> str:
+    # Lista części składowych opisu
+    parts = []
+
+    # 1. Tytuł i Rok (Kontekst podstawowy)
+    title = row["title"]
+    year = int(row["year"]) if pd.notnull(row["year"]) else ""
+    if year:
+        parts.append(f"Movie title: {title} ({year}).")
+    else:
+        parts.append(f"Movie title: {title}.")
+
+    # 2. Oryginalny tytuł (jeśli inny)
+    if pd.notnull(row["original_title"]) and row["original_title"] != title:
+        parts.append(f"Original title: {row['original_title']}.")
+
+    # 3. Języki
+    lang_info = []
+    if pd.notnull(row["original_language"]):
+        lang_info.append(f"Original language: {row['original_language']}")
+    if pd.notnull(row["spoken_languages"]):
+        lang_info.append(f"Spoken languages: {row['spoken_languages']}")
+
+    if lang_info:
+        parts.append(". ".join(lang_info) + ".")
+
+    # 4. Tagline (Klimat)
+    if pd.notnull(row["tagline"]) and len(str(row["tagline"])) > 3:
+        parts.append(f"Tagline: {row['tagline']}")
+
+    # 5. Gatunki (Kategoryzacja)
+    if pd.notnull(row["genres"]):
+        parts.append(f"Genres: {row['genres']}.")
+
+    # 6. Fabuła (Treść główna)
+    if pd.notnull(row["overview"]):
+        parts.append(f"Plot summary: {row['overview']}")
+
+    # 7. Keywords (Szczegóły tematyczne)
+    if pd.notnull(row["keywords"]):
+        parts.append(f"Keywords: {row['keywords']}.")
+
+    # 8. Kontekst produkcji
+    prod_info = []
+    if pd.notnull(row["production_companies"]):
+        prod_info.append(f"Produced by: {row['production_companies']}")
+    if pd.notnull(row["production_countries"]):
+        prod_info.append(f"Country: {row['production_countries']}")
+
+    if prod_info:
+        parts.append(" | ".join(prod_info) + ".")
+
+    # Łączymy w jeden spójny tekst
+    return " ".join(parts)
+
+
+def build_payload(row) -> dict:
+    payload = {
+        # Identyfikacja i UI
+        "id": int(row["id"]),
+        "title": row["title"],
+        "original_title": _clean(row["original_title"]),
+        "overview": row["overview"],
+        "tagline": row["tagline"],
+        "poster_path": _clean(row["poster_path"]),
+        "backdrop_path": _clean(row["backdrop_path"]),
+        "imdb_id": _clean(row["imdb_id"]),
+        # Filtrowanie (Numeryczne/Boolean)
+        "year": int(row["year"]) if pd.notnull(row["year"]) else None,
+        "vote_average": float(row["vote_average"]),
+        "vote_count": int(row["vote_count"]),
+        "popularity": float(row["popularity"]),
+        "runtime": int(row["runtime"]) if pd.notnull(row["runtime"]) else None,
+        "adult": bool(row["adult"]),
+        # Filtrowanie (Listy/Kategorie)
+        "genres": parse_list(row["genres"]),
+        "keywords": parse_list(row["keywords"]),
+        "production_companies": parse_list(row["production_companies"]),
+        "production_countries": parse_list(row["production_countries"]),
+        "spoken_languages": parse_list(row["spoken_languages"]),
+        "original_language": str(row["original_language"]),
+    }
+    # Gotowy tekst dla rerankera, żeby nie składać go przy każdym zapytaniu
+    payload["rerank_passage"] = build_rerank_passage(payload)
+    return payload
+
+
+def content_hash(value: str) -> str:
+    return hashlib.blake2b(value.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def add_content_hashes(text: str, payload: dict) -> dict:
+    """
+    Hash payloadu (bez pól z hashami) i hash tekstu do embeddingu. Nazwy modeli wchodzą
+    do hasha tekstu, więc zmiana modelu też oznacza ponowne kodowanie.
+    """
+    payload["payload_hash"] = content_hash(
+        json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    )
+    payload["text_hash"] = content_hash(
+        f"{DENSE_MODEL_NAME}|{SPARSE_MODEL_NAME}|{text}"
+    )
+    return payload
+
+
+def prepare_chunk(df: pd.DataFrame) -> Tuple[List[int], List[str], List[dict]]:
+    """Etap 1: filtracja, teksty do embeddingu i payloady."""
+    df = filter_chunk(df)
+    ids, texts, payloads = [], [], []
+    for row in df.to_dict("records"):
+        text = create_text_chunk(row)
+        ids.append(int(row["id"]))
+        texts.append(text)
+        payloads.append(add_content_hashes(text, build_payload(row)))
+    return ids, texts, payloads
+
+
+# ===== CHECKPOINT =====
+
+
+class Checkpoint:
+    """
+    Zbiór numerów chunków CSV, które zostały w całości zapisane w Qdrancie.
+    Zapis jest atomowy (plik tymczasowy + os.replace), więc przerwanie nie psuje pliku.
+    Bez `path` (indeksowanie przyrostowe) postęp jest liczony tylko w pamięci.
+    """
+
+    def __init__(self, path: Optional[str], csv_path: str, chunk_size: int):
+        self.path = path
+        self.csv_path = os.path.abspath(csv_path)
+        self.chunk_size = chunk_size
+        self.done_chunks: Set[int] = set()
+        self.points = 0
+        self._lock = threading.Lock()
+
+    def load(self) -> "Checkpoint":
+        if self.path is None or not os.path.exists(self.path):
+            return self
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f)
+        if (
+            data.get("chunk_size") != self.chunk_size
+            or data.get("csv") != self.csv_path
+        ):
+            raise ValueError(
+                f"Checkpoint {self.path} dotyczy innego pliku lub rozmiaru chunka "
+                f"({data.get('csv')}, chunk_size={data.get('chunk_size')}). "
+                "Użyj tych samych parametrów albo usuń checkpoint."
+            )
+        self.done_chunks = set(data.get("done_chunks", []))
+        self.points = data.get("points", 0)
+        return self
+
+    def mark_done(self, chunk_idx: int, n_points: int):
+        with self._lock:
+            self.done_chunks.add(chunk_idx)
+            self.points += n_points
+            self._save()
+
+    def reset(self):
+        with self._lock:
+            self.done_chunks = set()
+            self.points = 0
+            self._save()
+
+    def _save(self):
+        if self.path is None:
+            return
+        data = {
+            "csv": self.csv_path,
+            "chunk_size": self.chunk_size,
+            "done_chunks": sorted(self.done_chunks),
+            "points": self.points,
+        }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+
+# ===== KOLEKCJA =====
+
+
+def ensure_collection(
+    client: QdrantClient,
+    dense_dim: int,
+    recreate: bool = False,
+    collection_name: str = COLLECTION_NAME,
+    vectors_config: Optional[dict] = None,
+):
+    """Tworzy kolekcję; wektory dense według DENSE_DIM / DENSE_QUANTIZATION (patrz backends.py)."""
+    if recreate and client.collection_exists(collection_name):
+        client.delete_collection(collection_name)
+
+    vectors_config = vectors_config or dense_vectors_config(dense_dim)
+    if client.collection_exists(collection_name):
+        check_collection_layout(client, vectors_config, collection_name)
+        return
+
+    client.create_collection(
+        collection_name=collection_name,
+        vectors_config=vectors_config,
+        sparse_vectors_config={"text-sparse": models.SparseVectorParams()},
+    )
+    for field_name, field_schema in PAYLOAD_INDEXES.items():
+        client.create_payload_index(
+            collection_name=collection_name,
+            field_name=field_name,
+            field_schema=field_schema,
+        )
+
+
+def _dense_layout(vectors_config: dict) -> Dict[str, Tuple[int, Optional[str]]]:
+    return {
+        name: (
+            params.size,
+            (
+                type(params.quantization_config).__name__
+                if params.quantization_config
+                else None
+            ),
+        )
+        for name, params in vectors_config.items()
+    }
+
+
+def check_collection_layout(
+    client: QdrantClient,
+    vectors_config: dict,
+    collection_name: str = COLLECTION_NAME,
+):
+    """
+    Wznowienie i --delta dopisują do istniejącej kolekcji: po zmianie DENSE_DIM albo
+    DENSE_QUANTIZATION jej wektory nie pasują do nowych punktów (hashe tekstów tego nie widzą).
+    """
+    stored = client.get_collection(collection_name).config.params.vectors
+    if isinstance(stored, models.VectorParams) or stored is None:
+        stored = {}
+    expected, actual = _dense_layout(vectors_config), _dense_layout(stored)
+    if expected != actual:
+        raise ValueError(
+            f"Kolekcja {collection_name} ma inne wektory dense ({actual}) niż obecne "
+            f"ustawienia DENSE_DIM / DENSE_QUANTIZATION ({expected}). "
+            "Zindeksuj ją od nowa z --recreate."
+        )
+
+
+# ===== PIPELINE =====
+
+
+class IngestPipeline:
+    """
+    Trzy etapy połączone ograniczonymi kolejkami:
+      1. wątek czytający CSV i budujący teksty/payloady,
+      2. wątek kodujący (dense + sparse) całe chunki,
+      3. pula wątków wysyłających paczki punktów do Qdranta.
+    Chunk trafia do checkpointu dopiero, gdy wszystkie jego paczki zostały zapisane.
+    Wiersz z tekstem None (`DeltaPlan`) omija kodowanie - etap 3 nadpisuje tylko jego payload.
+    """
+
+    def __init__(
+        self,
+        client: QdrantClient,
+        dense_model,
+        sparse_model,
+        checkpoint: Checkpoint,
+        encode_batch_size: int = 32,
+        upload_batch_size: int = 256,
+        upload_workers: int = 4,
+        queue_size: int = 4,
+        prepare: Callable[
+            [pd.DataFrame], Tuple[List[int], List[Optional[str]], List[dict]]
+        ] = prepare_chunk,
+    ):
+        self.client = client
+        self.dense_model = dense_model
+        self.sparse_model = sparse_model
+        self.checkpoint = checkpoint
+        self.encode_batch_size = encode_batch_size
+        self.upload_batch_size = upload_batch_size
+        self.upload_workers = upload_workers
+        self.prepare = prepare
+
+        self._prepared: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._encoded: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._errors: List[BaseException] = []
+
+    # --- Etap 1 ---
+    def _read(self, chunks: Iterator[pd.DataFrame]):
+        try:
+            for chunk_idx, df in enumerate(chunks):
+                if self._stop.is_set():
+                    break
+                if chunk_idx in self.checkpoint.done_chunks:
+                    continue
+                ids, texts, payloads = self.prepare(df)
+                self._put(self._prepared, (chunk_idx, ids, texts, payloads))
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            self._put(self._prepared, _SENTINEL, force=True)
+
+    # --- Etap 2 ---
+    def _encode(self):
+        try:
+            while True:
+                item = self._prepared.get()
+                if item is _SENTINEL or self._stop.is_set():
+                    break
+                chunk_idx, ids, texts, payloads = item
+                updates = [
+                    (point_id, payload)
+                    for point_id, text, payload in zip(ids, texts, payloads)
+                    if text is None
+                ]
+                keep = [k for k, text in enumerate(texts) if text is not None]
+                points = self._encode_points(
+                    [ids[k] for k in keep],
+                    [texts[k] for k in keep],
+                    [payloads[k] for k in keep],
+                )
+                self._put(self._encoded, (chunk_idx, points, updates))
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            self._put(self._encoded, _SENTINEL, force=True)
+
+    def _encode_points(
+        self, ids: List[int], texts: List[str], payloads: List[dict]
+    ) -> List[models.PointStruct]:
+        if not texts:
+            return []
+        dense_vectors = self.dense_model.encode(
+            texts, batch_size=self.encode_batch_size, show_progress_bar=False
+        )
+        sparse_vectors = self.sparse_model.embed(
+            texts, batch_size=self.encode_batch_size
+        )
+        return [
+            models.PointStruct(
+                id=point_id,
+                vector={
+                    **dense_point_vectors(dense),
+                    "text-sparse": models.SparseVector(
+                        indices=sparse.indices.tolist(), values=sparse.values.tolist()
+                    ),
+                },
+                payload=payload,
+            )
+            for point_id, dense, sparse, payload in zip(
+                ids, dense_vectors, sparse_vectors, payloads
+            )
+        ]
+
+    # --- Etap 3 ---
+    def _upload_chunk(
+        self,
+        pool: ThreadPoolExecutor,
+        chunk_idx: int,
+        points,
+        payload_updates: List[Tuple[int, dict]] = (),
+    ):
+        n_points = len(points) + len(payload_updates)
+        if not n_points:
+            self.checkpoint.mark_done(chunk_idx, 0)
+            return []
+
+        futures = [
+            pool.submit(
+                self.client.upsert,
+                collection_name=COLLECTION_NAME,
+                points=points[start : start + self.upload_batch_size],
+                wait=True,
+            )
+            for start in range(0, len(points), self.upload_batch_size)
+        ]
+        futures += [
+            pool.submit(
+                self._overwrite_payloads,
+                payload_updates[start : start + self.upload_batch_size],
+            )
+            for start in range(0, len(payload_updates), self.upload_batch_size)
+        ]
+
+        # Ostatnia zakończona paczka zapisuje checkpoint całego chunka
+        lock = threading.Lock()
+        state = {"remaining": len(futures), "failed": False}
+
+        def _on_done(future):
+            with lock:
+                state["remaining"] -= 1
+                state["failed"] = state["failed"] or future.exception() is not None
+                finished = state["remaining"] == 0 and not state["failed"]
+            if finished:
+                self.checkpoint.mark_done(chunk_idx, n_points)
+                print(f"   -> Chunk {chunk_idx}: zapisano {n_points} filmów.")
+
+        for f in futures:
+            f.add_done_callback(_on_done)
+        return futures
+
+    def _overwrite_payloads(self, updates: List[Tuple[int, dict]]):
+        self.client.batch_update_points(
+            collection_name=COLLECTION_NAME,
+            update_operations=[
+                models.OverwritePayloadOperation(
+                    overwrite_payload=models.SetPayload(
+                        payload=payload, points=[point_id]
+                    )
+                )
+                for point_id, payload in updates
+            ],
+            wait=True,
+        )
+
+    def run(self, chunks: Iterator[pd.DataFrame]) -> int:
+        start = time.perf_counter()
+        points_before = self.checkpoint.points
+
+        reader = threading.Thread(target=self._read, args=(chunks,), daemon=True)
+        encoder = threading.Thread(target=self._encode, daemon=True)
+        reader.start()
+        encoder.start()
+
+        pending = []
+        with ThreadPoolExecutor(max_workers=self.upload_workers) as pool:
+            while True:
+                item = self._encoded.get()
+                if item is _SENTINEL:
+                    break
+                chunk_idx, points, payload_updates = item
+                pending.extend(
+                    self._upload_chunk(pool, chunk_idx, points, payload_updates)
+                )
+
+                # Błędy sprawdzamy przed odrzuceniem zakończonych paczek - inaczej by przepadły
+                self._raise_upload_errors(pending)
+                # Ograniczamy liczbę paczek w locie, żeby nie trzymać całego CSV w RAM
+                pending = [f for f in pending if not f.done()]
+                if len(pending) > self.upload_workers * 2:
+                    wait_futures(pending[: self.upload_workers])
+
+            wait_futures(pending)
+            self._raise_upload_errors(pending)
+
+        reader.join()
+        encoder.join()
+        if self._errors:
+            raise self._errors[0]
+
+        written = self.checkpoint.points - points_before
+        elapsed = time.perf_counter() - start
+        print(
+            f"\n✅ Zapisano {written} filmów w {elapsed:.1f}s "
+            f"({written / max(elapsed, 1e-9):.1f} filmów/s)."
+        )
+        return written
+
+    # --- Pomocnicze ---
+    def _raise_upload_errors(self, futures):
+        for f in futures:
+            if f.done() and f.exception() is not None:
+                self._fail(f.exception())
+                raise f.exception()
+
+    def _put(self, q: queue.Queue, item, force: bool = False):
+        while True:
+            if self._stop.is_set() and not force:
+                return
+            try:
+                q.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                if force and self._stop.is_set():
+                    # Konsument mógł już skończyć - robimy miejsce na sentinel
+                    try:
+                        q.get_nowait()
+                    except queue.Empty:
+                        pass
+
+    def _fail(self, error: BaseException):
+        self._errors.append(error)
+        self._stop.set()
+
+
+# ===== INDEKSOWANIE PRZYROSTOWE =====
+
+
+class DeltaPlan:
+    """
+    Porównuje kolejne chunki CSV z hashami zapisanymi w kolekcji (`HASH_FIELDS`).
+    `prepare` jest etapem 1 pipeline'u: przepuszcza do kodowania tylko filmy nowe i ze zmienionym
+    tekstem, a same zmiany payloadu oznacza tekstem None - etap 3 nadpisuje je bez wektorów.
+    Punkty bez hashy (z indeksowania sprzed ich wprowadzenia) są kodowane ponownie.
+    """
+
+    def __init__(
+        self,
+        client: QdrantClient,
+        collection_name: str = COLLECTION_NAME,
+        payload_batch_size: int = 256,
+    ):
+        self.client = client
+        self.collection_name = collection_name
+        self.payload_batch_size = payload_batch_size
+        self.counts: Counter = Counter()
+        self.seen: Set[int] = set()
+        self._lock = threading.Lock()
+
+        start = time.perf_counter()
+        self.existing: Dict[int, Tuple[Optional[str], Optional[str]]] = {
+            point_id: (payload.get("text_hash"), payload.get("payload_hash"))
+            for point_id, payload in QdrantBackend(
+                client, collection_name
+            ).scroll_payloads(HASH_FIELDS)
+        }
+        self.scan_seconds = time.perf_counter() - start
+
+    def prepare(
+        self, df: pd.DataFrame
+    ) -> Tuple[List[int], List[Optional[str]], List[dict]]:
+        ids, texts, payloads = prepare_chunk(df)
+        counts: Counter = Counter()
+        encode_ids, encode_texts, encode_payloads = [], [], []
+        for point_id, text, payload in zip(ids, texts, payloads):
+            stored = self.existing.get(point_id)
+            if stored is None:
+                counts["new"] += 1
+            elif stored[0] != payload["text_hash"]:
+                counts["changed"] += 1
+            elif stored[1] != payload["payload_hash"]:
+                # Bez tekstu: pipeline nie koduje filmu, tylko nadpisuje payload w puli wysyłek
+                counts["payload_only"] += 1
+                text = None
+            else:
+                counts["unchanged"] += 1
+                continue
+            encode_ids.append(point_id)
+            encode_texts.append(text)
+            encode_payloads.append(payload)
+
+        with self._lock:
+            self.seen.update(ids)
+            self.counts.update(counts)
+        return encode_ids, encode_texts, encode_payloads
+
+    def delete_missing(self) -> int:
+        """Usuwa filmy, których nie ma w nowym zrzucie (albo nie przechodzą już filtrów)."""
+        missing = [point_id for point_id in self.existing if point_id not in self.seen]
+        for start in range(0, len(missing), self.payload_batch_size):
+            self.client.delete(
+                collection_name=self.collection_name,
+                points_selector=models.PointIdsList(
+                    points=missing[start : start + self.payload_batch_size]
+                ),
+                wait=True,
+            )
+        self.counts["deleted"] = len(missing)
+        return len(missing)
+
+    @property
+    def changed(self) -> bool:
+        return any(
+            self.counts[key] for key in ("new", "changed", "payload_only", "deleted")
+        )
+
+    def report(self, encode_seconds: float, delete_seconds: float):
+        print(
+            f"\n📊 Delta: nowe {self.counts['new']}, zmieniony tekst {self.counts['changed']}, "
+            f"tylko payload {self.counts['payload_only']}, bez zmian {self.counts['unchanged']}, "
+            f"usunięte {self.counts['deleted']}."
+        )
+        print(
+            f"   -> Czas: odczyt hashy {self.scan_seconds:.1f}s, "
+            f"porównanie + kodowanie + zapis {encode_seconds:.1f}s, "
+            f"usuwanie {delete_seconds:.1f}s."
+        )
+
+
+def load_models(device: Optional[str]):
+    from fastembed import SparseTextEmbedding
+    from sentence_transformers import SentenceTransformer
+
+    dense_model = SentenceTransformer(
+        DENSE_MODEL_NAME, trust_remote_code=True, device=device or get_device()
+    )
+    sparse_model = SparseTextEmbedding(model_name=SPARSE_MODEL_NAME)
+    return dense_model, sparse_model
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Indeksowanie filmów TMDB do Qdranta (dense + sparse)."
+    )
+    parser.add_argument(
+        "--csv", required=True, help="Ścieżka do TMDB_movie_dataset_v11.csv"
+    )
+    parser.add_argument("--qdrant-url", default=QDRANT_URL)
+    parser.add_argument("--checkpoint", default="ingest_checkpoint.json")
+    parser.add_argument("--chunk-size", type=int, default=2048)
+    parser.add_argument("--encode-batch-size", type=int, default=32)
+    parser.add_argument("--upload-batch-size", type=int, default=256)
+    parser.add_argument("--upload-workers", type=int, default=4)
+    parser.add_argument(
+        "--device", default=None, help="np. cpu, cuda, mps (domyślnie wykrywane)"
+    )
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        "--recreate",
+        action="store_true",
+        help="Usuń kolekcję i checkpoint, a następnie zindeksuj wszystko od nowa.",
+    )
+    mode.add_argument(
+        "--delta",
+        action="store_true",
+        help="Odśwież istniejącą kolekcję: koduj tylko nowe i zmienione filmy, usuń brakujące.",
+    )
+    args = parser.parse_args(argv)
+
+    client = QdrantClient(url=args.qdrant_url)
+    dense_model, sparse_model = load_models(args.device)
+
+    if args.delta:
+        run_delta(client, dense_model, sparse_model, args)
+        return
+
+    checkpoint = Checkpoint(args.checkpoint, args.csv, args.chunk_size)
+    if args.recreate:
+        checkpoint.reset()
+    else:
+        checkpoint.load()
+        if checkpoint.done_chunks:
+            print(
+                f"Wznawiam: {len(checkpoint.done_chunks)} chunków "
+                f"({checkpoint.points} filmów) jest już w bazie."
+            )
+
+    ensure_collection(
+        client, dense_model.get_sentence_embedding_dimension(), recreate=args.recreate
+    )
+
+    pipeline = IngestPipeline(
+        client,
+        dense_model,
+        sparse_model,
+        checkpoint,
+        encode_batch_size=args.encode_batch_size,
+        upload_batch_size=args.upload_batch_size,
+        upload_workers=args.upload_workers,
+    )
+    chunks = pd.read_csv(args.csv, chunksize=args.chunk_size)
+    pipeline.run(chunks)
+    finish_indexing(client)
+
+
+def run_delta(client: QdrantClient, dense_model, sparse_model, args):
+    ensure_collection(client, dense_model.get_sentence_embedding_dimension())
+    plan = DeltaPlan(client, payload_batch_size=args.upload_batch_size)
+    print(f"🔎 W kolekcji jest {len(plan.existing)} filmów, porównuję z {args.csv}...")
+
+    # Bez pliku checkpointu: każde uruchomienie porównuje cały zrzut, a zapisane już
+    # zmiany mają zgodne hashe, więc powtórka po przerwaniu nie koduje ich drugi raz
+    pipeline = IngestPipeline(
+        client,
+        dense_model,
+        sparse_model,
+        Checkpoint(None, args.csv, args.chunk_size),
+        encode_batch_size=args.encode_batch_size,
+        upload_batch_size=args.upload_batch_size,
+        upload_workers=args.upload_workers,
+        prepare=plan.prepare,
+    )
+    start = time.perf_counter()
+    try:
+        pipeline.run(pd.read_csv(args.csv, chunksize=args.chunk_size))
+    except BaseException:
+        # Niezapisane filmy zachowały w kolekcji stare hashe, więc kolejne --delta je ponowi.
+        # Usuwanie brakujących, epoka cache'a i indeks tytułów czekają na udany przebieg.
+        print(
+            "❌ Delta przerwana - nie wszystkie filmy zostały zapisane. Uruchom ją ponownie."
+        )
+        raise
+    encode_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    plan.delete_missing()
+    plan.report(encode_seconds, time.perf_counter() - start)
+    if plan.changed:
+        finish_indexing(client)
+
+
+def finish_indexing(client: QdrantClient):
+    # Odpowiedzi z cache'a mogą dotyczyć starej wersji kolekcji
+    touch_index_epoch(INDEX_EPOCH_PATH)
+    if TITLE_INDEX:
+        build_title_index(QdrantBackend(client), TITLE_INDEX_PATH)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,511 @@
+"""
+Wspólny harmonogram wywołań LLM (Groq) dla całego procesu.
+
+Bez niego każdy łańcuch woła API od razu: przy obciążeniu dostawca odpowiada 429, klient
+ponawia w ciemno i wszystkie rozmowy zwalniają naraz. Tutaj każde wywołanie modelu czatu
+(`scheduled_chat_class`) najpierw czeka na przydział z `LLMScheduler`:
+  - limity kubełkami tokenów na model: zapytania na minutę i tokeny na minutę. Rezerwacja
+    to szacunek (znaki promptu / 4 + max_tokens), korygowany po odpowiedzi o faktyczne użycie,
+  - kolejka priorytetowa: `generate` (odpowiedź dla użytkownika) przed `route` (router,
+    analizator intencji), a te przed `optional` (sędzia, rewriter, streszczenie historii),
+  - termin na przydział: po nim wywołanie dostaje `LLMUnavailable`. Wywołania opcjonalne mają
+    krótszy termin i nie sięgają po ostatnią część budżetu tokenów (`optional_reserve`) -
+    gdy budżet się kończy, są odrzucane od razu, a węzły grafu je pomijają (nodes.py),
+  - 429 od dostawcy wstrzymuje przydziały dla modelu na `retry-after`, a wywołanie wraca
+    do kolejki. Błędy przejściowe (408, 409, 5xx, zerwane połączenie, timeout) wracają do kolejki
+    po krótkiej przerwie, najwyżej `MAX_RETRIES` razy - klient Groq sam nie ponawia niczego.
+    Rezerwacja tokenów wraca do budżetu tylko wtedy, gdy dostawca nie przyjął żądania.
+Głębokość kolejki i czas oczekiwania trafiają do telemetrii (`llm.queue_depth`,
+`llm.<priorytet>.queue_wait.ms`, `llm.shed.<priorytet>`), a `stats()` zwraca stan bieżący.
+"""
+
+import asyncio
+import functools
+import heapq
+import itertools
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic import Field
+
+try:
+    from groq import APIConnectionError, APITimeoutError
+except ImportError:  # harmonogram z innym dostawcą
+    APIConnectionError, APITimeoutError = ConnectionError, TimeoutError
+
+from telemetry import incr, observe
+
+PRIORITIES = {"generate": 0, "route": 1, "optional": 2}
+# Szacunek tokenów promptu przed wywołaniem (korygowany po odpowiedzi)
+CHARS_PER_TOKEN = 4
+DEFAULT_COMPLETION_TOKENS = 512
+# Przerwa po 429 bez nagłówka retry-after
+DEFAULT_RETRY_AFTER = 2.0
+# Ponowienia błędów przejściowych - jak domyślnie w kliencie Groq (2 razy, od 0.5 s do 8 s)
+MAX_RETRIES = 2
+RETRY_BACKOFF = 0.5
+MAX_RETRY_BACKOFF = 8.0
+
+
+class LLMUnavailable(RuntimeError):
+    """Wywołanie LLM nie dostało przydziału przed terminem (limit dostawcy albo budżet)."""
+
+
+class TokenBucket:
+    """Kubełek odnawiany liniowo: `per_minute` jednostek na minutę, pojemność jednej minuty. 0 = bez limitu."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Sekundy do chwili, gdy w kubełku będzie `amount` (najwyżej cała pojemność)."""
+        if self.capacity <= 0:
+            return 0.0
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self.rate)
+
+    def available(self, now: float) -> float:
+        self._refill(now)
+        return self.level
+
+    def take(self, amount: float):
+        # Poziom może spaść poniżej zera - dług spłaca odnawianie
+        if self.capacity > 0:
+            self.level -= amount
+
+    def give(self, amount: float):
+        if self.capacity > 0:
+            self.level = min(self.capacity, self.level + amount)
+
+
+class _Request:
+    __slots__ = (
+        "model",
+        "priority",
+        "tokens",
+        "deadline",
+        "enqueued",
+        "notify",
+        "error",
+        "done",
+    )
+
+    def __init__(self, model, priority, tokens, deadline, notify):
+        self.model = model
+        self.priority = priority
+        self.tokens = tokens
+        self.deadline = deadline
+        self.enqueued = time.monotonic()
+        self.notify = notify
+        self.error: Optional[Exception] = None
+        self.done = False
+
+
+class Lease:
+    """Przydział jednego wywołania; `release` oddaje slot i rozlicza faktyczne tokeny."""
+
+    def __init__(self, scheduler: "LLMScheduler", request: _Request):
+        self._scheduler = scheduler
+        self._request = request
+
+    def release(self, used_tokens: Optional[int] = None):
+        self._scheduler._release(self._request, used_tokens)
+
+
+class LLMScheduler:
+    """
+    Kolejka priorytetowa obsługiwana przez jeden wątek, który wydaje przydziały, gdy pozwalają
+    na to kubełki modelu i limit równoległych wywołań. Czekać można synchronicznie (`acquire`)
+    albo w pętli zdarzeń (`aacquire`). Przydział dostaje zawsze pierwsze żądanie w kolejności
+    priorytetu - niższy priorytet nie wyprzedza czekającego wyższego.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = 30,
+        tokens_per_minute: float = 12000,
+        max_concurrency: int = 8,
+        deadline: float = 30.0,
+        optional_deadline: float = 3.0,
+        optional_reserve: float = 0.2,
+    ):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_concurrency = max_concurrency
+        self.deadline = deadline
+        self.optional_deadline = optional_deadline
+        self.optional_reserve = optional_reserve
+
+        self._cond = threading.Condition()
+        self._queue: List[Tuple[int, int, _Request]] = []
+        self._seq = itertools.count()
+        self._buckets: Dict[str, Tuple[TokenBucket, TokenBucket]] = {}
+        self._paused_until: Dict[str, float] = {}
+        self._running = 0
+        self._worker: Optional[threading.Thread] = None
+
+    def request_deadline(self, priority: str) -> float:
+        """Termin przydziału (czas monotoniczny) dla nowego wywołania - wspólny dla jego ponowień."""
+        timeout = self.optional_deadline if priority == "optional" else self.deadline
+        return time.monotonic() + timeout
+
+    # ===== PRZYDZIAŁY =====
+
+    def acquire(self, model: str, priority: str, tokens: int, deadline: float) -> Lease:
+        granted = threading.Event()
+        request = self._submit(model, priority, tokens, deadline, granted.set)
+        granted.wait()
+        return self._lease(request)
+
+    async def aacquire(
+        self, model: str, priority: str, tokens: int, deadline: float
+    ) -> Lease:
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def notify():
+            loop.call_soon_threadsafe(
+                lambda: granted.done() or granted.set_result(None)
+            )
+
+        request = self._submit(model, priority, tokens, deadline, notify)
+        try:
+            await granted
+        except asyncio.CancelledError:
+            self._cancel(request)
+            raise
+        return self._lease(request)
+
+    def rate_limited(self, model: str, retry_after: float):
+        """429 od dostawcy: wstrzymuje przydziały dla modelu na `retry_after` sekund."""
+        incr("llm.rate_limited")
+        with self._cond:
+            resume = time.monotonic() + retry_after
+            self._paused_until[model] = max(self._paused_until.get(model, 0.0), resume)
+            self._cond.notify()
+
+    def stats(self) -> dict:
+        with self._cond:
+            depth = {name: 0 for name in PRIORITIES}
+            for _, _, request in self._queue:
+                if not request.done:
+                    depth[request.priority] += 1
+            now = time.monotonic()
+            return {
+                "queue_depth": depth,
+                "running": self._running,
+                "tokens_available": {
+                    model: round(tokens.available(now))
+                    for model, (_, tokens) in self._buckets.items()
+                    if tokens.capacity > 0
+                },
+            }
+
+    def _submit(self, model, priority, tokens, deadline, notify) -> _Request:
+        request = _Request(model, priority, tokens, deadline, notify)
+        with self._cond:
+            heapq.heappush(
+                self._queue, (PRIORITIES[priority], next(self._seq), request)
+            )
+            observe("llm.queue_depth", len(self._queue))
+            if self._worker is None:
+                self._worker = threading.Thread(
+                    target=self._run, name="llm-scheduler", daemon=True
+                )
+                self._worker.start()
+            self._cond.notify()
+        return request
+
+    def _lease(self, request: _Request) -> Lease:
+        if request.error is not None:
+            raise request.error
+        observe(
+            f"llm.{request.priority}.queue_wait.ms",
+            (time.monotonic() - request.enqueued) * 1000.0,
+        )
+        return Lease(self, request)
+
+    def _cancel(self, request: _Request):
+        with self._cond:
+            if request.done and request.error is None:
+                # Przydział przyszedł razem z anulowaniem - slot wraca do puli
+                self._release_locked(request, 0)
+            request.done = True
+            self._cond.notify()
+
+    def _release(self, request: _Request, used_tokens: Optional[int]):
+        with self._cond:
+            self._release_locked(request, used_tokens)
+            self._cond.notify()
+
+    def _release_locked(self, request: _Request, used_tokens: Optional[int]):
+        self._running -= 1
+        if used_tokens is not None:
+            _, tokens = self._bucket(request.model)
+            if used_tokens < request.tokens:
+                tokens.give(request.tokens - used_tokens)
+            else:
+                tokens.take(used_tokens - request.tokens)
+
+    # ===== WĄTEK PRZYDZIAŁÓW =====
+
+    def _bucket(self, model: str) -> Tuple[TokenBucket, TokenBucket]:
+        if model not in self._buckets:
+            self._buckets[model] = (
+                TokenBucket(self.requests_per_minute),
+                TokenBucket(self.tokens_per_minute),
+            )
+        return self._buckets[model]
+
+    def _wait_time(self, request: _Request, now: float) -> float:
+        requests, tokens = self._bucket(request.model)
+        reserve = 0.0
+        if request.priority == "optional":
+            reserve = self.optional_reserve * tokens.capacity
+        return max(
+            self._paused_until.get(request.model, 0.0) - now,
+            requests.wait_time(1, now),
+            tokens.wait_time(request.tokens + reserve, now),
+        )
+
+    def _finish(self, request: _Request, error: Optional[Exception] = None):
+        request.done = True
+        request.error = error
+        request.notify()
+
+    def _run(self):
+        with self._cond:
+            while True:
+                self._cond.wait(self._dispatch(time.monotonic()))
+
+    def _dispatch(self, now: float) -> Optional[float]:
+        """Wydaje możliwe przydziały; zwraca, za ile sekund sprawdzić kolejkę ponownie."""
+        for _, _, request in self._queue:
+            if request.done:
+                continue
+            if request.deadline <= now:
+                incr(f"llm.shed.{request.priority}")
+                self._finish(
+                    request, LLMUnavailable("Brak przydziału LLM przed terminem")
+                )
+            elif (
+                request.priority == "optional"
+                and now + self._wait_time(request, now) > request.deadline
+            ):
+                # Budżet nie odnowi się przed terminem - od razu, zamiast czekać do końca
+                incr(f"llm.shed.{request.priority}")
+                self._finish(request, LLMUnavailable("Brak budżetu LLM"))
+        self._queue = [entry for entry in self._queue if not entry[2].done]
+        heapq.heapify(self._queue)
+
+        next_check = None
+        while self._queue and self._running < self.max_concurrency:
+            request = self._queue[0][2]
+            wait = self._wait_time(request, now)
+            if wait > 0:
+                next_check = wait
+                break
+            heapq.heappop(self._queue)
+            requests, tokens = self._bucket(request.model)
+            requests.take(1)
+            tokens.take(request.tokens)
+            self._running += 1
+            self._finish(request)
+
+        for _, _, request in self._queue:
+            until_deadline = max(0.0, request.deadline - now)
+            if next_check is None or until_deadline < next_check:
+                next_check = until_deadline
+        return next_check
+
+
+# ===== MODELE CZATU =====
+
+
+def rate_limit_delay(error: Exception) -> Optional[float]:
+    """Sekundy przerwy dla błędu 429 (nagłówek retry-after) albo None dla innych błędów."""
+    if getattr(error, "status_code", None) != 429:
+        return None
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return DEFAULT_RETRY_AFTER
+
+
+def _timed_out(error: Exception) -> bool:
+    return isinstance(error, (APITimeoutError, TimeoutError))
+
+
+def _connection_failed(error: Exception) -> bool:
+    """Żądanie nie dotarło do dostawcy (bez timeoutu - wtedy mogło zostać przetworzone)."""
+    return isinstance(error, (APIConnectionError, ConnectionError)) and not _timed_out(
+        error
+    )
+
+
+def retry_delay(error: Exception, attempt: int) -> Optional[float]:
+    """Przerwa przed ponowieniem błędu przejściowego albo None (inny błąd lub koniec prób)."""
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        transient = status in (408, 409) or status >= 500
+    else:
+        transient = _timed_out(error) or _connection_failed(error)
+    if not transient or attempt >= MAX_RETRIES:
+        return None
+    return min(RETRY_BACKOFF * 2**attempt, MAX_RETRY_BACKOFF)
+
+
+def refunded_tokens(error: Exception) -> Optional[int]:
+    """
+    Tokeny do rozliczenia nieudanego wywołania: 0, gdy dostawca go nie przyjął (429, brak
+    połączenia), inaczej None - zostaje rezerwacja, bo dostawca mógł już policzyć tokeny.
+    """
+    if getattr(error, "status_code", None) == 429 or _connection_failed(error):
+        return 0
+    return None
+
+
+def _message_tokens(message) -> Optional[int]:
+    usage = getattr(message, "usage_metadata", None)
+    return usage.get("total_tokens") if usage else None
+
+
+def _result_tokens(result) -> Optional[int]:
+    for generation in result.generations:
+        tokens = _message_tokens(generation.message)
+        if tokens:
+            return tokens
+    token_usage = (result.llm_output or {}).get("token_usage") or {}
+    return token_usage.get("total_tokens")
+
+
+@functools.lru_cache(maxsize=None)
+def scheduled_chat_class(base):
+    """
+    Podklasa modelu czatu LangChain (np. `ChatGroq`), której wywołania - zwykłe i strumieniowe,
+    także przez `with_structured_output` - przechodzą przez `LLMScheduler`. Klasa bazowa musi mieć
+    własne `_agenerate` / `_astream` (domyślne z LangChain wołałyby wersje synchroniczne).
+    """
+
+    class ScheduledChatModel(base):
+        scheduler: Any = Field(default=None, exclude=True)
+        priority: str = "route"
+
+        def _request(self, messages) -> tuple:
+            chars = sum(len(str(message.content)) for message in messages)
+            completion = getattr(self, "max_tokens", None) or DEFAULT_COMPLETION_TOKENS
+            model = getattr(self, "model_name", None) or type(self).__name__
+            return (
+                model,
+                self.priority,
+                chars // CHARS_PER_TOKEN + completion,
+                self.scheduler.request_deadline(self.priority),
+            )
+
+        def _retry_delay(
+            self, error: Exception, model: str, attempt: int
+        ) -> Optional[float]:
+            """Przerwa przed ponowną kolejką albo None (bez ponowienia). Po 429 czeka kolejka."""
+            delay = rate_limit_delay(error)
+            if delay is None:
+                return retry_delay(error, attempt)
+            self.scheduler.rate_limited(model, delay)
+            return 0.0
+
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+            request = self._request(messages)
+            for attempt in itertools.count():
+                lease = self.scheduler.acquire(*request)
+                used = None
+                try:
+                    result = super()._generate(messages, stop, run_manager, **kwargs)
+                    used = _result_tokens(result)
+                    return result
+                except Exception as error:
+                    used = refunded_tokens(error)
+                    delay = self._retry_delay(error, request[0], attempt)
+                    if delay is None:
+                        raise
+                finally:
+                    lease.release(used)
+                time.sleep(delay)
+
+        async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+            request = self._request(messages)
+            for attempt in itertools.count():
+                lease = await self.scheduler.aacquire(*request)
+                used = None
+                try:
+                    result = await super()._agenerate(
+                        messages, stop, run_manager, **kwargs
+                    )
+                    used = _result_tokens(result)
+                    return result
+                except Exception as error:
+                    used = refunded_tokens(error)
+                    delay = self._retry_delay(error, request[0], attempt)
+                    if delay is None:
+                        raise
+                finally:
+                    lease.release(used)
+                await asyncio.sleep(delay)
+
+        def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+            request = self._request(messages)
+            for attempt in itertools.count():
+                lease = self.scheduler.acquire(*request)
+                used, started = None, False
+                try:
+                    for chunk in super()._stream(messages, stop, run_manager, **kwargs):
+                        started = True
+                        used = _message_tokens(chunk.message) or used
+                        yield chunk
+                    return
+                except Exception as error:
+                    # Po pierwszym fragmencie ponowienie zdublowałoby tekst
+                    if started:
+                        raise
+                    used = refunded_tokens(error)
+                    delay = self._retry_delay(error, request[0], attempt)
+                    if delay is None:
+                        raise
+                finally:
+                    lease.release(used)
+                time.sleep(delay)
+
+        async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+            request = self._request(messages)
+            for attempt in itertools.count():
+                lease = await self.scheduler.aacquire(*request)
+                used, started = None, False
+                try:
+                    async for chunk in super()._astream(
+                        messages, stop, run_manager, **kwargs
+                    ):
+                        started = True
+                        used = _message_tokens(chunk.message) or used
+                        yield chunk
+                    return
+                except Exception as error:
+                    if started:
+                        raise
+                    used = refunded_tokens(error)
+                    delay = self._retry_delay(error, request[0], attempt)
+                    if delay is None:
+                        raise
+                finally:
+                    lease.release(used)
+                await asyncio.sleep(delay)
+
+    ScheduledChatModel.__name__ = f"Scheduled{base.__name__}"
+    return ScheduledChatModel
@@ -0,0 +1,362 @@
+"""
+Wspólny serwer modeli dla wielu workerów na jednej maszynie.
+
+Każdy proces importujący `config` ładuje własny embedder, BM25 i cross-encoder. Z ustawionym
+MODEL_SERVER_SOCKET zasoby `dense_model`, `sparse_model` i `reranker` są klientami serwera:
+modele żyją raz, w procesie `python model_server.py`, a mikro-batching (batching.py) po stronie
+serwera łączy żądania ze wszystkich workerów.
+
+Protokół (gniazdo Unix, każda ramka: 4 bajty długości + JSON):
+  - połączenie zaczyna się od `attach` z nazwą bufora pamięci współdzielonej klienta
+    (`movies_rag_<pid klienta>_...` - serwer sprawdza pid przez SO_PEERCRED, a gniazdo jest
+    dostępne tylko dla właściciela, więc nikt nie podsunie cudzego segmentu /dev/shm),
+  - żądania `dense` / `sparse` / `rerank` niosą teksty w JSON-ie, a wektory i wyniki wracają
+    w buforze klienta - odpowiedź JSON opisuje tylko kształt,
+  - wynik większy niż bufor daje odpowiedź `needed`; klient zakłada większy bufor i ponawia.
+
+Użycie:
+    python model_server.py                       # gniazdo z MODEL_SERVER_SOCKET
+    MODEL_SERVER_SOCKET=/tmp/movies_rag_models.sock streamlit run ui.py
+"""
+
+import argparse
+import atexit
+import json
+import logging
+import os
+import secrets
+import socket
+import socketserver
+import struct
+import threading
+from multiprocessing import resource_tracker, shared_memory
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SOCKET = "/tmp/movies_rag_models.sock"
+# Początkowy bufor klienta: ~1000 wektorów 1024 x float32
+BUFFER_SIZE = 4 * 2**20
+_HEADER = struct.Struct("!I")
+# Nazwy buforów klientów: prefiks + pid procesu klienta + losowy sufiks
+BUFFER_PREFIX = "movies_rag_"
+# Bufory utworzone przez klientów w tym procesie (serwer w tym samym procesie - benchmark)
+_OWNED_BUFFERS = set()
+
+
+class SparseOutput(NamedTuple):
+    """Wektor BM25 w kształcie wyniku `fastembed` (`indices`, `values`)."""
+
+    indices: np.ndarray
+    values: np.ndarray
+
+
+def _send(sock: socket.socket, message: dict):
+    data = json.dumps(message).encode("utf-8")
+    sock.sendall(_HEADER.pack(len(data)) + data)
+
+
+def _recv_exact(sock: socket.socket, n: int) -> Optional[bytes]:
+    chunks = []
+    while n:
+        chunk = sock.recv(n)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        n -= len(chunk)
+    return b"".join(chunks)
+
+
+def _recv(sock: socket.socket) -> Optional[dict]:
+    header = _recv_exact(sock, _HEADER.size)
+    if header is None:
+        return None
+    return json.loads(_recv_exact(sock, _HEADER.unpack(header)[0]))
+
+
+# ===== SERWER =====
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        buffer = None
+        try:
+            while True:
+                request = _recv(self.request)
+                if request is None:
+                    break
+                if request["op"] == "attach":
+                    if not _is_client_buffer(request["name"], _peer_pid(self.request)):
+                        logger.warning("⛔ Odrzucony bufor: %s", request["name"])
+                        _send(self.request, {"error": "Niedozwolona nazwa bufora"})
+                        break
+                    if buffer is not None:
+                        buffer.close()
+                    buffer = _attach(request["name"])
+                    _send(self.request, {"ok": True})
+                    continue
+                try:
+                    _send(self.request, self.server.execute(request, buffer))
+                except Exception as e:
+                    logger.exception("Błąd serwera modeli (%s)", request["op"])
+                    _send(self.request, {"error": f"{type(e).__name__}: {e}"})
+        finally:
+            if buffer is not None:
+                buffer.close()
+
+
+def _buffer_name() -> str:
+    return f"{BUFFER_PREFIX}{os.getpid()}_{secrets.token_hex(8)}"
+
+
+def _peer_pid(sock: socket.socket) -> Optional[int]:
+    """Pid procesu po drugiej stronie gniazda Unix (Linux); None, gdy system tego nie podaje."""
+    if not hasattr(socket, "SO_PEERCRED"):
+        return None
+    creds = sock.getsockopt(
+        socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i")
+    )
+    return struct.unpack("3i", creds)[0]
+
+
+def _is_client_buffer(name, pid: Optional[int]) -> bool:
+    # Serwer zapisuje wyniki do bufora - tylko do segmentu utworzonego przez tego klienta
+    prefix = BUFFER_PREFIX if pid is None else f"{BUFFER_PREFIX}{pid}_"
+    return isinstance(name, str) and name.startswith(prefix) and "/" not in name
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    buffer = shared_memory.SharedMemory(name=name)
+    # Bufor należy do klienta - resource tracker serwera nie może go usunąć przy wyjściu
+    if name not in _OWNED_BUFFERS:
+        resource_tracker.unregister(buffer._name, "shared_memory")
+    return buffer
+
+
+class ModelServer(socketserver.ThreadingUnixStreamServer):
+    """Jeden wątek na połączenie; współbieżne wywołania modeli łączy mikro-batching."""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, dense_model, sparse_model, reranker):
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        self.dense_model = dense_model
+        self.sparse_model = sparse_model
+        self.reranker = reranker
+        self.dim = dense_model.get_sentence_embedding_dimension()
+        super().__init__(socket_path, _Handler)
+
+    def server_bind(self):
+        # Gniazdo od razu z prawami 0600 (bez okna między bind a chmod) - tylko właściciel
+        umask = os.umask(0o177)
+        try:
+            super().server_bind()
+        finally:
+            os.umask(umask)
+
+    def execute(self, request: dict, buffer: shared_memory.SharedMemory) -> dict:
+        op = request["op"]
+        if op == "info":
+            return {"dim": self.dim}
+        if buffer is None:
+            raise RuntimeError("Brak bufora - połączenie nie wykonało 'attach'")
+
+        if op == "dense":
+            texts = request["texts"]
+            arrays = [np.asarray(self.dense_model.encode(texts), dtype=np.float32)]
+            meta = {"shape": list(arrays[0].shape)}
+        elif op == "sparse":
+            outputs = list(self.sparse_model.embed(request["texts"]))
+            # Bez tekstów (np.concatenate nie przyjmuje pustej listy) - puste tablice
+            indices = [o.indices for o in outputs] or [np.empty(0, np.int64)]
+            values = [o.values for o in outputs] or [np.empty(0, np.float32)]
+            arrays = [
+                np.concatenate(indices).astype(np.int64),
+                np.concatenate(values).astype(np.float32),
+            ]
+            meta = {"lengths": [len(o.indices) for o in outputs]}
+        elif op == "rerank":
+            pairs = request["pairs"]
+            arrays = [np.asarray(self.reranker.predict(pairs), dtype=np.float32)]
+            meta = {"shape": list(arrays[0].shape)}
+        else:
+            raise ValueError(f"Nieznana operacja: {op}")
+
+        needed = sum(array.nbytes for array in arrays)
+        if needed > buffer.size:
+            return {"needed": needed}
+        offset = 0
+        for array in arrays:
+            buffer.buf[offset : offset + array.nbytes] = array.tobytes()
+            offset += array.nbytes
+        return meta
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+
+# ===== KLIENT =====
+
+
+class ModelServerClient:
+    """
+    Połączenie z serwerem na wątek (węzły grafu działają w wątkach roboczych),
+    każde z własnym buforem pamięci współdzielonej. Bufory usuwa `close()` / wyjście procesu.
+    """
+
+    def __init__(self, socket_path: str, buffer_size: int = BUFFER_SIZE):
+        self.socket_path = socket_path
+        self.buffer_size = buffer_size
+        self._local = threading.local()
+        self._connections: List[Tuple[socket.socket, shared_memory.SharedMemory]] = []
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    def _connection(self, min_size: int = 0):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and conn[1].size >= min_size:
+            return conn
+        if conn is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(self.socket_path)
+        else:
+            sock = conn[0]
+            self._release(conn, close_socket=False)
+
+        size = max(self.buffer_size, min_size)
+        buffer = shared_memory.SharedMemory(name=_buffer_name(), create=True, size=size)
+        _OWNED_BUFFERS.add(buffer.name)
+        conn = (sock, buffer)
+        with self._lock:
+            self._connections.append(conn)
+        _send(sock, {"op": "attach", "name": buffer.name})
+        reply = _recv(sock)
+        if reply is None or "error" in reply:
+            self._local.conn = None
+            self._release(conn)
+            raise ConnectionError(f"Serwer modeli odrzucił bufor: {reply}")
+        self._local.conn = conn
+        return conn
+
+    def call(self, op: str, **fields) -> Tuple[dict, memoryview]:
+        sock, buffer = self._connection()
+        while True:
+            try:
+                _send(sock, {"op": op, **fields})
+                reply = _recv(sock)
+            except OSError:
+                reply = None
+            if reply is None:
+                # Bufor tego połączenia nie będzie już użyty - usuwamy go od razu, nie przy wyjściu
+                self._local.conn = None
+                self._release((sock, buffer))
+                raise ConnectionError("Serwer modeli zamknął połączenie")
+            if "error" in reply:
+                raise RuntimeError(f"Serwer modeli: {reply['error']}")
+            if "needed" not in reply:
+                return reply, buffer.buf
+            sock, buffer = self._connection(
+                min_size=max(reply["needed"], 2 * buffer.size)
+            )
+
+    def _release(self, conn, close_socket: bool = True):
+        sock, buffer = conn
+        with self._lock:
+            if conn in self._connections:
+                self._connections.remove(conn)
+        if close_socket:
+            sock.close()
+        buffer.close()
+        buffer.unlink()
+        _OWNED_BUFFERS.discard(buffer.name)
+
+    def close(self):
+        with self._lock:
+            connections = list(self._connections)
+        for conn in connections:
+            self._release(conn)
+
+
+class RemoteDenseEncoder:
+    """`encode` jak w SentenceTransformer (zapytania aplikacji, bez argumentów indeksowania)."""
+
+    def __init__(self, client: ModelServerClient):
+        self.client = client
+        self._dim = None
+
+    def encode(self, sentences, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        reply, buf = self.client.call("dense", texts=texts)
+        shape = tuple(reply["shape"])
+        vectors = np.frombuffer(buf, np.float32, count=int(np.prod(shape)))
+        vectors = vectors.reshape(shape).copy()
+        return vectors[0] if single else vectors
+
+    def get_sentence_embedding_dimension(self) -> int:
+        if self._dim is None:
+            self._dim = self.client.call("info")[0]["dim"]
+        return self._dim
+
+
+class RemoteSparseEncoder:
+    def __init__(self, client: ModelServerClient):
+        self.client = client
+
+    def embed(self, texts, **kwargs):
+        texts = list(texts)
+        reply, buf = self.client.call("sparse", texts=texts)
+        lengths = reply["lengths"]
+        total = sum(lengths)
+        indices = np.frombuffer(buf, np.int64, count=total).copy()
+        values = np.frombuffer(buf, np.float32, count=total, offset=total * 8).copy()
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        for start, stop in zip(offsets[:-1], offsets[1:]):
+            yield SparseOutput(indices=indices[start:stop], values=values[start:stop])
+
+
+class RemoteReranker:
+    def __init__(self, client: ModelServerClient):
+        self.client = client
+
+    def predict(self, sentences: Sequence[Sequence[str]], **kwargs):
+        pairs = [list(pair) for pair in sentences]
+        if not pairs:
+            return np.array([], dtype=np.float32)
+        reply, buf = self.client.call("rerank", pairs=pairs)
+        return np.frombuffer(buf, np.float32, count=reply["shape"][0]).copy()
+
+
+def main():
+    import config
+
+    parser = argparse.ArgumentParser(
+        description="Serwer embeddera, BM25 i rerankera dla workerów na tej maszynie."
+    )
+    parser.add_argument(
+        "--socket", default=config.MODEL_SERVER_SOCKET or DEFAULT_SOCKET
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=config.LOG_LEVEL, format="%(message)s")
+
+    # Serwer ładuje modele lokalnie - zasoby nie mogą być klientami samego siebie
+    config.MODEL_SERVER_SOCKET = None
+    names = ["dense_model", "sparse_model", "reranker"]
+    config.warmup(names)
+    server = ModelServer(args.socket, *(config.get(name) for name in names))
+    logger.info("🧠 Serwer modeli nasłuchuje na %s", args.socket)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
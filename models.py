@@ -10,8 +10,19 @@ class GraphState(TypedDict):
     context: str  # Znalezione filmy (tekst sformatowany)
     is_relevant: str  # Decyzja sędziego: "yes" lub "no"
     retry_count: int  # Licznik prób, żeby uniknąć nieskończonej pętli
+    rerank_scores: List[float]  # Wyniki cross-encodera dla znalezionych filmów
+    title_match: bool  # Filmy z indeksu tytułów (bez wyników cross-encodera)
     generation: str
     chat_history: Annotated[List[BaseMessage], add_messages]  # Historia rozmowy
+    destination: str  # Decyzja routera: vectorstore / web_search / general_chat
+    search_intent: Optional[dict]  # MovieSearchIntent z połączonego routera
+    answer_cached: bool  # Czy kontekst i odpowiedź pochodzą z cache'a odpowiedzi
+    answer_cache_key: Optional[dict]  # Filtry i zapytanie dla cache'a odpowiedzi
+    candidate_pool: Optional[dict]  # Pula kandydatów sesji (candidate_pool.py)
+    rewritten_queries: Optional[List[str]]  # Zapytania z rewritera (fan-out)
+    llm_skipped: Optional[
+        str
+    ]  # Węzeł, który pominął wywołanie LLM (limit w llm_scheduler.py)
 
 
 class RouteQuery(BaseModel):
@@ -31,6 +42,14 @@ class GradeDocuments(BaseModel):
     )
 
 
+class RewrittenQueries(BaseModel):
+    """Kilka alternatywnych zapytań wyszukiwania (tryb fan-out rewritera)."""
+
+    queries: List[str] = Field(
+        description="Różne zapytania po angielsku, od najbardziej prawdopodobnego. Same słowa kluczowe fabuły, tematu i gatunku."
+    )
+
+
 class MovieSearchIntent(BaseModel):
     """
     Struktura interpretacji pytania o film.
@@ -86,3 +105,16 @@ class MovieSearchIntent(BaseModel):
         None,
         description="Tytuł konkretnego filmu, o który pyta użytkownik (przetłumaczony na angielski, np. 'Ashes and Diamonds', 'The Matrix'). Wypełnij TYLKO, gdy użytkownik pyta wprost o dany tytuł.",
     )
+
+
+class RoutedSearchIntent(BaseModel):
+    """Decyzja routera razem z pełną intencją wyszukiwania (jedno wywołanie LLM zamiast dwóch)."""
+
+    destination: Literal["vectorstore", "web_search", "general_chat"] = Field(
+        ...,
+        description="Gdzie skierować pytanie: 'vectorstore' dla rekomendacji filmowych, 'web_search' dla aktualnych wydarzeń/repertuaru, 'general_chat' dla zwykłej rozmowy.",
+    )
+    search_intent: Optional[MovieSearchIntent] = Field(
+        None,
+        description="Interpretacja pytania o film. Wypełnij TYLKO, gdy destination == 'vectorstore'.",
+    )
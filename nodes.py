@@ -1,11 +1,39 @@
+import logging
+import threading
+from collections import Counter
+from statistics import median
+from typing import List, Optional
+
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.messages import AIMessage
-from langchain_community.tools import DuckDuckGoSearchRun
-
-from models import GraphState, RouteQuery
-from utils import retrieve_movies
-from config import grader_chain, rewriter_chain, llm_generator, llm_router
+from langchain_core.messages import AIMessage, RemoveMessage, SystemMessage
+from langgraph.graph import END
+from langgraph.graph.message import REMOVE_ALL_MESSAGES
+
+from models import GraphState, MovieSearchIntent
+from utils import (
+    aanalyze_intent,
+    aencode_query,
+    analyze_intent,
+    aretrieve_movies,
+    aretrieve_movies_fanout,
+    build_search_query,
+    encode_query,
+    HISTORY_SUMMARY_ID,
+    intent_filter_key,
+    MAX_HISTORY_LENGTH,
+    recent_history,
+    retrieve_movies,
+    retrieve_movies_fanout,
+    run_inference,
+)
+from candidate_pool import is_narrower, wants_more
+from fast_path import count, fallback_intent, local_intent
+from llm_scheduler import LLMUnavailable
+from telemetry import incr, observe, span
+import config
+
+logger = logging.getLogger(__name__)
 
 template = """Jesteś ekspertem filmowym. Odpowiedz na pytanie użytkownika na podstawie poniższych fragmentów filmów. Krótko opisz każdy z filmów.
 Jeśli w kontekście nie ma odpowiedzi, powiedz, że nie wiesz. Nie wymyślaj filmów spoza kontekstu.
@@ -20,112 +48,695 @@ ODPOWIEDŹ:"""
 
 prompt = ChatPromptTemplate.from_template(template)
 
+# Odpowiedź, gdy generator nie dostał przydziału LLM przed terminem
+BUSY_ANSWER = (
+    "⏳ Serwis jest teraz przeciążony i nie zdążyłem przygotować odpowiedzi. "
+    "Spróbuj ponownie za chwilę."
+)
+
+
+# Węzły mają wersje async (przedrostek `a`) dla `app.ainvoke` / `app.astream`: LLM i Qdrant
+# przez klientów async, modele w puli `config.inference_executor`. Logika jest wspólna.
+
 
 def retrieve_node(state: GraphState):
+    query_to_use = _retrieve_query(state)
+    try:
+        intent = analyze_intent(
+            query_to_use, state["chat_history"], _known_intent(state)
+        )
+    except LLMUnavailable:
+        intent = None
+
+    # Klucz cache'a odpowiedzi liczymy dla pierwotnej intencji - przepisane zapytania go nie zmieniają
+    answer_cache_key = state.get("answer_cache_key")
+    if intent is None:
+        intent, answer_cache_key = _skip_analyzer(query_to_use), None
+    elif _uses_answer_cache(state, intent):
+        answer_cache_key = _answer_cache_key(intent, query_to_use)
+        cached = _cached_answer(
+            answer_cache_key, encode_query(answer_cache_key["query"])[0]
+        )
+        if cached is not None:
+            return cached
+
+    rewritten_queries = state.get("rewritten_queries")
+    if rewritten_queries:
+        # Fan-out: filtry z pierwszej próby, tematy z rewritera - bez ponownej analizy
+        results = retrieve_movies_fanout(rewritten_queries, intent)
+    else:
+        results = retrieve_movies(
+            query_to_use, state["chat_history"], intent, **_pool_args(state)
+        )
+    return _retrieved(results, intent, answer_cache_key)
+
+
+async def aretrieve_node(state: GraphState):
+    query_to_use = _retrieve_query(state)
+    try:
+        intent = await aanalyze_intent(
+            query_to_use,
+            state["chat_history"],
+            _known_intent(state),
+            prefetch_query=state.get("retry_count", 0) > 0,
+        )
+    except LLMUnavailable:
+        intent = None
+
+    answer_cache_key = state.get("answer_cache_key")
+    if intent is None:
+        intent, answer_cache_key = _skip_analyzer(query_to_use), None
+    elif _uses_answer_cache(state, intent):
+        answer_cache_key = _answer_cache_key(intent, query_to_use)
+        query_dense = (await aencode_query(answer_cache_key["query"]))[0]
+        cached = _cached_answer(answer_cache_key, query_dense)
+        if cached is not None:
+            return cached
+
+    rewritten_queries = state.get("rewritten_queries")
+    if rewritten_queries:
+        results = await aretrieve_movies_fanout(rewritten_queries, intent)
+    else:
+        results = await aretrieve_movies(
+            query_to_use, state["chat_history"], intent, **_pool_args(state)
+        )
+    return _retrieved(results, intent, answer_cache_key)
+
+
+def _skip_analyzer(query: str) -> MovieSearchIntent:
+    # Bez klucza cache'a odpowiedzi: intencja z reguł nie jest pełną interpretacją pytania
+    logger.info("   -> ⏭️  Analizator pominięty (limit LLM) - szukam bez jego filtrów.")
+    incr("llm.skipped.analyze_intent")
+    return fallback_intent(query)
+
+
+def _retrieve_query(state: GraphState) -> str:
     query_to_use = state.get("synthesized_query") or state["question"]
-    print(
-        f"\n--- RETRIEVE: Szukam filmów dla: '{query_to_use} i historii {state['chat_history']}' ---"
+    logger.info(
+        "\n--- RETRIEVE: Szukam filmów dla: '%s' (historia: %d wiadomości) ---",
+        query_to_use,
+        len(state["chat_history"]),
     )
-    documents, synthesized_query = retrieve_movies(query_to_use, state["chat_history"])
+    logger.debug("   -> Historia: %s", state["chat_history"])
+    return query_to_use
+
+
+def _known_intent(state: GraphState) -> Optional[MovieSearchIntent]:
+    search_intent = state.get("search_intent")
+    return MovieSearchIntent(**search_intent) if search_intent else None
+
 
-    return {"context": documents, "synthesized_query": synthesized_query}
+def _uses_answer_cache(state: GraphState, intent: MovieSearchIntent) -> bool:
+    """
+    Cache odpowiedzi tylko dla pierwszej próby i pytań spoza puli kandydatów: "pokaż więcej"
+    albo zawężenie puli ma te same filtry i prawie ten sam temat co poprzednia tura, więc
+    trafiłoby w jej odpowiedź zamiast w kolejną stronę / przefiltrowaną pulę.
+    """
+    if state.get("retry_count", 0) > 0 or config.ANSWER_CACHE_SIZE <= 0:
+        return False
+    if not config.CANDIDATE_POOL:
+        return True
+    pool = state.get("candidate_pool")
+    if wants_more(state["question"]) or (
+        pool and is_narrower(intent, MovieSearchIntent(**pool["intent"]))
+    ):
+        incr("cache.answer.pool_bypass")
+        return False
+    return True
+
+
+def _answer_cache_key(intent: MovieSearchIntent, query_to_use: str) -> dict:
+    return {
+        "filters": intent_filter_key(intent),
+        "query": build_search_query(intent, query_to_use),
+    }
+
+
+def _cached_answer(answer_cache_key: dict, query_dense) -> Optional[dict]:
+    cached = config.answer_cache.lookup(answer_cache_key["filters"], query_dense)
+    incr("cache.answer.hit" if cached is not None else "cache.answer.miss")
+    if cached is None:
+        return None
+    logger.info("   -> Odpowiedź znaleziona w cache'u.")
+    context, generation = cached
+    return {
+        "context": context,
+        "generation": generation,
+        "synthesized_query": answer_cache_key["query"],
+        "rerank_scores": [],
+        "title_match": False,
+        "is_relevant": "yes",
+        "answer_cached": True,
+        "answer_cache_key": answer_cache_key,
+    }
+
+
+def _pool_args(state: GraphState) -> dict:
+    # Pula z poprzedniej tury tylko dla pierwszej próby - po przepisaniu szukamy od nowa
+    first_try = state.get("retry_count", 0) == 0
+    return {
+        "pool": state.get("candidate_pool") if first_try else None,
+        "question": state["question"],
+    }
+
+
+def _retrieved(
+    results: tuple, intent: MovieSearchIntent, answer_cache_key: Optional[dict]
+) -> dict:
+    documents, synthesized_query, rerank_scores, candidate_pool = results
+    return {
+        "context": documents,
+        "synthesized_query": synthesized_query,
+        "rerank_scores": rerank_scores or [],
+        "title_match": rerank_scores is None,
+        "candidate_pool": candidate_pool,
+        "search_intent": intent.model_dump(),
+        "answer_cached": False,
+        "answer_cache_key": answer_cache_key,
+    }
+
+
+def decide_after_retrieve(state: GraphState):
+    return "generate" if state.get("answer_cached") else "grade_documents"
+
+
+# Ile razy sędzia zdecydował lokalnie (fast_yes / fast_no / title), a ile razy pytał LLM
+grader_stats = Counter()
+_grader_stats_lock = threading.Lock()
+
+
+def _count_grade(outcome: str):
+    with _grader_stats_lock:
+        grader_stats[outcome] += 1
+    incr(f"grader.{outcome}")
+
+
+def fast_path_rate() -> float:
+    total = sum(grader_stats.values())
+    fast = grader_stats["fast_yes"] + grader_stats["fast_no"] + grader_stats["title"]
+    return fast / total if total else 0.0
+
+
+def fast_grade(rerank_scores: List[float]) -> Optional[str]:
+    """
+    Ocena trafności na podstawie wyników cross-encodera. Zwraca 'yes' / 'no',
+    albo None, gdy najlepszy wynik leży w strefie niepewności między progami
+    albo ranking jest płaski: najlepszy wynik ledwo przekracza próg i nie odstaje
+    od mediany wyników (o mniej niż FAST_GRADER_MARGIN).
+    """
+    if not rerank_scores:
+        return None
+    best = max(rerank_scores)
+    if best <= config.FAST_GRADER_REJECT:
+        return "no"
+    if best < config.FAST_GRADER_ACCEPT:
+        return None
+    typical = median(rerank_scores)
+    if typical >= config.FAST_GRADER_ACCEPT:
+        return "yes"
+    if best - typical >= config.FAST_GRADER_MARGIN or len(rerank_scores) == 1:
+        return "yes"
+    return None
 
 
 def grade_documents_node(state: GraphState):
-    print("--- CHECK: Sędzia ocenia wyniki... ---")
-    question = state["synthesized_query"]
-    context = state["context"]
+    decision = _grade_locally(state)
+    if decision is not None:
+        return decision
+
+    _count_grade("llm")
+    try:
+        with span("grader.llm"):
+            scored_result = config.grader_chain.invoke(
+                {"question": state["synthesized_query"], "context": state["context"]}
+            )
+    except LLMUnavailable:
+        return _skip_grader()
+    logger.info("   -> Decyzja: %s", scored_result.binary_score)
 
-    if "Nie znaleziono filmów" in context:
-        print("   -> Pusty wynik z Qdranta.")
-        return {"is_relevant": "no"}
+    return {"is_relevant": scored_result.binary_score}
 
-    scored_result = grader_chain.invoke({"question": question, "context": context})
-    print(f"   -> Decyzja: {scored_result.binary_score}")
+
+async def agrade_documents_node(state: GraphState):
+    decision = _grade_locally(state)
+    if decision is not None:
+        return decision
+
+    _count_grade("llm")
+    try:
+        with span("grader.llm"):
+            scored_result = await config.grader_chain.ainvoke(
+                {"question": state["synthesized_query"], "context": state["context"]}
+            )
+    except LLMUnavailable:
+        return _skip_grader()
+    logger.info("   -> Decyzja: %s", scored_result.binary_score)
 
     return {"is_relevant": scored_result.binary_score}
 
 
+def _skip_grader() -> dict:
+    # Bez budżetu LLM lepiej odpowiedzieć z tym, co znalazł reranker, niż kazać czekać
+    logger.info("   -> ⏭️  Sędzia pominięty (limit LLM) - przyjmuję wyniki.")
+    incr("llm.skipped.grade_documents")
+    return {"is_relevant": "yes", "llm_skipped": "grade_documents"}
+
+
+def _grade_locally(state: GraphState) -> Optional[dict]:
+    """Decyzja bez LLM (pusty wynik albo szybki sędzia) lub None."""
+    logger.info("--- CHECK: Sędzia ocenia wyniki... ---")
+
+    if "Nie znaleziono filmów" in state["context"]:
+        logger.info("   -> Pusty wynik z Qdranta.")
+        return {"is_relevant": "no"}
+
+    if config.GRADER_MODE == "fast" and state.get("title_match"):
+        # Film wskazany tytułem - indeks tytułów już sprawdził zgodność, nie ma czego oceniać
+        _count_grade("title")
+        logger.info("   -> Decyzja: yes (film z indeksu tytułów)")
+        return {"is_relevant": "yes"}
+
+    if config.GRADER_MODE == "fast":
+        decision = fast_grade(state.get("rerank_scores") or [])
+        if decision is not None:
+            _count_grade(f"fast_{decision}")
+            logger.info(
+                "   -> Decyzja (reranker): %s (szybka ścieżka: %.0f%%)",
+                decision,
+                fast_path_rate() * 100,
+            )
+            return {"is_relevant": decision}
+    return None
+
+
 def rewrite_query_node(state: GraphState):
-    print("--- REWRITE: Przepisuję zapytanie... ---")
+    logger.info("--- REWRITE: Przepisuję zapytanie... ---")
+    question = state["synthesized_query"]
+
+    try:
+        if config.REWRITE_MODE == "fanout":
+            with span("rewriter.llm", mode="fanout"):
+                rewritten = config.multi_rewriter_chain.invoke({"question": question})
+            return _fanout_rewrite(state, rewritten.queries)
 
+        with span("rewriter.llm"):
+            better_question = config.rewriter_chain.invoke({"question": question})
+    except LLMUnavailable:
+        return _skip_rewrite()
+    return _sequential_rewrite(state, better_question)
+
+
+async def arewrite_query_node(state: GraphState):
+    logger.info("--- REWRITE: Przepisuję zapytanie... ---")
     question = state["synthesized_query"]
+
+    try:
+        if config.REWRITE_MODE == "fanout":
+            with span("rewriter.llm", mode="fanout"):
+                rewritten = await config.multi_rewriter_chain.ainvoke(
+                    {"question": question}
+                )
+            return _fanout_rewrite(state, rewritten.queries)
+
+        with span("rewriter.llm"):
+            better_question = await config.rewriter_chain.ainvoke(
+                {"question": question}
+            )
+    except LLMUnavailable:
+        return _skip_rewrite()
+    return _sequential_rewrite(state, better_question)
+
+
+def _skip_rewrite() -> dict:
+    logger.info(
+        "   -> ⏭️  Rewriter pominięty (limit LLM) - generuję z obecnymi wynikami."
+    )
+    incr("llm.skipped.rewrite_query")
+    return {"llm_skipped": "rewrite_query"}
+
+
+def decide_after_rewrite(state: GraphState):
+    return "generate" if state.get("llm_skipped") == "rewrite_query" else "retrieve"
+
+
+def _fanout_rewrite(state: GraphState, rewritten_queries: List[str]) -> dict:
     retry_count = state["retry_count"] + 1
+    incr("graph.rewrites")
+    queries = [q.strip() for q in rewritten_queries if q.strip()]
+    queries = queries[: config.REWRITE_FANOUT] or [state["synthesized_query"]]
+    logger.info("   -> Nowe zapytania (%d): %s", len(queries), queries)
+
+    # Intencja (filtry) z pierwszej próby zostaje - zmieniają się tylko tematy wyszukiwania
+    return {
+        "synthesized_query": queries[0],
+        "rewritten_queries": queries,
+        "retry_count": retry_count,
+    }
+
 
-    better_question = rewriter_chain.invoke({"question": question})
+def _sequential_rewrite(state: GraphState, better_question: str) -> dict:
+    retry_count = state["retry_count"] + 1
+    incr("graph.rewrites")
 
-    print(f"   -> Nowe zapytanie (próba {retry_count}): '{better_question}'")
+    logger.info("   -> Nowe zapytanie (próba %d): '%s'", retry_count, better_question)
 
-    return {"synthesized_query": better_question, "retry_count": retry_count}
+    # Intencja z routera dotyczyła poprzedniego zapytania - po przepisaniu analizujemy od nowa
+    return {
+        "synthesized_query": better_question,
+        "retry_count": retry_count,
+        "search_intent": None,
+    }
 
 
 def generate_node(state: GraphState):
-    print("--- GENERATE: Generuję odpowiedź końcową... ---")
+    cached = _cached_generation(state)
+    if cached is not None:
+        return cached
+
+    chain, inputs, mode = _generation_chain(state)
+    try:
+        with span("generate.llm", mode=mode):
+            response = chain.invoke(inputs)
+    except LLMUnavailable:
+        return _busy_answer()
+
+    answer_cache_key = state.get("answer_cache_key")
+    if mode == "rag" and answer_cache_key and _verified(state):
+        config.answer_cache.put(
+            answer_cache_key["filters"],
+            encode_query(answer_cache_key["query"])[0],
+            state["context"],
+            response,
+        )
+
+    return {"generation": response, "chat_history": [AIMessage(content=response)]}
+
+
+async def agenerate_node(state: GraphState):
+    cached = _cached_generation(state)
+    if cached is not None:
+        return cached
+
+    chain, inputs, mode = _generation_chain(state)
+    try:
+        with span("generate.llm", mode=mode):
+            response = await chain.ainvoke(inputs)
+    except LLMUnavailable:
+        return _busy_answer()
+
+    answer_cache_key = state.get("answer_cache_key")
+    if mode == "rag" and answer_cache_key and _verified(state):
+        config.answer_cache.put(
+            answer_cache_key["filters"],
+            (await aencode_query(answer_cache_key["query"]))[0],
+            state["context"],
+            response,
+        )
+
+    return {"generation": response, "chat_history": [AIMessage(content=response)]}
+
+
+def _busy_answer() -> dict:
+    logger.info(
+        "   -> ⏳ Generator bez przydziału LLM - odpowiadam, że serwis jest zajęty."
+    )
+    incr("llm.skipped.generate")
+    return {"generation": BUSY_ANSWER, "chat_history": [AIMessage(content=BUSY_ANSWER)]}
+
+
+def _verified(state: GraphState) -> bool:
+    # Do cache'a odpowiedzi tylko wyniki zaakceptowane przez sędziego (nie pominiętego)
+    return state.get("is_relevant") == "yes" and not state.get("llm_skipped")
 
+
+def _cached_generation(state: GraphState) -> Optional[dict]:
+    logger.info("--- GENERATE: Generuję odpowiedź końcową... ---")
+    observe("graph.retry_count", state.get("retry_count") or 0)
+
+    if not state.get("answer_cached"):
+        return None
+    logger.info("   -> Tryb: odpowiedź z cache'a")
+    response = state["generation"]
+    return {"generation": response, "chat_history": [AIMessage(content=response)]}
+
+
+def _generation_chain(state: GraphState):
+    """Łańcuch odpowiedzi, jego wejście i tryb ('chat' albo 'rag')."""
     context = state.get("context", "")
     question = state["question"]
 
     # 1. TRYB CHAT (Brak kontekstu z bazy/internetu -> luźna rozmowa)
     if not context:
-        print("   -> Tryb: General Chat")
+        logger.info("   -> Tryb: General Chat")
         chat_template = """Jesteś ekspertem filmowym. Rozmawiaj swobodnie z użytkownikiem. 
         Bądź pomocny, uprzejmy i wykazuj się wiedzą o kinie, ale nie zmyślaj faktów.
         
         PYTANIE UŻYTKOWNIKA: {question}
         """
         chat_prompt = ChatPromptTemplate.from_template(chat_template)
+        chat_chain = chat_prompt | config.llm_generator | StrOutputParser()
+        return chat_chain, {"question": question}, "chat"
 
-        chat_chain = chat_prompt | llm_generator | StrOutputParser()
-        response = chat_chain.invoke({"question": question})
+    logger.info("   -> Tryb: RAG / Context QA")
+    rag_chain = prompt | config.llm_generator | StrOutputParser()
+    query_to_use = state.get("synthesized_query") or question
+    return rag_chain, {"context": context, "question": query_to_use}, "rag"
 
-    else:
-        print("   -> Tryb: RAG / Context QA")
-        rag_chain = prompt | llm_generator | StrOutputParser()
-        query_to_use = state.get("synthesized_query") or question
 
-        response = rag_chain.invoke({"context": context, "question": query_to_use})
+def decide_after_generate(state: GraphState):
+    if config.HISTORY_COMPACTION == "off":
+        return END
+    # Streszczenie nie liczy się do limitu - inaczej kompakcja szłaby po każdej turze
+    turns = [m for m in state["chat_history"] if m.id != HISTORY_SUMMARY_ID]
+    if len(turns) > config.HISTORY_MAX_MESSAGES:
+        return "compact_history"
+    return END
 
-    return {"generation": response, "chat_history": [AIMessage(content=response)]}
+
+def compact_history_node(state: GraphState):
+    """
+    Skraca historię rozmowy do ostatnich MAX_HISTORY_LENGTH wiadomości (tyle i tak trafia
+    do analizatora intencji). Starsze są usuwane albo zastępowane jednym streszczeniem.
+    """
+    older, recent = _split_history(state)
+    if config.HISTORY_COMPACTION == "summarize":
+        try:
+            with span("history.summarize", messages=len(older)):
+                summary = config.summarizer_chain.invoke({"chat_history": older})
+            return _summarized_history(summary, recent)
+        except LLMUnavailable:
+            _skip_summary()
+    return {"chat_history": [RemoveMessage(id=message.id) for message in older]}
+
+
+async def acompact_history_node(state: GraphState):
+    older, recent = _split_history(state)
+    if config.HISTORY_COMPACTION == "summarize":
+        try:
+            with span("history.summarize", messages=len(older)):
+                summary = await config.summarizer_chain.ainvoke({"chat_history": older})
+            return _summarized_history(summary, recent)
+        except LLMUnavailable:
+            _skip_summary()
+    return {"chat_history": [RemoveMessage(id=message.id) for message in older]}
+
+
+def _split_history(state: GraphState):
+    chat_history = state["chat_history"]
+    older = chat_history[:-MAX_HISTORY_LENGTH]
+    recent = chat_history[-MAX_HISTORY_LENGTH:]
+    logger.info(
+        "--- COMPACT HISTORY: %d starszych wiadomości (%s) ---",
+        len(older),
+        config.HISTORY_COMPACTION,
+    )
+    incr("history.compactions")
+    return older, recent
+
+
+def _skip_summary():
+    # Bez streszczenia starsze wiadomości są po prostu usuwane (jak HISTORY_COMPACTION=drop)
+    logger.info(
+        "   -> ⏭️  Streszczenie pominięte (limit LLM) - usuwam starsze wiadomości."
+    )
+    incr("llm.skipped.compact_history")
+
+
+def _summarized_history(summary: str, recent: list) -> dict:
+    # Streszczenie (także poprzednie, już w `older`) ma stać na początku historii
+    return {
+        "chat_history": [
+            RemoveMessage(id=REMOVE_ALL_MESSAGES),
+            SystemMessage(
+                content=f"Streszczenie wcześniejszej rozmowy: {summary}",
+                id=HISTORY_SUMMARY_ID,
+            ),
+            *recent,
+        ]
+    }
 
 
 def decide_next_step(state):
+    # Fan-out sprawdza wszystkie alternatywne zapytania w jednej rundzie
+    max_retries = 1 if config.REWRITE_MODE == "fanout" else 3
     if state["is_relevant"] == "yes":
         return "generate"
     else:
-        if state["retry_count"] >= 3:
-            print("--- MAX RETRIES: Poddaję się, generuję z tym co mam. ---")
+        if state["retry_count"] >= max_retries:
+            logger.info("--- MAX RETRIES: Poddaję się, generuję z tym co mam. ---")
             return "generate"
         return "rewrite_query"
 
 
 def route_question(state):
-    print("--- ROUTE QUESTION ---")
+    logger.info("--- ROUTE QUESTION ---")
     question = state["question"]
 
-    system = """Jesteś ekspertem kierującym ruchem w asystencie filmowym.
-    - Jeśli użytkownik prosi o rekomendację filmu, szuka fabuły, gatunku LUB pyta o szczegóły konkretnego filmu -> 'vectorstore'.
-    - Jeśli pyta o aktualności, box office, premiery z tego roku, repertuar kin -> 'web_search'.
-    - Jeśli użytkownik pyta o aktorów (nie w kontekście szukania filmu), życie prywatne reżyserów lub luźno rozmawia -> 'general_chat'.
-    """
+    with span("router.llm"):
+        decision = config.route_chain.invoke({"question": question})
 
-    prompt = ChatPromptTemplate.from_messages(
-        [
-            ("system", system),
-            ("human", "{question}"),
-        ]
-    )
+    return decision.destination
+
+
+async def aroute_question(state):
+    logger.info("--- ROUTE QUESTION ---")
 
-    router = prompt | llm_router.with_structured_output(RouteQuery)
-    decision = router.invoke({"question": question})
+    with span("router.llm"):
+        decision = await config.route_chain.ainvoke({"question": state["question"]})
 
     return decision.destination
 
 
+# Stan poprzedniej tury zerowany na wejściu grafu
+ROUTE_RESET = {
+    "answer_cached": False,
+    "answer_cache_key": None,
+    "rewritten_queries": None,
+    "llm_skipped": None,
+}
+
+
+def route_node(state: GraphState):
+    """
+    Węzeł wejściowy grafu. W trybie 'combined' jedno wywołanie LLM zwraca cel i intencję
+    wyszukiwania, którą `retrieve_node` wykorzystuje zamiast ponownej analizy pytania.
+    Z włączoną szybką ścieżką najpierw próbuje lokalnego routera i reguł dla filtrów.
+    Zeruje też stan cache'a odpowiedzi i zapytania rewritera z poprzedniej tury.
+    """
+    return {**ROUTE_RESET, **_route(state)}
+
+
+async def aroute_node(state: GraphState):
+    return {**ROUTE_RESET, **(await _aroute(state))}
+
+
+def _route(state: GraphState):
+    routed = _route_local(state)
+    if routed is not None:
+        return routed
+
+    count("router_llm")
+    try:
+        if config.ROUTING_MODE != "combined":
+            return {"destination": route_question(state), "search_intent": None}
+
+        logger.info("--- ROUTE QUESTION (+ INTENT) ---")
+        with span("router.llm", mode="combined"):
+            decision = config.route_and_analyze_chain.invoke(_route_inputs(state))
+    except LLMUnavailable:
+        return _skip_router(state)
+    return _routed(decision)
+
+
+async def _aroute(state: GraphState):
+    routed = await run_inference(_route_local, state)
+    if routed is not None:
+        return routed
+
+    count("router_llm")
+    try:
+        if config.ROUTING_MODE != "combined":
+            return {
+                "destination": await aroute_question(state),
+                "search_intent": None,
+            }
+
+        logger.info("--- ROUTE QUESTION (+ INTENT) ---")
+        with span("router.llm", mode="combined"):
+            decision = await config.route_and_analyze_chain.ainvoke(
+                _route_inputs(state)
+            )
+    except LLMUnavailable:
+        return _skip_router(state)
+    return _routed(decision)
+
+
+def _skip_router(state: GraphState) -> dict:
+    # Pytania trafiające do grafu to głównie wyszukiwanie filmów - bez routera idziemy tam
+    logger.info("   -> ⏭️  Router pominięty (limit LLM) - szukam w bazie filmów.")
+    incr("llm.skipped.route")
+    return {
+        "destination": "vectorstore",
+        "search_intent": fallback_intent(state["question"]).model_dump(),
+        "llm_skipped": "route",
+    }
+
+
+def _route_local(state: GraphState) -> Optional[dict]:
+    """Decyzja lokalnego routera i reguł (FAST_PATH) albo None, gdy potrzebny jest LLM."""
+    if not config.FAST_PATH:
+        return None
+    destination, similarity = config.local_router.route(state["question"])
+    if destination is None:
+        return None
+
+    count("router_local")
+    logger.info("--- ROUTE (lokalnie): %s (%.2f) ---", destination, similarity)
+    if destination != "vectorstore":
+        return {"destination": destination, "search_intent": None}
+
+    intent = local_intent(state["question"], state["chat_history"])
+    if intent is not None:
+        return {"destination": destination, "search_intent": intent.model_dump()}
+    if config.ROUTING_MODE != "combined":
+        return {"destination": destination, "search_intent": None}
+    return None
+
+
+def _route_inputs(state: GraphState) -> dict:
+    return {
+        "query": state["question"],
+        "chat_history": recent_history(state["chat_history"]),
+    }
+
+
+def _routed(decision) -> dict:
+    search_intent = None
+    if decision.destination == "vectorstore" and decision.search_intent is not None:
+        search_intent = decision.search_intent.model_dump()
+
+    logger.info("   -> Cel: %s", decision.destination)
+    return {"destination": decision.destination, "search_intent": search_intent}
+
+
+def decide_route(state: GraphState):
+    return state["destination"]
+
+
 def web_search_node(state):
-    print("--- WEB SEARCH ---")
+    logger.info("--- WEB SEARCH ---")
     question = state["question"]
 
-    search = DuckDuckGoSearchRun()
-    results = search.invoke(question)
+    with span("web_search"):
+        results = config.web_search_tool.invoke(question)
+
+    return {"context": results, "is_relevant": "yes"}
+
+
+async def aweb_search_node(state):
+    logger.info("--- WEB SEARCH ---")
+
+    with span("web_search"):
+        results = await config.web_search_tool.ainvoke(state["question"])
 
     return {"context": results, "is_relevant": "yes"}
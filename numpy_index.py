@@ -0,0 +1,458 @@
+"""
+Wyszukiwanie hybrydowe w procesie, bez serwera bazy danych.
+
+Przefiltrowany katalog TMDB jest na tyle mały, że dokładne wyszukiwanie w NumPy jest szybsze
+niż podróż sieciowa do Qdranta. Indeks to katalog z plikami:
+  - `dense.npy`   - macierz float16 (N x D) znormalizowanych wektorów, czytana przez mmap,
+  - `sparse_*.npy` - wektory BM25 w układzie kolumnowym (term -> dokumenty, czyli CSR macierzy
+                     transponowanej), bo zapytanie potrzebuje tylko kilku kolumn,
+  - `col_*.npy`   - kolumny liczbowe (rok, ocena, głosy, czas trwania, popularność; NaN = brak)
+                     i `adult`,
+  - `kw_*.npy`    - pola słownikowe: bitsety uint64 dla małych słowników (gatunki),
+                     listy wierszy dla dużych (wytwórnie, kraje),
+  - `payloads.jsonl` + `payload_offsets.npy` - payloady czytane przez mmap tylko dla wyników.
+
+Filtry (`models.Filter` z `utils.build_qdrant_filter`) są liczone wektorowo jako maska
+wierszy przed wyszukiwaniem. Obie gałęzie są dokładne (pełny iloczyn skalarny), a listy
+łączy RRF. Indeks buduje się eksportem istniejącej kolekcji Qdranta:
+
+    python numpy_index.py --out numpy_index
+"""
+
+import argparse
+import json
+import mmap
+import os
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from qdrant_client import QdrantClient, models
+
+from backends import PREFETCH_LIMIT, RRF_K, PayloadSelector, SearchBackend
+from config import COLLECTION_NAME, INDEX_EPOCH_PATH, NUMPY_INDEX_PATH, QDRANT_URL
+
+NUMERIC_FIELDS = ["year", "vote_average", "vote_count", "runtime", "popularity"]
+BOOL_FIELDS = ["adult"]
+KEYWORD_FIELDS = [
+    "genres",
+    "original_language",
+    "production_companies",
+    "production_countries",
+]
+# Słowniki do tej wielkości są zapisywane jako bitset (jeden uint64 na film)
+BITSET_MAX_VOCAB = 64
+# Wiersze macierzy dense mnożone naraz (float16 -> float32 w blokach, bez kopii całej macierzy)
+DENSE_BLOCK_ROWS = 65536
+
+
+def _as_list(value) -> list:
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def _top_k(scores: np.ndarray, rows: np.ndarray, k: int) -> np.ndarray:
+    """Wiersze `k` najwyższych wyników, posortowane malejąco."""
+    if len(rows) > k:
+        part = np.argpartition(-scores, k - 1)[:k]
+        scores, rows = scores[part], rows[part]
+    return rows[np.argsort(-scores, kind="stable")]
+
+
+class NumpyBackend(SearchBackend):
+    def __init__(self, path: str = NUMPY_INDEX_PATH):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+
+        self.ids = np.load(os.path.join(path, "ids.npy"))
+        self._id_order = np.argsort(self.ids)
+        self.dense = np.load(os.path.join(path, "dense.npy"), mmap_mode="r")
+
+        self.sparse_terms = self._load("sparse_terms")
+        self.sparse_indptr = self._load("sparse_indptr")
+        self.sparse_rows = self._load("sparse_rows")
+        self.sparse_values = self._load("sparse_values")
+
+        self.numeric = {name: self._load(f"col_{name}") for name in NUMERIC_FIELDS}
+        self.booleans = {name: self._load(f"col_{name}") for name in BOOL_FIELDS}
+
+        self.vocab: Dict[str, Dict[str, int]] = {
+            name: {value: i for i, value in enumerate(values)}
+            for name, values in self.meta["keyword_vocab"].items()
+        }
+        self.keywords = {}
+        for name in KEYWORD_FIELDS:
+            if self.meta["keyword_layout"][name] == "bitset":
+                self.keywords[name] = self._load(f"kw_{name}")
+            else:
+                self.keywords[name] = (
+                    self._load(f"kw_{name}_indptr"),
+                    self._load(f"kw_{name}_rows"),
+                )
+
+        self._payload_offsets = self._load("payload_offsets")
+        self._payload_file = open(os.path.join(path, "payloads.jsonl"), "rb")
+        self._payloads = mmap.mmap(
+            self._payload_file.fileno(), 0, access=mmap.ACCESS_READ
+        )
+
+    def _load(self, name: str) -> np.ndarray:
+        return np.load(os.path.join(self.path, f"{name}.npy"))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    # ===== FILTRY =====
+
+    def filter_mask(
+        self, qdrant_filter: Optional[models.Filter]
+    ) -> Optional[np.ndarray]:
+        """Maska wierszy spełniających filtr (None = wszystkie wiersze)."""
+        if qdrant_filter is None:
+            return None
+        mask = np.ones(len(self), dtype=bool)
+        for condition in _as_list(qdrant_filter.must):
+            mask &= self._condition_mask(condition)
+        should = _as_list(qdrant_filter.should)
+        if should:
+            any_mask = np.zeros(len(self), dtype=bool)
+            for condition in should:
+                any_mask |= self._condition_mask(condition)
+            mask &= any_mask
+        for condition in _as_list(qdrant_filter.must_not):
+            mask &= ~self._condition_mask(condition)
+        return mask
+
+    def _condition_mask(self, condition) -> np.ndarray:
+        if isinstance(condition, models.Filter):
+            return self.filter_mask(condition)
+        if not isinstance(condition, models.FieldCondition):
+            raise TypeError(f"Nieobsługiwany warunek: {type(condition)}")
+
+        key = condition.key
+        if condition.range is not None:
+            if key not in self.numeric:
+                raise ValueError(f"Brak kolumny liczbowej: {key}")
+            column = self.numeric[key]
+            mask = ~np.isnan(column)
+            r = condition.range
+            if r.gte is not None:
+                mask &= column >= r.gte
+            if r.gt is not None:
+                mask &= column > r.gt
+            if r.lte is not None:
+                mask &= column <= r.lte
+            if r.lt is not None:
+                mask &= column < r.lt
+            return mask
+
+        match = condition.match
+        if isinstance(match, models.MatchValue):
+            values = [match.value]
+        elif isinstance(match, models.MatchAny):
+            values = list(match.any)
+        else:
+            raise TypeError(f"Nieobsługiwane dopasowanie: {type(match)}")
+
+        if key in self.booleans:
+            column = self.booleans[key]
+            return np.isin(column, [int(bool(v)) for v in values])
+        if key in self.keywords:
+            return self._keyword_mask(key, values)
+        raise ValueError(f"Brak kolumny: {key}")
+
+    def _keyword_mask(self, key: str, values: Sequence) -> np.ndarray:
+        codes = [self.vocab[key][v] for v in values if v in self.vocab[key]]
+        if self.meta["keyword_layout"][key] == "bitset":
+            bits = np.uint64(0)
+            for code in codes:
+                bits |= np.uint64(1) << np.uint64(code)
+            return (self.keywords[key] & bits) != 0
+
+        indptr, rows = self.keywords[key]
+        mask = np.zeros(len(self), dtype=bool)
+        for code in codes:
+            mask[rows[indptr[code] : indptr[code + 1]]] = True
+        return mask
+
+    # ===== WYSZUKIWANIE =====
+
+    def _dense_scores(
+        self, query: np.ndarray, rows: Optional[np.ndarray]
+    ) -> np.ndarray:
+        n = len(self) if rows is None else len(rows)
+        scores = np.empty(n, dtype=np.float32)
+        for start in range(0, n, DENSE_BLOCK_ROWS):
+            stop = min(start + DENSE_BLOCK_ROWS, n)
+            if rows is None:
+                block = self.dense[start:stop]
+            else:
+                block = self.dense[rows[start:stop]]
+            scores[start:stop] = block.astype(np.float32) @ query
+        return scores
+
+    def _sparse_scores(self, query_sparse: models.SparseVector) -> np.ndarray:
+        scores = np.zeros(len(self), dtype=np.float32)
+        terms = np.asarray(query_sparse.indices, dtype=self.sparse_terms.dtype)
+        positions = np.searchsorted(self.sparse_terms, terms)
+        for term, position, weight in zip(terms, positions, query_sparse.values):
+            if (
+                position >= len(self.sparse_terms)
+                or self.sparse_terms[position] != term
+            ):
+                continue
+            start, stop = self.sparse_indptr[position], self.sparse_indptr[position + 1]
+            # Każdy dokument występuje w kolumnie termu co najwyżej raz
+            scores[self.sparse_rows[start:stop]] += (
+                weight * self.sparse_values[start:stop]
+            )
+        return scores
+
+    def search_batch(
+        self,
+        query_dense,
+        query_sparse,
+        filters,
+        limit=20,
+        with_payload=True,
+    ):
+        query = np.asarray(query_dense, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+
+        masks = [self.filter_mask(f) for f in filters]
+        # Wektory gęste liczymy raz, tylko dla wierszy przechodzących którykolwiek filtr
+        if any(mask is None for mask in masks):
+            union_rows = None
+            dense_all = self._dense_scores(query, None)
+        else:
+            union = np.logical_or.reduce(masks) if masks else np.zeros(len(self), bool)
+            union_rows = np.flatnonzero(union)
+            dense_all = np.full(len(self), -np.inf, dtype=np.float32)
+            dense_all[union_rows] = self._dense_scores(query, union_rows)
+        sparse_all = self._sparse_scores(query_sparse)
+
+        results = []
+        for mask in masks:
+            rows = np.arange(len(self)) if mask is None else np.flatnonzero(mask)
+            dense_rows = _top_k(dense_all[rows], rows, PREFETCH_LIMIT)
+            sparse_candidates = rows[sparse_all[rows] > 0]
+            sparse_rows = _top_k(
+                sparse_all[sparse_candidates], sparse_candidates, PREFETCH_LIMIT
+            )
+            results.append(self._fuse(dense_rows, sparse_rows, limit, with_payload))
+        return results
+
+    def _fuse(
+        self,
+        dense_rows: np.ndarray,
+        sparse_rows: np.ndarray,
+        limit: int,
+        with_payload: PayloadSelector,
+    ) -> List[models.ScoredPoint]:
+        fused: Dict[int, float] = defaultdict(float)
+        for ranked in (dense_rows, sparse_rows):
+            for position, row in enumerate(ranked.tolist()):
+                fused[row] += 1.0 / (RRF_K + position)
+        best = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [
+            models.ScoredPoint(
+                id=int(self.ids[row]),
+                version=0,
+                score=score,
+                payload=self._payload(row, with_payload),
+            )
+            for row, score in best
+        ]
+
+    # ===== PAYLOADY =====
+
+    def _payload(self, row: int, with_payload: PayloadSelector) -> Optional[dict]:
+        if with_payload is False:
+            return None
+        start, stop = self._payload_offsets[row], self._payload_offsets[row + 1]
+        payload = json.loads(self._payloads[start:stop])
+        if with_payload is True:
+            return payload
+        return {key: payload[key] for key in with_payload if key in payload}
+
+    def retrieve(self, point_ids, with_payload=True):
+        if not point_ids:
+            return []
+        ids = np.asarray(point_ids, dtype=self.ids.dtype)
+        positions = np.searchsorted(self.ids, ids, sorter=self._id_order)
+        records = []
+        for point_id, position in zip(point_ids, positions):
+            if position >= len(self.ids):
+                continue
+            row = self._id_order[position]
+            if self.ids[row] != point_id:
+                continue
+            records.append(
+                models.Record(id=point_id, payload=self._payload(row, with_payload))
+            )
+        return records
+
+    def scroll_payloads(self, with_payload=True):
+        for row, point_id in enumerate(self.ids.tolist()):
+            yield point_id, self._payload(row, with_payload)
+
+
+# ===== BUDOWANIE INDEKSU =====
+
+
+def export_collection(
+    client: QdrantClient,
+    out_dir: str,
+    collection_name: str = COLLECTION_NAME,
+    batch_size: int = 1024,
+) -> int:
+    """Przepisuje kolekcję Qdranta (wektory + payloady) do plików `NumpyBackend`."""
+    os.makedirs(out_dir, exist_ok=True)
+    n = client.count(collection_name, exact=True).count
+
+    ids = np.zeros(n, dtype=np.int64)
+    dense = None
+    numeric = {name: np.full(n, np.nan, dtype=np.float32) for name in NUMERIC_FIELDS}
+    booleans = {name: np.full(n, -1, dtype=np.int8) for name in BOOL_FIELDS}
+    keyword_rows = {name: defaultdict(list) for name in KEYWORD_FIELDS}
+    sparse_terms, sparse_rows, sparse_values = [], [], []
+    offsets = [0]
+
+    row = 0
+    offset = None
+    with open(os.path.join(out_dir, "payloads.jsonl"), "wb") as payload_file:
+        while row < n:
+            points, offset = client.scroll(
+                collection_name,
+                limit=batch_size,
+                offset=offset,
+                with_payload=True,
+                with_vectors=True,
+            )
+            for point in points:
+                if row >= n:
+                    break
+                vector = point.vector["text-dense"]
+                if dense is None:
+                    dense = np.lib.format.open_memmap(
+                        os.path.join(out_dir, "dense.npy"),
+                        mode="w+",
+                        dtype=np.float16,
+                        shape=(n, len(vector)),
+                    )
+                vector = np.asarray(vector, dtype=np.float32)
+                norm = np.linalg.norm(vector)
+                dense[row] = vector / norm if norm else vector
+
+                sparse = point.vector.get("text-sparse")
+                if sparse is not None:
+                    sparse_terms.append(np.asarray(sparse.indices, dtype=np.int64))
+                    sparse_rows.append(np.full(len(sparse.indices), row, np.int32))
+                    sparse_values.append(np.asarray(sparse.values, dtype=np.float32))
+
+                payload = point.payload or {}
+                ids[row] = point.id
+                for name in NUMERIC_FIELDS:
+                    if payload.get(name) is not None:
+                        numeric[name][row] = payload[name]
+                for name in BOOL_FIELDS:
+                    if payload.get(name) is not None:
+                        booleans[name][row] = int(bool(payload[name]))
+                for name in KEYWORD_FIELDS:
+                    for value in _as_list(payload.get(name)):
+                        keyword_rows[name][value].append(row)
+
+                line = json.dumps(payload, ensure_ascii=False).encode("utf-8") + b"\n"
+                payload_file.write(line)
+                offsets.append(offsets[-1] + len(line))
+                row += 1
+            if offset is None:
+                break
+
+    n = row
+    if dense is None:
+        raise ValueError(f"Kolekcja {collection_name} jest pusta.")
+    dense.flush()
+
+    np.save(os.path.join(out_dir, "ids.npy"), ids[:n])
+    np.save(os.path.join(out_dir, "payload_offsets.npy"), np.asarray(offsets, np.int64))
+    for name in NUMERIC_FIELDS:
+        np.save(os.path.join(out_dir, f"col_{name}.npy"), numeric[name][:n])
+    for name in BOOL_FIELDS:
+        np.save(os.path.join(out_dir, f"col_{name}.npy"), booleans[name][:n])
+    _save_sparse(out_dir, sparse_terms, sparse_rows, sparse_values)
+
+    vocab, layout = {}, {}
+    for name in KEYWORD_FIELDS:
+        values = sorted(keyword_rows[name])
+        vocab[name] = values
+        if len(values) <= BITSET_MAX_VOCAB:
+            layout[name] = "bitset"
+            bits = np.zeros(n, dtype=np.uint64)
+            for code, value in enumerate(values):
+                bits[keyword_rows[name][value]] |= np.uint64(1) << np.uint64(code)
+            np.save(os.path.join(out_dir, f"kw_{name}.npy"), bits)
+        else:
+            layout[name] = "postings"
+            lengths = [len(keyword_rows[name][v]) for v in values]
+            indptr = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+            rows = np.concatenate(
+                [np.asarray(keyword_rows[name][v], np.int32) for v in values]
+            )
+            np.save(os.path.join(out_dir, f"kw_{name}_indptr.npy"), indptr)
+            np.save(os.path.join(out_dir, f"kw_{name}_rows.npy"), rows)
+
+    meta = {
+        "collection": collection_name,
+        "count": n,
+        "dense_dim": int(dense.shape[1]),
+        "keyword_vocab": vocab,
+        "keyword_layout": layout,
+        "created": time.time(),
+    }
+    with open(os.path.join(out_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    return n
+
+
+def _save_sparse(out_dir: str, terms: list, rows: list, values: list):
+    terms = np.concatenate(terms) if terms else np.zeros(0, np.int64)
+    rows = np.concatenate(rows) if rows else np.zeros(0, np.int32)
+    values = np.concatenate(values) if values else np.zeros(0, np.float32)
+
+    order = np.lexsort((rows, terms))
+    terms, rows, values = terms[order], rows[order], values[order]
+    unique_terms, starts = np.unique(terms, return_index=True)
+    indptr = np.append(starts, len(terms)).astype(np.int64)
+
+    np.save(os.path.join(out_dir, "sparse_terms.npy"), unique_terms)
+    np.save(os.path.join(out_dir, "sparse_indptr.npy"), indptr)
+    np.save(os.path.join(out_dir, "sparse_rows.npy"), rows)
+    np.save(os.path.join(out_dir, "sparse_values.npy"), values)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Eksport kolekcji Qdranta do indeksu NumPy (SEARCH_BACKEND=numpy)."
+    )
+    parser.add_argument("--qdrant-url", default=QDRANT_URL)
+    parser.add_argument("--collection", default=COLLECTION_NAME)
+    parser.add_argument("--out", default=NUMPY_INDEX_PATH)
+    args = parser.parse_args()
+
+    from cache import touch_index_epoch
+
+    start = time.perf_counter()
+    n = export_collection(QdrantClient(url=args.qdrant_url), args.out, args.collection)
+    # Nowy indeks unieważnia cache odpowiedzi
+    touch_index_epoch(INDEX_EPOCH_PATH)
+    print(f"✅ Zapisano {n} filmów do {args.out} ({time.perf_counter() - start:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
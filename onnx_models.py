@@ -0,0 +1,316 @@
+"""
+Modele na CPU przez ONNX Runtime (INFERENCE_BACKEND=onnx) zamiast PyTorcha.
+
+Embedder (Qwen3-Embedding) i cross-encoder są eksportowane do ONNX mechanizmem
+`sentence-transformers` (`backend="onnx"`), opcjonalnie z dynamiczną kwantyzacją int8
+(ONNX_QUANTIZATION = avx2 / avx512 / avx512_vnni / arm64, `none` - float32). Wyeksportowane
+modele leżą w ONNX_MODEL_DIR, więc eksport wykonuje się raz (albo z góry: `--export`).
+Pooling, normalizacja i prompty zostają z konfiguracji sentence-transformers - podmieniany
+jest tylko transformer.
+
+Wymaga: pip install "sentence-transformers[onnx]"
+
+Użycie:
+    python onnx_models.py --export             # eksport + kwantyzacja obu modeli
+    python onnx_models.py --parity             # dryf względem PyTorcha i czasy
+    python onnx_models.py --parity --csv TMDB_movie_dataset_v11.csv --rows 200
+"""
+
+import argparse
+import logging
+import os
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from config import (
+    DENSE_MODEL_NAME,
+    ONNX_MODEL_DIR,
+    ONNX_QUANTIZATION,
+    ONNX_THREADS,
+    RERANKER_MODEL_NAME,
+)
+
+logger = logging.getLogger(__name__)
+
+QUANTIZATION_CONFIGS = ["arm64", "avx2", "avx512", "avx512_vnni"]
+
+# Zestaw kontrolny dla --parity (bez --csv): zapytania w stylu aplikacji i opisy filmów
+PARITY_QUERIES = [
+    "haunted house ghost family",
+    "funny dogs adventure",
+    "space station astronaut survival",
+    "bank heist crew betrayal",
+    "Titanic",
+    "romantic comedy in Paris",
+]
+PARITY_PASSAGES = [
+    "Movie title: The Conjuring (2013). Genres: Horror. Plot summary: Paranormal "
+    "investigators help a family terrorized by a dark presence in their farmhouse.",
+    "Movie title: Beethoven (1992). Genres: Comedy, Family. Plot summary: A St. Bernard "
+    "puppy causes chaos in the home of a suburban family.",
+    "Movie title: Gravity (2013). Genres: Science Fiction, Thriller. Plot summary: Two "
+    "astronauts work together to survive after an accident leaves them stranded in space.",
+    "Movie title: Heat (1995). Genres: Crime, Drama. Plot summary: A group of "
+    "professional bank robbers is tracked by a determined detective.",
+    "Movie title: Titanic (1997). Genres: Drama, Romance. Plot summary: A young "
+    "aristocrat falls in love with a poor artist aboard the ill-fated R.M.S. Titanic.",
+    "Movie title: Amélie (2001). Genres: Comedy, Romance. Plot summary: A shy waitress "
+    "in Montmartre decides to change the lives of the people around her.",
+]
+
+
+def model_dir(model_name: str, root: str = ONNX_MODEL_DIR) -> str:
+    return os.path.join(root, model_name.replace("/", "__"))
+
+
+def onnx_file_name(quantization: str = ONNX_QUANTIZATION) -> str:
+    if quantization == "none":
+        return "onnx/model.onnx"
+    if quantization not in QUANTIZATION_CONFIGS:
+        raise ValueError(f"Nieznana kwantyzacja ONNX: {quantization}")
+    return f"onnx/model_qint8_{quantization}.onnx"
+
+
+def session_options(threads: int = ONNX_THREADS):
+    """Jeden pool wątków na operator (równoległość między zapytaniami daje mikro-batching)."""
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    options.inter_op_num_threads = 1
+    if threads > 0:
+        options.intra_op_num_threads = threads
+    return options
+
+
+def _model_class(kind: str):
+    if kind == "dense":
+        from sentence_transformers import SentenceTransformer
+
+        return SentenceTransformer, {"trust_remote_code": True}
+    if kind == "reranker":
+        from sentence_transformers import CrossEncoder
+
+        return CrossEncoder, {}
+    raise ValueError(f"Nieznany rodzaj modelu: {kind}")
+
+
+def export_model(
+    kind: str,
+    model_name: str,
+    quantization: str = ONNX_QUANTIZATION,
+    root: str = ONNX_MODEL_DIR,
+) -> str:
+    """Eksportuje model do ONNX w `model_dir` (i dopisuje wersję int8). Zwraca katalog modelu."""
+    from sentence_transformers import export_dynamic_quantized_onnx_model
+
+    model_cls, kwargs = _model_class(kind)
+    path = model_dir(model_name, root)
+    start = time.perf_counter()
+    if not os.path.exists(os.path.join(path, onnx_file_name("none"))):
+        # Bez pliku ONNX w repozytorium modelu sentence-transformers eksportuje go sam
+        model = model_cls(model_name, backend="onnx", device="cpu", **kwargs)
+        model.save_pretrained(path)
+    if quantization != "none":
+        model = model_cls(path, backend="onnx", device="cpu", **kwargs)
+        export_dynamic_quantized_onnx_model(model, quantization, path)
+    logger.info(
+        "📦 Eksport ONNX %s (%s): %s (%.1fs)",
+        model_name,
+        quantization,
+        path,
+        time.perf_counter() - start,
+    )
+    return path
+
+
+def load_model(
+    kind: str,
+    model_name: str,
+    quantization: str = ONNX_QUANTIZATION,
+    threads: int = ONNX_THREADS,
+    root: str = ONNX_MODEL_DIR,
+):
+    """Model `sentence-transformers` na ONNX Runtime (CPU); eksportuje go przy pierwszym użyciu."""
+    model_cls, kwargs = _model_class(kind)
+    path = model_dir(model_name, root)
+    file_name = onnx_file_name(quantization)
+    if not os.path.exists(os.path.join(path, file_name)):
+        export_model(kind, model_name, quantization, root)
+    return model_cls(
+        path,
+        backend="onnx",
+        device="cpu",
+        model_kwargs={
+            "file_name": file_name,
+            "provider": "CPUExecutionProvider",
+            "session_options": session_options(threads),
+        },
+        **kwargs,
+    )
+
+
+# ===== PORÓWNANIE Z PYTORCHEM =====
+
+
+def _timed(fn, repeats: int = 3) -> Tuple[object, float]:
+    """Wynik i najlepszy czas (ms) z kilku powtórzeń - pierwsze wywołanie to rozgrzewka."""
+    result, best = fn(), float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, (time.perf_counter() - start) * 1000.0)
+    return result, best
+
+
+def _normalize(vectors) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def dense_parity(torch_model, onnx_model, queries: List[str], passages: List[str]):
+    def encode_queries(model):
+        return lambda: np.stack([model.encode(query) for query in queries])
+
+    torch_q, torch_ms = _timed(encode_queries(torch_model))
+    onnx_q, onnx_ms = _timed(encode_queries(onnx_model))
+    torch_p = _normalize(torch_model.encode(passages))
+    onnx_p = _normalize(onnx_model.encode(passages))
+    torch_q, onnx_q = _normalize(torch_q), _normalize(onnx_q)
+
+    cosine = np.concatenate(
+        [np.sum(torch_q * onnx_q, axis=1), np.sum(torch_p * onnx_p, axis=1)]
+    )
+    # Czy ONNX wybiera ten sam najbliższy opis dla zapytania co PyTorch
+    top1 = np.mean(
+        np.argmax(torch_q @ torch_p.T, axis=1) == np.argmax(onnx_q @ onnx_p.T, axis=1)
+    )
+    return {
+        "cosine_mean": float(cosine.mean()),
+        "cosine_min": float(cosine.min()),
+        "top1_agreement": float(top1),
+        "torch_ms_per_query": torch_ms / len(queries),
+        "onnx_ms_per_query": onnx_ms / len(queries),
+    }
+
+
+def reranker_parity(torch_model, onnx_model, queries: List[str], passages: List[str]):
+    pairs = [[query, passage] for query in queries for passage in passages]
+
+    def predict(model):
+        # Jak w aplikacji: jedno zapytanie z kandydatami na wywołanie
+        return lambda: np.concatenate(
+            [
+                model.predict(pairs[i : i + len(passages)], show_progress_bar=False)
+                for i in range(0, len(pairs), len(passages))
+            ]
+        )
+
+    torch_scores, torch_ms = _timed(predict(torch_model))
+    onnx_scores, onnx_ms = _timed(predict(onnx_model))
+    diff = np.abs(torch_scores - onnx_scores)
+    shape = (len(queries), len(passages))
+    top1 = np.mean(
+        np.argmax(torch_scores.reshape(shape), axis=1)
+        == np.argmax(onnx_scores.reshape(shape), axis=1)
+    )
+    return {
+        "score_diff_mean": float(diff.mean()),
+        "score_diff_max": float(diff.max()),
+        "top1_agreement": float(top1),
+        "torch_ms_per_query": torch_ms / len(queries),
+        "onnx_ms_per_query": onnx_ms / len(queries),
+    }
+
+
+def _file_mb(path: str) -> float:
+    # Duże modele ONNX trzymają wagi w osobnym pliku `.onnx_data`
+    files = [path, f"{path}_data"]
+    return sum(os.path.getsize(f) for f in files if os.path.exists(f)) / 2**20
+
+
+def _parity_texts(csv_path: Optional[str], rows: int) -> Tuple[List[str], List[str]]:
+    if not csv_path:
+        return PARITY_QUERIES, PARITY_PASSAGES
+    import pandas as pd
+
+    from ingest import prepare_chunk
+
+    _, texts, payloads = prepare_chunk(pd.read_csv(csv_path, nrows=rows))
+    # Zapytania w stylu aplikacji: tytuł + słowa kluczowe, dopasowywane do pełnych opisów
+    queries = [
+        f"{p['title']} {' '.join(p['keywords'][:3])}".strip() for p in payloads[:20]
+    ]
+    return queries, texts
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Eksport modeli do ONNX (int8) i porównanie z PyTorchem."
+    )
+    parser.add_argument("--export", action="store_true", help="Eksportuj oba modele")
+    parser.add_argument(
+        "--parity", action="store_true", help="Porównaj wyniki ONNX i PyTorcha"
+    )
+    parser.add_argument(
+        "--quantization",
+        choices=["none"] + QUANTIZATION_CONFIGS,
+        default=ONNX_QUANTIZATION,
+    )
+    parser.add_argument("--threads", type=int, default=ONNX_THREADS)
+    parser.add_argument("--model-dir", default=ONNX_MODEL_DIR)
+    parser.add_argument("--csv", default=None, help="Teksty z CSV TMDB zamiast zestawu")
+    parser.add_argument("--rows", type=int, default=200)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    models = [("dense", DENSE_MODEL_NAME), ("reranker", RERANKER_MODEL_NAME)]
+    if args.export:
+        for kind, name in models:
+            export_model(kind, name, args.quantization, args.model_dir)
+    if not args.parity:
+        return
+
+    queries, passages = _parity_texts(args.csv, args.rows)
+    for kind, name in models:
+        model_cls, kwargs = _model_class(kind)
+        torch_model = model_cls(name, device="cpu", **kwargs)
+        onnx_model = load_model(
+            kind, name, args.quantization, args.threads, args.model_dir
+        )
+        parity = dense_parity if kind == "dense" else reranker_parity
+        result = parity(torch_model, onnx_model, queries, passages)
+
+        onnx_path = os.path.join(
+            model_dir(name, args.model_dir), onnx_file_name(args.quantization)
+        )
+        fp32_path = os.path.join(
+            model_dir(name, args.model_dir), onnx_file_name("none")
+        )
+        print(f"\n=== {name} (ONNX {args.quantization}) ===")
+        if kind == "dense":
+            print(
+                f"Kosinus ONNX vs PyTorch:   średnio {result['cosine_mean']:.4f}, "
+                f"najmniej {result['cosine_min']:.4f}"
+            )
+        else:
+            print(
+                f"Różnica wyników:           średnio {result['score_diff_mean']:.4f}, "
+                f"najwięcej {result['score_diff_max']:.4f}"
+            )
+        print(f"Zgodność top-1:            {result['top1_agreement']:.1%}")
+        print(
+            f"Czas na zapytanie:         PyTorch {result['torch_ms_per_query']:.1f} ms, "
+            f"ONNX {result['onnx_ms_per_query']:.1f} ms"
+        )
+        print(
+            f"Wagi:                      float32 {_file_mb(fp32_path):.0f} MB, "
+            f"{args.quantization} {_file_mb(onnx_path):.0f} MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
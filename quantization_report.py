@@ -0,0 +1,220 @@
+"""
+Raport: ile RAM oszczędzają kompaktowe wektory dense i ile kosztują w recall.
+
+Narzędzie kopiuje pełną kolekcję do kolekcji docelowej z wektorem skróconym (Matryoshka)
+i/lub kwantyzacją (bez ponownego kodowania - wektor skrócony powstaje z pełnego), a potem
+porównuje wyszukiwanie dense na obu kolekcjach. Zapytaniami są wektory losowych filmów
+z kolekcji; punktem odniesienia jest dokładne (exact) wyszukiwanie na pełnych wektorach.
+
+Użycie:
+    python quantization_report.py --build --dim 256 --quantization binary
+    python quantization_report.py --target movies_db_final_compact --queries 500 --k 10
+"""
+
+import argparse
+import random
+import time
+
+import numpy as np
+from qdrant_client import QdrantClient, models
+
+from backends import dense_point_vectors, dense_prefetch, dense_vectors_config
+from config import (
+    COLLECTION_NAME,
+    DENSE_DIM,
+    DENSE_QUANTIZATION,
+    QDRANT_URL,
+    QUANTIZATION_OVERSAMPLING,
+)
+from ingest import ensure_collection
+
+
+def vector_bytes(dim: int, quantization: str) -> float:
+    """Bajty na wektor trzymany w RAM (bez grafu HNSW)."""
+    if quantization == "scalar":
+        return dim
+    if quantization == "binary":
+        return np.ceil(dim / 8)
+    return dim * 4
+
+
+def copy_collection(
+    client: QdrantClient,
+    source: str,
+    target: str,
+    dim: int,
+    quantization: str,
+    batch_size: int = 256,
+) -> int:
+    full_dim = client.get_collection(source).config.params.vectors["text-dense"].size
+    ensure_collection(
+        client,
+        full_dim,
+        recreate=True,
+        collection_name=target,
+        vectors_config=dense_vectors_config(full_dim, dim, quantization),
+    )
+
+    copied = 0
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            source,
+            limit=batch_size,
+            offset=offset,
+            with_payload=True,
+            with_vectors=True,
+        )
+        client.upsert(
+            target,
+            points=[
+                models.PointStruct(
+                    id=point.id,
+                    vector={
+                        **dense_point_vectors(point.vector["text-dense"], dim),
+                        **{k: v for k, v in point.vector.items() if k == "text-sparse"},
+                    },
+                    payload=point.payload,
+                )
+                for point in points
+            ],
+        )
+        copied += len(points)
+        print(f"   -> Skopiowano {copied} filmów", end="\r")
+        if offset is None:
+            break
+    print()
+    return copied
+
+
+def sample_queries(client: QdrantClient, collection: str, n: int, seed: int):
+    """Wektory dense losowych filmów (z pierwszych n * 10 punktów kolekcji)."""
+    points, _ = client.scroll(
+        collection, limit=n * 10, with_payload=False, with_vectors=["text-dense"]
+    )
+    random.Random(seed).shuffle(points)
+    return [point.vector["text-dense"] for point in points[:n]]
+
+
+def evaluate(
+    client: QdrantClient,
+    source: str,
+    target: str,
+    queries,
+    k: int,
+    dim: int,
+    quantization: str,
+    oversampling: float,
+) -> dict:
+    recalls, exact_ms, compact_ms = [], [], []
+    for query in queries:
+        start = time.perf_counter()
+        exact = client.query_points(
+            source,
+            query=query,
+            using="text-dense",
+            limit=k,
+            search_params=models.SearchParams(exact=True),
+        ).points
+        exact_ms.append((time.perf_counter() - start) * 1000.0)
+
+        # Ta sama gałąź dense, której używa aplikacja (backends.dense_prefetch)
+        start = time.perf_counter()
+        compact = client.query_points(
+            target,
+            prefetch=[dense_prefetch(query, None, k, dim, quantization, oversampling)],
+            query=models.FusionQuery(fusion=models.Fusion.RRF),
+            limit=k,
+        ).points
+        compact_ms.append((time.perf_counter() - start) * 1000.0)
+
+        expected = {point.id for point in exact}
+        recalls.append(len(expected & {point.id for point in compact}) / len(expected))
+
+    return {
+        "recall": float(np.mean(recalls)),
+        "recall_min": float(np.min(recalls)),
+        "exact_ms_p50": float(np.percentile(exact_ms, 50)),
+        "compact_ms_p50": float(np.percentile(compact_ms, 50)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Oszczędność RAM i utrata recall dla kompaktowych wektorów dense."
+    )
+    parser.add_argument("--qdrant-url", default=QDRANT_URL)
+    parser.add_argument("--source", default=COLLECTION_NAME)
+    parser.add_argument("--target", default=f"{COLLECTION_NAME}_compact")
+    parser.add_argument("--dim", type=int, default=DENSE_DIM, help="0 = bez skracania")
+    parser.add_argument(
+        "--quantization",
+        choices=["none", "scalar", "binary"],
+        default=DENSE_QUANTIZATION,
+    )
+    parser.add_argument("--oversampling", type=float, default=QUANTIZATION_OVERSAMPLING)
+    parser.add_argument(
+        "--build", action="store_true", help="Utwórz kolekcję docelową od nowa"
+    )
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    client = QdrantClient(url=args.qdrant_url)
+    if args.build:
+        print(f"📦 Kopiuję {args.source} -> {args.target}...")
+        copy_collection(client, args.source, args.target, args.dim, args.quantization)
+
+    full_dim = (
+        client.get_collection(args.source).config.params.vectors["text-dense"].size
+    )
+    n_points = client.count(args.source, exact=True).count
+    compact_dim = args.dim if 0 < args.dim < full_dim else full_dim
+
+    full_ram = n_points * vector_bytes(full_dim, "none")
+    compact_ram = n_points * vector_bytes(compact_dim, args.quantization)
+    if compact_dim == full_dim and args.quantization == "none":
+        disk = 0
+    else:
+        # Oryginały (pełne i skrócone) zostają na dysku do rescoringu
+        disk = n_points * vector_bytes(full_dim, "none")
+        if compact_dim != full_dim:
+            disk += n_points * vector_bytes(compact_dim, "none")
+
+    queries = sample_queries(client, args.source, args.queries, args.seed)
+    result = evaluate(
+        client,
+        args.source,
+        args.target,
+        queries,
+        args.k,
+        args.dim,
+        args.quantization,
+        args.oversampling,
+    )
+
+    mb = 1024 * 1024
+    print(
+        f"\n=== {args.target}: dim={compact_dim}/{full_dim}, "
+        f"kwantyzacja={args.quantization}, oversampling={args.oversampling} ==="
+    )
+    print(f"Filmy:                 {n_points}")
+    print(f"RAM wektorów (pełne):  {full_ram / mb:.1f} MB")
+    print(
+        f"RAM wektorów (kompakt): {compact_ram / mb:.1f} MB "
+        f"(-{1 - compact_ram / full_ram:.1%})"
+    )
+    print(f"Dysk (oryginały):      {disk / mb:.1f} MB")
+    print(
+        f"Recall@{args.k}:             {result['recall']:.3f} "
+        f"(najgorsze zapytanie: {result['recall_min']:.2f}, {len(queries)} zapytań)"
+    )
+    print(
+        f"Czas p50:              exact {result['exact_ms_p50']:.1f} ms, "
+        f"kompakt {result['compact_ms_p50']:.1f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""
+Telemetria grafu: czasy węzłów i kosztownych wywołań, liczniki oraz zużycie tokenów LLM.
+
+Pomiary trafiają do rejestru w pamięci procesu (`metrics.snapshot()` zwraca p50/p95/p99
+z ostatnich `TELEMETRY_WINDOW` próbek). Z `TELEMETRY_OTEL=1` i zainstalowanym pakietem
+`opentelemetry-api` każdy `span` jest też spanem OpenTelemetry, a liczniki i czasy trafiają
+do metryk OTel - eksport konfiguruje SDK/`opentelemetry-instrument`. Z `TELEMETRY=0`
+`span()` zwraca współdzielony obiekt bez żadnej pracy, a `incr` / `observe` nic nie robią.
+"""
+
+import functools
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.runnables import RunnableLambda
+
+from config import LOG_LEVEL, TELEMETRY, TELEMETRY_OTEL, TELEMETRY_WINDOW
+
+logger = logging.getLogger(__name__)
+
+
+def configure_logging():
+    """Komunikaty węzłów idą przez `logging`; poziom ustawia LOG_LEVEL (np. WARNING wycisza je)."""
+    logging.basicConfig(level=LOG_LEVEL, format="%(message)s")
+
+
+# ===== METRYKI =====
+
+
+class Metrics:
+    """Liczniki i okna ostatnich próbek (histogramy) w pamięci procesu."""
+
+    def __init__(self, window: int):
+        self.window = window
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = defaultdict(float)
+        self._histograms: Dict[str, deque] = {}
+
+    def incr(self, name: str, value: float = 1):
+        with self._lock:
+            self._counters[name] += value
+
+    def observe(self, name: str, value: float):
+        with self._lock:
+            samples = self._histograms.get(name)
+            if samples is None:
+                samples = self._histograms[name] = deque(maxlen=self.window)
+            samples.append(value)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {name: list(v) for name, v in self._histograms.items()}
+
+        summaries = {}
+        for name, samples in sorted(histograms.items()):
+            values = np.asarray(samples)
+            summaries[name] = {
+                "n": len(samples),
+                "mean": float(values.mean()),
+                "p50": float(np.percentile(values, 50)),
+                "p95": float(np.percentile(values, 95)),
+                "p99": float(np.percentile(values, 99)),
+            }
+        return {"counters": dict(sorted(counters.items())), "histograms": summaries}
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+metrics = Metrics(TELEMETRY_WINDOW)
+
+
+# ===== OPENTELEMETRY (opcjonalnie) =====
+
+_tracer = None
+_meter = None
+_otel_instruments: Dict[str, Any] = {}
+
+if TELEMETRY and TELEMETRY_OTEL:
+    try:
+        from opentelemetry import metrics as otel_metrics
+        from opentelemetry import trace
+
+        _tracer = trace.get_tracer("movies_rag")
+        _meter = otel_metrics.get_meter("movies_rag")
+    except ImportError:
+        logger.warning(
+            "TELEMETRY_OTEL=1, ale brak pakietu opentelemetry-api - tylko metryki lokalne."
+        )
+
+
+def _otel_instrument(name: str, kind: str):
+    instrument = _otel_instruments.get(name)
+    if instrument is None:
+        if kind == "counter":
+            instrument = _meter.create_counter(name)
+        else:
+            instrument = _meter.create_histogram(name, unit="ms")
+        _otel_instruments[name] = instrument
+    return instrument
+
+
+def _otel_attributes(attrs: dict) -> dict:
+    # OTel przyjmuje tylko typy proste
+    return {k: v for k, v in attrs.items() if isinstance(v, (str, bool, int, float))}
+
+
+def incr(name: str, value: float = 1):
+    if not TELEMETRY:
+        return
+    metrics.incr(name, value)
+    if _meter is not None:
+        _otel_instrument(name, "counter").add(value)
+
+
+def observe(name: str, value: float):
+    if not TELEMETRY:
+        return
+    metrics.observe(name, value)
+    if _meter is not None:
+        _otel_instrument(name, "histogram").record(value)
+
+
+# ===== SPANY =====
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class _Span:
+    """Mierzy czas bloku (`<nazwa>.ms`), liczy błędy (`<nazwa>.errors`) i przekazuje atrybuty do OTel."""
+
+    __slots__ = ("name", "attrs", "_start", "_otel_cm", "_otel_span")
+
+    def __init__(self, name: str, attrs: dict):
+        self.name = name
+        self.attrs = attrs
+        self._otel_cm = None
+        self._otel_span = None
+
+    def __enter__(self):
+        if _tracer is not None:
+            self._otel_cm = _tracer.start_as_current_span(
+                self.name, attributes=_otel_attributes(self.attrs)
+            )
+            self._otel_span = self._otel_cm.__enter__()
+        self._start = time.perf_counter()
+        return self
+
+    def set(self, **attrs):
+        """Atrybuty znane dopiero w trakcie (np. liczba kandydatów)."""
+        self.attrs.update(attrs)
+        if self._otel_span is not None:
+            self._otel_span.set_attributes(_otel_attributes(attrs))
+
+    def __exit__(self, exc_type, exc, tb):
+        observe(f"{self.name}.ms", (time.perf_counter() - self._start) * 1000.0)
+        if exc_type is not None:
+            incr(f"{self.name}.errors")
+        if self._otel_cm is not None:
+            self._otel_cm.__exit__(exc_type, exc, tb)
+        return False
+
+
+def span(name: str, **attrs):
+    return _Span(name, attrs) if TELEMETRY else _NOOP_SPAN
+
+
+def traced_node(name: str, fn: Callable, afn: Optional[Callable] = None):
+    """
+    Opakowuje węzeł grafu w span `node.<nazwa>`. Z `afn` (wersja async węzła) zwraca
+    `RunnableLambda`, który przy `invoke` / `stream` woła `fn`, a przy `ainvoke` / `astream` - `afn`.
+    """
+
+    @functools.wraps(fn)
+    def wrapper(state):
+        with span(f"node.{name}", retry_count=state.get("retry_count") or 0):
+            return fn(state)
+
+    if afn is None:
+        return wrapper
+
+    @functools.wraps(afn)
+    async def awrapper(state):
+        with span(f"node.{name}", retry_count=state.get("retry_count") or 0):
+            return await afn(state)
+
+    return RunnableLambda(wrapper, afunc=awrapper, name=name)
+
+
+# ===== TOKENY LLM =====
+
+
+class LLMUsageHandler(BaseCallbackHandler):
+    """
+    Callback podpinany do modeli czatu: czas wywołania i liczba tokenów, z podziałem
+    na węzeł grafu (`langgraph_node` z metadanych uruchomienia).
+    """
+
+    def __init__(self):
+        self._runs: Dict[Any, tuple] = {}
+
+    def on_chat_model_start(
+        self, serialized, messages, *, run_id, metadata=None, **kwargs
+    ):
+        node = (metadata or {}).get("langgraph_node", "other")
+        self._runs[run_id] = (node, time.perf_counter())
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        node, start = self._runs.pop(run_id, ("other", None))
+        if start is not None:
+            observe(f"llm.{node}.ms", (time.perf_counter() - start) * 1000.0)
+
+        input_tokens, output_tokens = _token_usage(response)
+        incr(f"llm.{node}.calls")
+        incr(f"llm.{node}.input_tokens", input_tokens)
+        incr(f"llm.{node}.output_tokens", output_tokens)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        node, _ = self._runs.pop(run_id, ("other", None))
+        incr(f"llm.{node}.errors")
+
+
+def _token_usage(response) -> tuple:
+    for generations in response.generations:
+        for generation in generations:
+            usage: Optional[dict] = getattr(
+                getattr(generation, "message", None), "usage_metadata", None
+            )
+            if usage:
+                return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+
+    # Starsze integracje raportują użycie tylko w llm_output
+    token_usage = (response.llm_output or {}).get("token_usage") or {}
+    return token_usage.get("prompt_tokens", 0), token_usage.get("completion_tokens", 0)
+
+
+llm_usage_handler = LLMUsageHandler()
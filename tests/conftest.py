@@ -0,0 +1,34 @@
+import os
+import sys
+
+import pytest
+from qdrant_client import QdrantClient
+
+# Moduły projektu leżą płasko w katalogu głównym repozytorium
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def graph():
+    """Graf z atrapami modeli i LLM-ów z benchmarku oraz kolekcją w lokalnym Qdrancie."""
+    import config
+    from benchmark import (
+        SCENARIOS,
+        FakeLLMs,
+        build_fixture_collection,
+        install_fakes,
+        reset_query_caches,
+        synthetic_rows,
+    )
+    from film_agent import app
+    from title_index import build_title_index
+
+    client = QdrantClient(location=":memory:")
+    install_fakes(client, FakeLLMs(SCENARIOS))
+    reset_query_caches()
+    build_fixture_collection(
+        client, synthetic_rows(300), config.dense_model, config.sparse_model
+    )
+    config.override("title_index", build_title_index(config.search_backend))
+    yield app
+    config.reset()
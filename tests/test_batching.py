@@ -0,0 +1,88 @@
+import threading
+
+import numpy as np
+import pytest
+
+from batching import BatchedDenseEncoder, BatchedReranker, MicroBatcher
+
+
+class FakeModel:
+    def __init__(self):
+        self.calls = []
+
+    def get_sentence_embedding_dimension(self):
+        return 3
+
+    def encode(self, texts, batch_size=32, show_progress_bar=False):
+        self.calls.append(list(texts))
+        return np.array([[len(t), 0.0, 1.0] for t in texts], dtype=np.float32)
+
+    def predict(self, pairs, batch_size=32, show_progress_bar=False):
+        self.calls.append(list(pairs))
+        return np.array([len(q) - len(p) for q, p in pairs], dtype=np.float32)
+
+
+def test_encode_empty_input_matches_model_shape():
+    encoder = BatchedDenseEncoder(FakeModel())
+
+    result = encoder.encode([])
+
+    assert result.shape == (0, 3)
+
+
+def test_encode_keeps_input_order():
+    model = FakeModel()
+    encoder = BatchedDenseEncoder(model, bucket_size=2)
+    texts = ["ccc", "a", "bbbbb", "dd"]
+
+    result = encoder.encode(texts)
+
+    assert result[:, 0].tolist() == [3, 1, 5, 2]
+    # Kubełki po długości: krótkie teksty razem
+    assert model.calls[0] == ["a", "dd"]
+
+
+def test_encode_with_kwargs_calls_model_directly():
+    model = FakeModel()
+    encoder = BatchedDenseEncoder(model)
+
+    encoder.encode(["a", "b"], batch_size=8)
+
+    assert model.calls == [["a", "b"]]
+
+
+def test_predict_empty_and_pairs():
+    reranker = BatchedReranker(FakeModel())
+
+    assert reranker.predict([]).shape == (0,)
+    assert reranker.predict([("abc", "a"), ("a", "abc")]).tolist() == [2, -2]
+
+
+def test_concurrent_submissions_share_a_batch():
+    seen = []
+    release = threading.Event()
+
+    def fn(items):
+        release.wait(1)
+        seen.append(list(items))
+        return [item.upper() for item in items]
+
+    batcher = MicroBatcher(fn, max_wait_ms=50)
+    futures = [batcher.submit(text) for text in ["a", "bb", "c", "dd", "e"]]
+    release.set()
+
+    assert [f.result(1) for f in futures] == ["A", "BB", "C", "DD", "E"]
+    assert batcher.stats()["items"] == 5
+    assert batcher.batches < 5
+
+
+def test_errors_reach_every_caller_in_bucket():
+    def fn(items):
+        raise RuntimeError("model failed")
+
+    batcher = MicroBatcher(fn)
+    futures = [batcher.submit(text) for text in ["a", "b", "c"]]
+
+    for future in futures:
+        with pytest.raises(RuntimeError):
+            future.result(1)
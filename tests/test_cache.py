@@ -0,0 +1,174 @@
+import os
+import time
+
+import pytest
+
+import config
+
+from cache import (
+    AnswerCache,
+    LRUCache,
+    QueryEmbeddingCache,
+    normalize_query,
+    touch_index_epoch,
+)
+from models import MovieSearchIntent
+from utils import intent_filter_key
+
+EMBEDDING = ([0.1, 0.2, 0.3], [4, 17], [0.5, 0.25])
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_lru_counts_hits_and_misses():
+    cache = LRUCache(maxsize=4)
+    cache.put("a", 1)
+    cache.get("a")
+    cache.get("missing")
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (1, 1, 0.5)
+
+
+def test_lru_with_zero_size_stores_nothing():
+    cache = LRUCache(maxsize=0)
+    cache.put("a", 1)
+
+    assert len(cache) == 0
+
+
+def test_normalize_query_folds_whitespace_and_unicode():
+    assert normalize_query("  ﬁlm   o  psach\n") == "film o psach"
+
+
+def test_embedding_key_depends_on_model():
+    assert QueryEmbeddingCache("model-a").key("psy") != QueryEmbeddingCache(
+        "model-b"
+    ).key("psy")
+
+
+@pytest.mark.parametrize(
+    "backend, quantization",
+    [("onnx", "avx2"), ("onnx", "avx512_vnni"), ("onnx", "none")],
+)
+def test_embedding_key_depends_on_inference_backend(monkeypatch, backend, quantization):
+    previous = config.get("query_embedding_cache")
+    keys = set()
+    try:
+        for variant in [("torch", "avx2"), (backend, quantization)]:
+            monkeypatch.setattr(config, "INFERENCE_BACKEND", variant[0])
+            monkeypatch.setattr(config, "ONNX_QUANTIZATION", variant[1])
+            config.reset("query_embedding_cache")
+            keys.add(config.query_embedding_cache.key("psy"))
+    finally:
+        config.override("query_embedding_cache", previous)
+
+    assert len(keys) == 2
+
+
+def test_embedding_cache_shares_sqlite_tier(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite")
+    QueryEmbeddingCache("model", path=path).put("Film o psach", EMBEDDING)
+
+    other_worker = QueryEmbeddingCache("model", path=path)
+    dense, indices, values = other_worker.get("Film  o psach")
+
+    assert dense == pytest.approx(EMBEDDING[0])
+    assert indices == EMBEDDING[1]
+    assert values == pytest.approx(EMBEDDING[2])
+    stats = other_worker.stats()
+    assert (stats["disk_hits"], stats["misses"]) == (1, 0)
+
+
+def test_embedding_cache_disk_hit_is_promoted_to_memory(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite")
+    QueryEmbeddingCache("model", path=path).put("psy", EMBEDDING)
+    cache = QueryEmbeddingCache("model", path=path)
+
+    cache.get("psy")
+    cache.get("psy")
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["disk_hits"]) == (1, 1)
+
+
+def test_embedding_cache_miss_without_disk_tier():
+    cache = QueryEmbeddingCache("model", maxsize=1)
+    cache.put("a", EMBEDDING)
+    cache.put("b", EMBEDDING)
+
+    assert cache.get("a") is None
+    assert cache.get("b") is not None
+
+
+# ===== Cache odpowiedzi =====
+
+
+def test_answer_cache_matches_similar_query_with_same_filters():
+    cache = AnswerCache(similarity=0.95)
+    cache.put('{"genres": ["horror"]}', [1.0, 0.0, 0.1], "kontekst", "odpowiedź")
+
+    assert cache.lookup('{"genres": ["horror"]}', [1.0, 0.0, 0.12]) == (
+        "kontekst",
+        "odpowiedź",
+    )
+    assert cache.lookup('{"genres": ["horror"]}', [0.0, 1.0, 0.0]) is None
+    assert cache.lookup('{"genres": ["comedy"]}', [1.0, 0.0, 0.1]) is None
+
+
+def test_answer_cache_evicts_oldest_and_expires(monkeypatch):
+    cache = AnswerCache(maxsize=2, ttl_seconds=60)
+    for i, vector in enumerate([[1, 0, 0], [0, 1, 0], [0, 0, 1]]):
+        cache.put("{}", vector, f"c{i}", f"g{i}")
+
+    assert cache.lookup("{}", [1, 0, 0]) is None
+    assert cache.stats()["evictions"] == 1
+
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+    assert cache.lookup("{}", [0, 0, 1]) is None
+    assert cache.stats()["size"] == 0
+
+
+def test_answer_cache_is_invalidated_by_new_index_epoch(tmp_path):
+    epoch_path = str(tmp_path / ".index_epoch")
+    touch_index_epoch(epoch_path)
+    cache = AnswerCache(epoch_path=epoch_path, epoch_check_interval=0)
+    cache.put("{}", [1, 0], "kontekst", "odpowiedź")
+    assert cache.lookup("{}", [1, 0]) is not None
+
+    os.utime(epoch_path, (time.time() + 10, time.time() + 10))
+
+    assert cache.lookup("{}", [1, 0]) is None
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_intent_filter_key_ignores_wording_and_order():
+    first = MovieSearchIntent(
+        synthesized_query="Scary movies from the 80s",
+        query_english="scary",
+        genres=["Horror", "Thriller"],
+        year_min=1980,
+    )
+    second = MovieSearchIntent(
+        synthesized_query="Horror films of the eighties",
+        query_english="horror",
+        genres=["thriller", "horror"],
+        year_min=1980,
+    )
+
+    assert intent_filter_key(first) == intent_filter_key(second)
+    assert intent_filter_key(first) != intent_filter_key(
+        first.model_copy(update={"year_min": 1990})
+    )
@@ -0,0 +1,117 @@
+import pytest
+from qdrant_client import QdrantClient, models
+
+import config
+from benchmark import (
+    FakeDenseEncoder,
+    FakeSparseEncoder,
+    build_fixture_collection,
+    synthetic_rows,
+)
+from candidate_pool import (
+    build_pool,
+    is_narrower,
+    matches_intent,
+    pool_hits,
+    wants_more,
+)
+from models import MovieSearchIntent
+from utils import build_qdrant_filter
+
+
+@pytest.fixture(scope="module")
+def client():
+    client = QdrantClient(location=":memory:")
+    build_fixture_collection(
+        client, synthetic_rows(200), FakeDenseEncoder(), FakeSparseEncoder()
+    )
+    return client
+
+
+def _intent(**filters):
+    return MovieSearchIntent(synthesized_query="q", query_english="q", **filters)
+
+
+@pytest.mark.parametrize(
+    "narrow, base",
+    [
+        (dict(year_min=1995), dict(year_min=1990)),
+        (dict(year_min=1990, year_max=1995), dict(year_max=1999)),
+        (dict(max_runtime=90), dict(max_runtime=120)),
+        (dict(genres=["Horror"]), dict(genres=["Horror", "Thriller"])),
+        (dict(genres=["Horror"], min_score=7.0), dict()),
+        (dict(include_adult=False), dict(include_adult=False)),
+    ],
+)
+def test_is_narrower(narrow, base):
+    assert is_narrower(_intent(**narrow), _intent(**base))
+
+
+@pytest.mark.parametrize(
+    "wider, base",
+    [
+        (dict(year_min=1985), dict(year_min=1990)),
+        (dict(), dict(year_max=1999)),
+        (dict(max_runtime=150), dict(max_runtime=120)),
+        (dict(genres=["Horror", "Comedy"]), dict(genres=["Horror"])),
+        (dict(), dict(original_language="Polish")),
+        (dict(include_adult=None), dict(include_adult=False)),
+        (dict(specific_title="Alien"), dict()),
+    ],
+)
+def test_is_not_narrower(wider, base):
+    assert not is_narrower(_intent(**wider), _intent(**base))
+
+
+@pytest.mark.parametrize(
+    "filters",
+    [
+        dict(genres=["Horror"]),
+        dict(year_min=1990, year_max=1999, min_score=7.0),
+        dict(max_runtime=100, genres=["Comedy", "Drama"]),
+        dict(production_countries=["Poland"], min_vote_count=200),
+        dict(original_language="English", include_adult=False),
+    ],
+)
+def test_matches_intent_agrees_with_qdrant_filter(client, filters):
+    intent = _intent(**filters)
+    points, _ = client.scroll(config.COLLECTION_NAME, limit=1000)
+
+    expected = client.count(
+        config.COLLECTION_NAME, count_filter=build_qdrant_filter(intent)
+    ).count
+
+    assert sum(matches_intent(p.payload, intent) for p in points) == expected
+
+
+def test_pool_round_trips_hits():
+    hits = [
+        models.ScoredPoint(id=7, version=0, score=0.5, payload={"title": "Obcy"}),
+        models.ScoredPoint(id=3, version=0, score=0.25, payload={"title": "Seksmisja"}),
+    ]
+
+    pool = build_pool(
+        MovieSearchIntent(synthesized_query="q", query_english="Space  horror"),
+        hits,
+        [7],
+    )
+
+    assert pool["topic"] == "Space horror"
+    assert pool["shown"] == [7]
+    assert [(h.id, h.score, h.payload) for h in pool_hits(pool)] == [
+        (h.id, h.score, h.payload) for h in hits
+    ]
+
+
+@pytest.mark.parametrize(
+    "question, expected",
+    [
+        ("Pokaż więcej", True),
+        ("jakieś inne?", True),
+        ("A następne?", True),
+        ("coś jeszcze", True),
+        ("Horror z lat 80", False),
+    ],
+)
+def test_wants_more(question, expected):
+    assert wants_more(question) is expected
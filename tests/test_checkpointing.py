@@ -0,0 +1,147 @@
+import operator
+import sqlite3
+import time
+from typing import Annotated, TypedDict
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langchain_core.runnables import RunnableLambda
+from langgraph.graph import END, START, StateGraph
+
+import config
+from checkpointing import BoundedMemorySaver, create_checkpointer
+from nodes import compact_history_node, decide_after_generate
+from utils import HISTORY_SUMMARY_ID, MAX_HISTORY_LENGTH
+
+
+class CounterState(TypedDict):
+    count: Annotated[int, operator.add]
+
+
+def _counter_app(checkpointer):
+    workflow = StateGraph(CounterState)
+    workflow.add_node("step", lambda state: {"count": 1})
+    workflow.add_edge(START, "step")
+    workflow.add_edge("step", END)
+    return workflow.compile(checkpointer=checkpointer)
+
+
+def _run(app, thread_id):
+    return app.invoke({"count": 0}, {"configurable": {"thread_id": thread_id}})
+
+
+def _count(app, thread_id):
+    state = app.get_state({"configurable": {"thread_id": thread_id}})
+    return state.values.get("count")
+
+
+def test_memory_saver_evicts_least_recently_used_thread():
+    app = _counter_app(BoundedMemorySaver(max_threads=2))
+    _run(app, "a")
+    _run(app, "b")
+    _count(app, "a")
+    _run(app, "c")
+
+    assert _count(app, "b") is None
+    assert (_count(app, "a"), _count(app, "c")) == (1, 1)
+
+
+def test_memory_saver_expires_idle_threads(monkeypatch):
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now)
+    app = _counter_app(BoundedMemorySaver(ttl_seconds=60))
+    _run(app, "old")
+
+    monkeypatch.setattr(time, "monotonic", lambda: now + 61)
+    _run(app, "new")
+
+    assert _count(app, "old") is None
+    assert _count(app, "new") == 1
+
+
+def test_memory_saver_keeps_last_checkpoints_and_resumes_state():
+    saver = BoundedMemorySaver(keep_checkpoints=2)
+    app = _counter_app(saver)
+    for _ in range(5):
+        _run(app, "a")
+
+    assert len(saver.storage["a"][""]) == 2
+    assert _count(app, "a") == 5
+
+
+def test_sqlite_saver_survives_restart_and_prunes(tmp_path):
+    path = str(tmp_path / "checkpoints.sqlite")
+    app = _counter_app(create_checkpointer("sqlite", path, keep_checkpoints=2))
+    for _ in range(3):
+        _run(app, "a")
+
+    restarted = _counter_app(create_checkpointer("sqlite", path))
+    assert _count(restarted, "a") == 3
+    with sqlite3.connect(path) as conn:
+        rows = conn.execute(
+            "SELECT COUNT(*) FROM checkpoints WHERE thread_id = 'a'"
+        ).fetchone()
+    assert rows[0] == 2
+
+
+def test_sqlite_saver_evicts_beyond_max_threads(tmp_path):
+    app = _counter_app(
+        create_checkpointer("sqlite", str(tmp_path / "c.sqlite"), max_threads=1)
+    )
+    _run(app, "a")
+    _run(app, "b")
+
+    assert _count(app, "a") is None
+    assert _count(app, "b") == 1
+
+
+def test_unknown_checkpointer_kind():
+    with pytest.raises(ValueError):
+        create_checkpointer("redis")
+
+
+# ===== Kompakcja historii =====
+
+
+def _history(turns: int):
+    messages = []
+    for i in range(turns):
+        messages.append(HumanMessage(content=f"pytanie {i}", id=f"h{i}"))
+        messages.append(AIMessage(content=f"odpowiedź {i}", id=f"a{i}"))
+    return messages
+
+
+def test_compaction_starts_past_limit_and_ignores_summary(monkeypatch):
+    monkeypatch.setattr(config, "HISTORY_COMPACTION", "drop")
+    monkeypatch.setattr(config, "HISTORY_MAX_MESSAGES", 4)
+    summary = SystemMessage(content="streszczenie", id=HISTORY_SUMMARY_ID)
+
+    assert decide_after_generate({"chat_history": [summary, *_history(2)]}) == END
+    assert decide_after_generate({"chat_history": _history(3)}) == "compact_history"
+
+    monkeypatch.setattr(config, "HISTORY_COMPACTION", "off")
+    assert decide_after_generate({"chat_history": _history(3)}) == END
+
+
+def test_compaction_drops_older_messages(monkeypatch):
+    monkeypatch.setattr(config, "HISTORY_COMPACTION", "drop")
+    history = _history(MAX_HISTORY_LENGTH)
+
+    update = compact_history_node({"chat_history": history})
+
+    removed = [message.id for message in update["chat_history"]]
+    assert removed == [m.id for m in history[:-MAX_HISTORY_LENGTH]]
+
+
+def test_compaction_replaces_older_messages_with_summary(monkeypatch):
+    monkeypatch.setattr(config, "HISTORY_COMPACTION", "summarize")
+    monkeypatch.setitem(
+        config._resources, "summarizer_chain", RunnableLambda(lambda _: "o horrorach")
+    )
+    history = _history(MAX_HISTORY_LENGTH)
+
+    update = compact_history_node({"chat_history": history})["chat_history"]
+
+    assert update[1].id == HISTORY_SUMMARY_ID
+    assert "o horrorach" in update[1].content
+    assert update[2:] == history[-MAX_HISTORY_LENGTH:]
@@ -0,0 +1,178 @@
+import threading
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+from qdrant_client import QdrantClient
+
+import ingest
+from backends import dense_vectors_config
+from ingest import COLLECTION_NAME, ensure_collection, run_delta
+from tests.test_ingest import FakeDense, FakeSparse
+
+
+class IndexDense(FakeDense):
+    def get_sentence_embedding_dimension(self):
+        return 4
+
+
+class RecordingClient:
+    """Lokalny Qdrant; zapamiętuje kodowane ID i może odrzucać upserty wybranych filmów."""
+
+    def __init__(self):
+        self._client = QdrantClient(":memory:")
+        self.upserted = []
+        self.fail_ids = set()
+        self.payload_threads = []
+
+    def upsert(self, collection_name, points, wait=True):
+        ids = [p.id for p in points]
+        if self.fail_ids.intersection(ids):
+            raise ConnectionError("upsert failed")
+        self.upserted.extend(ids)
+        return self._client.upsert(collection_name, points=points, wait=wait)
+
+    def batch_update_points(self, collection_name, update_operations, wait=True):
+        self.payload_threads.append(threading.current_thread().name)
+        ids = [op.overwrite_payload.points[0] for op in update_operations]
+        if self.fail_ids.intersection(ids):
+            raise ConnectionError("payload update failed")
+        return self._client.batch_update_points(
+            collection_name, update_operations, wait=wait
+        )
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+def movie(
+    movie_id, overview="A long enough plot summary about a heist gone wrong.", votes=100
+):
+    return {
+        "id": movie_id,
+        "title": f"Movie {movie_id}",
+        "original_title": f"Movie {movie_id}",
+        "overview": overview,
+        "tagline": "",
+        "release_date": "2001-05-04",
+        "vote_average": 7.0,
+        "vote_count": votes,
+        "popularity": 1.0,
+        "runtime": 100,
+        "adult": False,
+        "genres": "Crime",
+        "keywords": "heist",
+        "original_language": "en",
+        "spoken_languages": "English",
+        "production_companies": "Studio",
+        "production_countries": "United States of America",
+        "poster_path": None,
+        "backdrop_path": None,
+        "imdb_id": None,
+    }
+
+
+@pytest.fixture
+def env(tmp_path, monkeypatch):
+    finished = []
+    monkeypatch.setattr(ingest, "finish_indexing", lambda client: finished.append(1))
+    client = RecordingClient()
+    csv_path = str(tmp_path / "tmdb.csv")
+
+    def run(rows):
+        pd.DataFrame(rows).to_csv(csv_path, index=False)
+        client.upserted.clear()
+        args = SimpleNamespace(
+            csv=csv_path,
+            chunk_size=2,
+            encode_batch_size=8,
+            upload_batch_size=8,
+            upload_workers=1,
+        )
+        run_delta(client, IndexDense(), FakeSparse(), args)
+
+    return SimpleNamespace(client=client, run=run, finished=finished)
+
+
+def stored_ids(client):
+    points, _ = client.scroll(COLLECTION_NAME, limit=100)
+    return {p.id for p in points}
+
+
+def test_delta_encodes_only_new_and_changed(env):
+    env.run([movie(1), movie(2), movie(3)])
+    assert sorted(env.client.upserted) == [1, 2, 3]
+
+    env.run(
+        [
+            movie(1),
+            movie(2, overview="A completely different and long enough plot summary."),
+            movie(3, votes=500),
+            movie(4),
+        ]
+    )
+
+    # 2 - nowy tekst, 4 - nowy film; 3 zmienia tylko payload (bez kodowania)
+    assert sorted(env.client.upserted) == [2, 4]
+    points = env.client.retrieve(COLLECTION_NAME, [3])
+    assert points[0].payload["vote_count"] == 500
+    assert len(env.finished) == 2
+
+
+def test_delta_deletes_missing_movies(env):
+    env.run([movie(1), movie(2)])
+    env.run([movie(1)])
+
+    assert stored_ids(env.client) == {1}
+
+
+def test_failed_delta_keeps_stale_points_and_epoch(env):
+    env.run([movie(1), movie(2)])
+    env.client.fail_ids = {3}
+
+    with pytest.raises(ConnectionError):
+        env.run([movie(1), movie(3)])
+
+    # Brak usuwania i nowej epoki po nieudanym zapisie
+    assert stored_ids(env.client) == {1, 2}
+    assert len(env.finished) == 1
+
+    env.client.fail_ids = set()
+    env.run([movie(1), movie(3)])
+    assert env.client.upserted == [3]
+    assert stored_ids(env.client) == {1, 3}
+    assert len(env.finished) == 2
+
+
+def test_payload_updates_run_in_upload_pool(env):
+    env.run([movie(1), movie(2)])
+
+    env.run([movie(1, votes=300), movie(2, votes=400)])
+
+    assert env.client.upserted == []
+    assert env.client.payload_threads
+    assert all(
+        name.startswith("ThreadPoolExecutor") for name in env.client.payload_threads
+    )
+    points = env.client.retrieve(COLLECTION_NAME, [1, 2])
+    assert sorted(p.payload["vote_count"] for p in points) == [300, 400]
+
+
+def test_failed_payload_update_aborts_delta(env):
+    env.run([movie(1), movie(2)])
+    env.client.fail_ids = {2}
+
+    with pytest.raises(ConnectionError):
+        env.run([movie(1), movie(2, votes=400)])
+
+    assert len(env.finished) == 1
+    assert env.client.retrieve(COLLECTION_NAME, [2])[0].payload["vote_count"] == 100
+
+
+def test_delta_rejects_collection_with_other_dense_layout(env):
+    # Kolekcja zbudowana z innym DENSE_DIM (skrócony wektor Matryoshka)
+    ensure_collection(env.client, 4, vectors_config=dense_vectors_config(4, dim=2))
+
+    with pytest.raises(ValueError, match="--recreate"):
+        env.run([movie(1)])
+    assert env.client.upserted == []
@@ -0,0 +1,125 @@
+import numpy as np
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+from fast_path import CentroidRouter, fallback_intent, local_intent, parse_filters
+
+
+@pytest.mark.parametrize(
+    "question, filters",
+    [
+        (
+            "Dobry horror z lat 80",
+            {
+                "genres": ["Horror"],
+                "min_score": 7.0,
+                "year_min": 1980,
+                "year_max": 1989,
+            },
+        ),
+        (
+            "krótka polska komedia po 2010",
+            {
+                "genres": ["Comedy"],
+                "production_countries": ["Poland"],
+                "max_runtime": 100,
+                "year_min": 2011,
+            },
+        ),
+        ("Bardzo krótki film animowany", {"genres": ["Animation"], "max_runtime": 85}),
+        ("thriller z oceną powyżej 7,5", {"genres": ["Thriller"], "min_score": 7.5}),
+        (
+            "filmy wojenne 1990-1995",
+            {"genres": ["War"], "year_min": 1990, "year_max": 1995},
+        ),
+        (
+            "wybitny western przed 1970",
+            {"genres": ["Western"], "min_score": 8.0, "year_max": 1969},
+        ),
+        (
+            "Popularne filmy sci-fi z 2014 roku",
+            {
+                "genres": ["Science Fiction"],
+                "min_vote_count": 200,
+                "year_min": 2014,
+                "year_max": 2014,
+            },
+        ),
+    ],
+)
+def test_parse_filters_rules(question, filters):
+    intent = parse_filters(question)
+
+    assert intent is not None
+    for key, value in filters.items():
+        assert getattr(intent, key) == value, key
+
+
+@pytest.mark.parametrize(
+    "question",
+    [
+        "Film o podróżach w czasie",
+        "horror o nawiedzonym domu",
+        "Cześć, jak się masz?",
+        "",
+    ],
+)
+def test_parse_filters_leaves_topics_to_llm(question):
+    assert parse_filters(question) is None
+
+
+def test_parse_filters_builds_english_query():
+    intent = parse_filters("dobra komedia z lat 90")
+
+    assert intent.synthesized_query == (
+        "Comedy movies released between 1990 and 1999 rated at least 7.0"
+    )
+    assert intent.query_english == "comedy"
+
+
+def test_local_intent_only_on_first_turn():
+    history = [
+        HumanMessage("horror z lat 80"),
+        AIMessage("..."),
+        HumanMessage("a coś nowszego?"),
+    ]
+
+    assert local_intent("horror z lat 80", history[:1]) is not None
+    assert local_intent("horror z lat 80", history) is None
+
+
+def test_fallback_intent_uses_question_when_rules_do_not_cover_it():
+    assert fallback_intent("komedia z lat 90").genres == ["Comedy"]
+    intent = fallback_intent("film o psie, który gra w piłkę")
+    assert intent.synthesized_query == "film o psie, który gra w piłkę"
+    assert intent.genres is None
+
+
+class KeywordEncoder:
+    """Wektor = wystąpienia słów kluczowych - wystarczy do sprawdzenia progów routera."""
+
+    KEYWORDS = ["film", "kino", "cześć"]
+
+    def encode(self, texts):
+        if isinstance(texts, str):
+            texts = [texts]
+        return np.array(
+            [[t.lower().count(k) + 0.01 for k in self.KEYWORDS] for t in texts],
+            dtype=np.float32,
+        )
+
+
+def test_centroid_router_requires_similarity_and_margin():
+    examples = {
+        "vectorstore": ["film", "dobry film"],
+        "web_search": ["kino", "repertuar kino"],
+        "general_chat": ["cześć", "cześć, hej"],
+    }
+    router = CentroidRouter(
+        KeywordEncoder(), examples, min_similarity=0.5, min_margin=0.05
+    )
+
+    assert router.route("jakiś film")[0] == "vectorstore"
+    assert router.route("cześć!")[0] == "general_chat"
+    # Tyle samo z dwóch klas - za mały margines
+    assert router.route("film w kino")[0] is None
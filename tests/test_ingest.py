@@ -0,0 +1,119 @@
+import json
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ingest import Checkpoint, IngestPipeline
+
+CHUNK_SIZE = 10
+
+
+class FakeDense:
+    def encode(self, texts, batch_size=32, show_progress_bar=False):
+        return np.ones((len(texts), 4), dtype=np.float32)
+
+
+class FakeSparse:
+    class _Vector:
+        indices = np.array([1])
+        values = np.array([0.5])
+
+    def embed(self, texts, batch_size=32):
+        return [self._Vector() for _ in texts]
+
+
+class FakeClient:
+    """Zapamiętuje zapisane ID; upserty o numerach z `fail_calls` rzucają wyjątek."""
+
+    def __init__(self, fail_calls=()):
+        self.fail_calls = set(fail_calls)
+        self.calls = 0
+        self.stored = set()
+        self._lock = threading.Lock()
+
+    def upsert(self, collection_name, points, wait=True):
+        with self._lock:
+            call = self.calls
+            self.calls += 1
+        if call in self.fail_calls:
+            raise ConnectionError(f"upsert {call} failed")
+        with self._lock:
+            self.stored.update(p.id for p in points)
+
+
+def prepare(df):
+    ids = df["id"].tolist()
+    return ids, [f"movie {i}" for i in ids], [{"id": i} for i in ids]
+
+
+def chunks(n_chunks=6):
+    for c in range(n_chunks):
+        yield pd.DataFrame({"id": range(c * CHUNK_SIZE, (c + 1) * CHUNK_SIZE)})
+
+
+def make_pipeline(client, checkpoint):
+    return IngestPipeline(
+        client,
+        FakeDense(),
+        FakeSparse(),
+        checkpoint,
+        upload_batch_size=CHUNK_SIZE,
+        upload_workers=1,
+        prepare=prepare,
+    )
+
+
+@pytest.fixture
+def checkpoint_path(tmp_path):
+    return str(tmp_path / "checkpoint.json")
+
+
+def test_run_writes_every_chunk(checkpoint_path):
+    client = FakeClient()
+    checkpoint = Checkpoint(checkpoint_path, "movies.csv", CHUNK_SIZE)
+
+    written = make_pipeline(client, checkpoint).run(chunks())
+
+    assert written == 6 * CHUNK_SIZE
+    assert client.stored == set(range(6 * CHUNK_SIZE))
+    with open(checkpoint_path, encoding="utf-8") as f:
+        assert json.load(f)["done_chunks"] == list(range(6))
+
+
+def test_failed_upsert_is_raised_and_not_checkpointed(checkpoint_path):
+    client = FakeClient(fail_calls={0})
+    checkpoint = Checkpoint(checkpoint_path, "movies.csv", CHUNK_SIZE)
+
+    with pytest.raises(ConnectionError):
+        make_pipeline(client, checkpoint).run(chunks())
+
+    assert 0 not in checkpoint.done_chunks
+    # Każdy chunk w checkpoincie jest naprawdę w bazie
+    for chunk_idx in checkpoint.done_chunks:
+        ids = range(chunk_idx * CHUNK_SIZE, (chunk_idx + 1) * CHUNK_SIZE)
+        assert client.stored.issuperset(ids)
+
+
+def test_resume_after_failure_writes_missing_chunks(checkpoint_path):
+    client = FakeClient(fail_calls={2})
+    with pytest.raises(ConnectionError):
+        make_pipeline(
+            client, Checkpoint(checkpoint_path, "movies.csv", CHUNK_SIZE)
+        ).run(chunks())
+
+    client.fail_calls = set()
+    checkpoint = Checkpoint(checkpoint_path, "movies.csv", CHUNK_SIZE).load()
+    make_pipeline(client, checkpoint).run(chunks())
+
+    assert client.stored == set(range(6 * CHUNK_SIZE))
+    assert checkpoint.done_chunks == set(range(6))
+    assert checkpoint.points == 6 * CHUNK_SIZE
+
+
+def test_checkpoint_rejects_other_chunk_size(checkpoint_path):
+    Checkpoint(checkpoint_path, "movies.csv", CHUNK_SIZE).mark_done(0, 5)
+
+    with pytest.raises(ValueError):
+        Checkpoint(checkpoint_path, "movies.csv", CHUNK_SIZE * 2).load()
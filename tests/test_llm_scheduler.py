@@ -0,0 +1,239 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+import llm_scheduler
+from llm_scheduler import (
+    LLMScheduler,
+    LLMUnavailable,
+    TokenBucket,
+    refunded_tokens,
+    retry_delay,
+    scheduled_chat_class,
+)
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class FakeChat(BaseChatModel):
+    """Odpowiada "ok"; kolejne wywołania zaczynają się od wyjątków z `errors`."""
+
+    errors: list = []
+    calls: int = 0
+
+    @property
+    def _llm_type(self):
+        return "fake"
+
+    def _next(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self._next()
+        return ChatResult(generations=[ChatGeneration(message=AIMessage("ok"))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        return self._generate(messages, stop, run_manager, **kwargs)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        self._next()
+        yield ChatGenerationChunk(message=AIMessageChunk(content="o"))
+        if self.errors:
+            raise self.errors.pop(0)
+        yield ChatGenerationChunk(message=AIMessageChunk(content="k"))
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(llm_scheduler, "RETRY_BACKOFF", 0.01)
+
+
+def chat(scheduler, errors=(), priority="generate"):
+    return scheduled_chat_class(FakeChat)(
+        scheduler=scheduler, priority=priority, errors=list(errors)
+    )
+
+
+def tokens_left(scheduler):
+    return scheduler.stats()["tokens_available"]["ScheduledFakeChat"]
+
+
+def test_token_bucket_refills_linearly():
+    bucket = TokenBucket(60)
+    now = bucket.updated
+    bucket.take(60)
+
+    assert bucket.wait_time(30, now) == pytest.approx(30.0)
+    assert bucket.available(now + 10) == pytest.approx(10.0)
+
+
+def test_unlimited_bucket_never_waits():
+    bucket = TokenBucket(0)
+    bucket.take(1000)
+
+    assert bucket.wait_time(1000, time.monotonic()) == 0.0
+
+
+def test_grants_follow_priority():
+    scheduler = LLMScheduler(
+        requests_per_minute=0, tokens_per_minute=0, max_concurrency=1
+    )
+    blocker = scheduler.acquire(
+        "m", "generate", 1, scheduler.request_deadline("generate")
+    )
+    order = []
+
+    def call(priority):
+        lease = scheduler.acquire("m", priority, 1, time.monotonic() + 5)
+        order.append(priority)
+        lease.release(1)
+
+    threads = [
+        threading.Thread(target=call, args=(p,))
+        for p in ("optional", "route", "generate")
+    ]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.05)
+    blocker.release(1)
+    for thread in threads:
+        thread.join(2)
+
+    assert order == ["generate", "route", "optional"]
+
+
+def test_expired_request_is_shed():
+    scheduler = LLMScheduler(
+        requests_per_minute=0, tokens_per_minute=0, max_concurrency=1
+    )
+    scheduler.acquire("m", "generate", 1, time.monotonic() + 5)
+
+    with pytest.raises(LLMUnavailable):
+        scheduler.acquire("m", "route", 1, time.monotonic() + 0.1)
+
+
+def test_optional_call_does_not_use_reserve():
+    scheduler = LLMScheduler(tokens_per_minute=1000, optional_reserve=0.2)
+    scheduler.acquire("m", "generate", 750, time.monotonic() + 5).release(750)
+
+    with pytest.raises(LLMUnavailable):
+        scheduler.acquire("m", "optional", 100, scheduler.request_deadline("optional"))
+    # Odpowiedź dla użytkownika może sięgnąć po rezerwę
+    scheduler.acquire("m", "generate", 100, time.monotonic() + 5).release(100)
+
+
+def test_async_acquire_cancellation_frees_slot():
+    scheduler = LLMScheduler(
+        requests_per_minute=0, tokens_per_minute=0, max_concurrency=1
+    )
+    blocker = scheduler.acquire("m", "generate", 1, time.monotonic() + 5)
+
+    async def main():
+        task = asyncio.create_task(
+            scheduler.aacquire("m", "route", 1, time.monotonic() + 5)
+        )
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    blocker.release(1)
+    scheduler.acquire("m", "route", 1, time.monotonic() + 1).release(1)
+    assert scheduler.stats()["running"] == 0
+
+
+def test_retry_delay_classifies_errors():
+    assert retry_delay(StatusError(503), 0) == 0.01
+    assert retry_delay(StatusError(408), 1) == 0.02
+    assert retry_delay(ConnectionResetError(), 0) == 0.01
+    assert retry_delay(TimeoutError(), 0) == 0.01
+    assert retry_delay(StatusError(503), llm_scheduler.MAX_RETRIES) is None
+    assert retry_delay(StatusError(400), 0) is None
+    assert retry_delay(ValueError(), 0) is None
+
+
+def test_refund_only_for_unaccepted_requests():
+    assert refunded_tokens(StatusError(429)) == 0
+    assert refunded_tokens(ConnectionRefusedError()) == 0
+    assert refunded_tokens(TimeoutError()) is None
+    assert refunded_tokens(StatusError(500)) is None
+
+
+def test_transient_errors_are_retried():
+    scheduler = LLMScheduler(tokens_per_minute=0)
+    model = chat(scheduler, errors=[StatusError(503), ConnectionResetError()])
+
+    assert model.invoke([HumanMessage("hi")]).content == "ok"
+    assert model.calls == 3
+
+
+def test_retries_are_bounded():
+    scheduler = LLMScheduler(tokens_per_minute=0)
+    model = chat(scheduler, errors=[StatusError(500)] * 3)
+
+    with pytest.raises(StatusError):
+        model.invoke([HumanMessage("hi")])
+    assert model.calls == llm_scheduler.MAX_RETRIES + 1
+
+
+def test_client_errors_are_not_retried():
+    scheduler = LLMScheduler(tokens_per_minute=0)
+    model = chat(scheduler, errors=[StatusError(400)])
+
+    with pytest.raises(StatusError):
+        model.invoke([HumanMessage("hi")])
+    assert model.calls == 1
+
+
+def test_rate_limit_pauses_and_retries():
+    scheduler = LLMScheduler(tokens_per_minute=0)
+    error = StatusError(429)
+    error.response = type("Response", (), {"headers": {"retry-after": "0.2"}})()
+    model = chat(scheduler, errors=[error])
+
+    start = time.monotonic()
+    assert asyncio.run(model.ainvoke([HumanMessage("hi")])).content == "ok"
+    assert time.monotonic() - start >= 0.2
+
+
+def test_timeout_keeps_token_reservation():
+    scheduler = LLMScheduler(tokens_per_minute=10000)
+    chat(scheduler).invoke([HumanMessage("hi")])
+    before = tokens_left(scheduler)
+
+    with pytest.raises(TimeoutError):
+        chat(scheduler, errors=[TimeoutError()] * 3).invoke([HumanMessage("hi")])
+    assert tokens_left(scheduler) < before
+
+
+def test_rejected_request_refunds_tokens():
+    scheduler = LLMScheduler(tokens_per_minute=10000)
+    model = chat(scheduler, errors=[ConnectionRefusedError()] * 3)
+
+    with pytest.raises(ConnectionRefusedError):
+        model.invoke([HumanMessage("hi")])
+    assert tokens_left(scheduler) == pytest.approx(10000, abs=1)
+
+
+def test_stream_is_not_retried_after_first_chunk():
+    scheduler = LLMScheduler(tokens_per_minute=0)
+    model = chat(scheduler)
+    stream = model.stream([HumanMessage("hi")])
+    assert next(stream).content == "o"
+    model.errors.append(StatusError(503))
+
+    with pytest.raises(StatusError):
+        list(stream)
+    assert model.calls == 1
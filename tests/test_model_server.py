@@ -0,0 +1,126 @@
+import os
+import socket
+import stat
+import tempfile
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+import pytest
+
+from benchmark import FakeDenseEncoder, FakeReranker, FakeSparseEncoder
+from model_server import (
+    ModelServer,
+    ModelServerClient,
+    RemoteDenseEncoder,
+    RemoteReranker,
+    RemoteSparseEncoder,
+    _recv,
+    _send,
+)
+
+TEXTS = ["haunted house ghost family", "bank heist crew", "space station astronaut"]
+
+
+@pytest.fixture(scope="module")
+def server():
+    # Krótka ścieżka - gniazda Unix mają limit ~100 znaków
+    socket_path = os.path.join(tempfile.mkdtemp(prefix="model_server_"), "m.sock")
+    server = ModelServer(
+        socket_path, FakeDenseEncoder(), FakeSparseEncoder(), FakeReranker()
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client(server):
+    client = ModelServerClient(server.server_address)
+    yield client
+    client.close()
+
+
+def _exists(name: str) -> bool:
+    try:
+        shared_memory.SharedMemory(name=name).close()
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def test_socket_is_private(server):
+    assert stat.S_IMODE(os.stat(server.server_address).st_mode) == 0o600
+
+
+def test_dense_round_trip(client):
+    encoder = RemoteDenseEncoder(client)
+
+    np.testing.assert_allclose(encoder.encode(TEXTS), FakeDenseEncoder().encode(TEXTS))
+    np.testing.assert_allclose(
+        encoder.encode(TEXTS[0]), FakeDenseEncoder().encode(TEXTS[0])
+    )
+    assert encoder.get_sentence_embedding_dimension() == len(encoder.encode("a"))
+
+
+def test_sparse_round_trip(client):
+    remote = list(RemoteSparseEncoder(client).embed(TEXTS))
+    local = list(FakeSparseEncoder().embed(TEXTS))
+
+    assert len(remote) == len(local)
+    for got, expected in zip(remote, local):
+        np.testing.assert_array_equal(got.indices, expected.indices)
+        np.testing.assert_allclose(got.values, expected.values)
+    assert list(RemoteSparseEncoder(client).embed([])) == []
+
+
+def test_rerank_round_trip(client):
+    pairs = [("ghost house", TEXTS[0]), ("ghost house", TEXTS[1])]
+
+    np.testing.assert_allclose(
+        RemoteReranker(client).predict(pairs), FakeReranker().predict(pairs)
+    )
+    assert len(RemoteReranker(client).predict([])) == 0
+
+
+def test_small_buffer_is_regrown_and_old_one_unlinked(server):
+    client = ModelServerClient(server.server_address, buffer_size=64)
+    try:
+        first = client._connection()[1].name
+        vectors = RemoteDenseEncoder(client).encode(TEXTS * 4)
+
+        np.testing.assert_allclose(vectors, FakeDenseEncoder().encode(TEXTS * 4))
+        assert client._connection()[1].size >= vectors.nbytes
+        assert not _exists(first)
+    finally:
+        client.close()
+
+
+def test_close_and_dropped_connection_unlink_buffers(server):
+    client = ModelServerClient(server.server_address)
+    name = client._connection()[1].name
+    client.close()
+    assert not _exists(name)
+
+    client = ModelServerClient(server.server_address)
+    sock, buffer = client._connection()
+    sock.shutdown(socket.SHUT_RDWR)
+    with pytest.raises(ConnectionError):
+        client.call("dense", texts=TEXTS)
+    assert not _exists(buffer.name)
+    client.close()
+
+
+def test_server_rejects_foreign_buffer(server):
+    victim = shared_memory.SharedMemory(create=True, size=64)
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(server.server_address)
+            _send(sock, {"op": "attach", "name": victim.name})
+
+            assert "error" in _recv(sock)
+            assert _recv(sock) is None
+    finally:
+        victim.close()
+        victim.unlink()
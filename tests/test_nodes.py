@@ -0,0 +1,186 @@
+import asyncio
+import re
+import uuid
+
+import pytest
+from langchain_core.runnables import RunnableLambda
+
+import config
+from cache import AnswerCache
+from benchmark import (
+    FAKE_ANSWER,
+    SCENARIOS,
+    VECTORSTORE,
+    _run_inputs,
+    reset_query_caches,
+)
+from llm_scheduler import LLMUnavailable
+from nodes import BUSY_ANSWER, fast_grade, grader_stats
+from utils import aanalyze_intent
+
+
+def _unavailable(inputs):
+    raise LLMUnavailable("Brak przydziału LLM przed terminem")
+
+
+@pytest.fixture
+def unavailable(graph, monkeypatch):
+    """Podmienia wskazane łańcuchy LLM na takie, które nie dostają przydziału."""
+    monkeypatch.setattr(config, "FAST_PATH", False)
+    replaced = {}
+
+    def make(*names):
+        for name in names:
+            replaced[name] = config.get(name)
+            config.override(name, RunnableLambda(_unavailable))
+
+    yield make
+    for name, value in replaced.items():
+        config.override(name, value)
+
+
+def ask(app, question, use_async=False, thread_id=None):
+    inputs, run_config = _run_inputs(question, thread_id)
+    if use_async:
+        return asyncio.run(app.ainvoke(inputs, config=run_config))
+    return app.invoke(inputs, config=run_config)
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_generator_unavailable_returns_busy_answer(graph, unavailable, use_async):
+    unavailable("llm_generator")
+
+    state = ask(graph, VECTORSTORE.question, use_async)
+
+    assert state["generation"] == BUSY_ANSWER
+    assert state["chat_history"][-1].content == BUSY_ANSWER
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_router_unavailable_falls_back_to_search(graph, unavailable, use_async):
+    unavailable("route_and_analyze_chain")
+
+    state = ask(graph, VECTORSTORE.question, use_async)
+
+    assert state["destination"] == "vectorstore"
+    assert state["llm_skipped"] == "route"
+    assert state["generation"] == FAKE_ANSWER
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_separate_routing_without_llm(graph, unavailable, monkeypatch, use_async):
+    monkeypatch.setattr(config, "ROUTING_MODE", "separate")
+    unavailable("route_chain", "query_analyzer")
+
+    state = ask(graph, VECTORSTORE.question, use_async)
+
+    assert state["destination"] == "vectorstore"
+    assert state["generation"] == FAKE_ANSWER
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_analyzer_unavailable_searches_raw_question(
+    graph, unavailable, monkeypatch, use_async
+):
+    monkeypatch.setattr(config, "ROUTING_MODE", "separate")
+    unavailable("query_analyzer")
+
+    state = ask(graph, VECTORSTORE.question, use_async)
+
+    assert state["search_intent"]["synthesized_query"] == VECTORSTORE.question
+    assert state["generation"] == FAKE_ANSWER
+
+
+def test_analyzer_encodes_only_rewritten_queries(graph, monkeypatch):
+    monkeypatch.setattr(config, "FAST_PATH", False)
+    reset_query_caches()
+    rewritten = "haunted mansion ghost story"
+
+    asyncio.run(aanalyze_intent(VECTORSTORE.question))
+    asyncio.run(aanalyze_intent(rewritten, prefetch_query=True))
+
+    # Pytanie użytkownika nie jest wyszukiwane - jego embedding byłby zbędny
+    assert config.query_embedding_cache.get(VECTORSTORE.question) is None
+    assert config.query_embedding_cache.get(rewritten) is not None
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_separate_routing_analyzes_only_searches(graph, monkeypatch, use_async):
+    monkeypatch.setattr(config, "FAST_PATH", False)
+    monkeypatch.setattr(config, "ROUTING_MODE", "separate")
+    analyzer = config.get("query_analyzer")
+    calls = []
+
+    def counted(inputs):
+        calls.append(inputs["query"])
+        return analyzer.invoke(inputs)
+
+    config.override("query_analyzer", RunnableLambda(counted))
+    try:
+        chat = next(s for s in SCENARIOS if s.path == "general_chat")
+        assert ask(graph, chat.question, use_async)["destination"] == "general_chat"
+        assert calls == []
+
+        ask(graph, VECTORSTORE.question, use_async)
+        assert calls == [VECTORSTORE.question]
+    finally:
+        config.override("query_analyzer", analyzer)
+
+
+@pytest.mark.parametrize(
+    "scores, decision",
+    [
+        ([], None),
+        ([-6.0, -7.5, -9.0], "no"),
+        ([0.5, -1.0, -2.0], None),
+        ([6.0, 2.0, 1.5, 0.5], "yes"),
+        ([7.0, 6.5, 5.9, 5.2], "yes"),
+        ([3.2, 2.9, 2.8, 2.6], None),
+        ([3.5], "yes"),
+    ],
+)
+def test_fast_grade(scores, decision):
+    assert fast_grade(scores) == decision
+
+
+def test_title_hits_skip_grading_without_cross_encoder_scores(graph):
+    title = next(s for s in SCENARIOS if s.path == "title")
+    before = grader_stats["title"]
+
+    state = ask(graph, title.question)
+
+    assert state["title_match"] is True
+    assert state["rerank_scores"] == []
+    assert "Bank Story 42" in state["context"]
+    assert grader_stats["title"] == before + 1
+
+
+def test_search_results_carry_raw_cross_encoder_scores(graph, monkeypatch):
+    monkeypatch.setattr(config, "ANSWER_CACHE_SIZE", 0)
+
+    state = ask(graph, VECTORSTORE.question)
+
+    assert state["title_match"] is False
+    assert state["rerank_scores"]
+
+
+def _titles(context: str) -> set:
+    return set(re.findall(r"^Title: (.*)$", context, re.MULTILINE))
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_more_follow_up_bypasses_answer_cache(graph, monkeypatch, use_async):
+    monkeypatch.setattr(config, "FAST_PATH", False)
+    monkeypatch.setattr(config, "ANSWER_CACHE_SIZE", 512)
+    config.override("answer_cache", AnswerCache(similarity=0.9))
+    more = next(s for s in SCENARIOS if s.path == "more")
+    thread_id = str(uuid.uuid4())
+    try:
+        first = ask(graph, VECTORSTORE.question, use_async, thread_id)
+        second = ask(graph, more.question, use_async, thread_id)
+    finally:
+        config.reset("answer_cache")
+
+    assert not second["answer_cached"]
+    assert _titles(first["context"])
+    assert not _titles(first["context"]) & _titles(second["context"])
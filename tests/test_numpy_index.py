@@ -0,0 +1,102 @@
+import pytest
+from qdrant_client import QdrantClient, models
+
+import config
+from backends import QdrantBackend, SearchBackend
+from benchmark import (
+    FakeDenseEncoder,
+    FakeSparseEncoder,
+    build_fixture_collection,
+    synthetic_rows,
+)
+from models import MovieSearchIntent
+from numpy_index import NumpyBackend, export_collection
+from utils import build_qdrant_filter
+
+INTENTS = [
+    dict(genres=["Horror"]),
+    dict(year_min=1990, year_max=1999, min_score=7.0),
+    dict(max_runtime=100, genres=["Comedy", "Drama"]),
+    dict(production_countries=["Poland"], min_vote_count=200),
+    dict(original_language="English", include_adult=True),
+]
+
+
+@pytest.fixture(scope="module")
+def backends(tmp_path_factory):
+    client = QdrantClient(location=":memory:")
+    dense, sparse = FakeDenseEncoder(), FakeSparseEncoder()
+    build_fixture_collection(client, synthetic_rows(400), dense, sparse)
+    out_dir = str(tmp_path_factory.mktemp("numpy_index"))
+    export_collection(client, out_dir)
+    return client, QdrantBackend(client), NumpyBackend(out_dir), dense, sparse
+
+
+def _intent(**filters):
+    return MovieSearchIntent(synthesized_query="q", query_english="q", **filters)
+
+
+@pytest.mark.parametrize("filters", INTENTS)
+def test_filter_mask_matches_qdrant_count(backends, filters):
+    client, _, numpy_backend, _, _ = backends
+    qdrant_filter = build_qdrant_filter(_intent(**filters))
+
+    expected = client.count(config.COLLECTION_NAME, count_filter=qdrant_filter).count
+
+    mask = numpy_backend.filter_mask(qdrant_filter)
+    assert int(mask.sum()) == expected
+
+
+def test_search_overlaps_qdrant_and_respects_filters(backends):
+    # Syntetyczne wiersze mają wiele remisów, więc porównujemy zbiory, a nie kolejność
+    _, qdrant_backend, numpy_backend, dense, sparse = backends
+    query = "haunted house ghost family"
+    query_dense = dense.encode([query])[0].tolist()
+    vector = next(iter(sparse.embed([query])))
+    query_sparse = models.SparseVector(
+        indices=vector.indices.tolist(), values=vector.values.tolist()
+    )
+    filters = [None, build_qdrant_filter(_intent(year_min=1990))]
+
+    expected = qdrant_backend.search_batch(query_dense, query_sparse, filters, limit=10)
+    actual = numpy_backend.search_batch(query_dense, query_sparse, filters, limit=10)
+
+    for qdrant_hits, numpy_hits in zip(expected, actual):
+        assert len(numpy_hits) == len(qdrant_hits) == 10
+        assert len({h.id for h in numpy_hits} & {h.id for h in qdrant_hits}) >= 3
+    assert all(hit.payload["year"] >= 1990 for hit in actual[1])
+
+
+def test_retrieve_and_payload_selection(backends):
+    client, qdrant_backend, numpy_backend, _, _ = backends
+    ids = [point_id for point_id, _ in qdrant_backend.scroll_payloads(["title"])][:3]
+
+    records = numpy_backend.retrieve(ids + [-1], with_payload=["title", "year"])
+
+    assert [r.id for r in records] == ids
+    expected = {r.id: r.payload for r in client.retrieve(config.COLLECTION_NAME, ids)}
+    for record in records:
+        assert record.payload == {
+            "title": expected[record.id]["title"],
+            "year": expected[record.id]["year"],
+        }
+    assert len(numpy_backend) == client.count(config.COLLECTION_NAME).count
+
+
+def test_filter_on_unknown_column_is_rejected(backends):
+    _, _, numpy_backend, _, _ = backends
+    unknown = models.Filter(
+        must=[models.FieldCondition(key="director", match=models.MatchValue(value="x"))]
+    )
+
+    with pytest.raises(ValueError):
+        numpy_backend.filter_mask(unknown)
+
+
+def test_incomplete_backend_fails_on_creation():
+    class SearchOnly(SearchBackend):
+        def search_batch(self, *args, **kwargs):
+            return []
+
+    with pytest.raises(TypeError):
+        SearchOnly()
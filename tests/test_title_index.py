@@ -0,0 +1,69 @@
+import pytest
+
+from title_index import TitleIndex, build_title_index, normalize_title
+
+ROWS = [
+    (1, "Amélie", "Le Fabuleux Destin d'Amélie Poulain", 9000),
+    (2, "Titanic", None, 25000),
+    (3, "Titanic", None, 40),
+    (4, "Seksmisja", None, 500),
+    (5, "The Godfather", "The Godfather", 20000),
+    (6, "The Godfather Part II", None, 12000),
+]
+
+
+@pytest.fixture(scope="module")
+def index():
+    return TitleIndex(ROWS)
+
+
+def test_normalize_title_drops_case_accents_and_punctuation():
+    assert normalize_title("Amélie (2001)!") == "amelie 2001"
+    assert normalize_title("  Ocean's_Eleven ") == "ocean s eleven"
+
+
+def test_exact_lookup_orders_remakes_by_votes(index):
+    assert index.lookup("TITANIC") == [(2, 1.0), (3, 1.0)]
+    assert index.lookup("titanic", limit=1) == [(2, 1.0)]
+
+
+def test_exact_lookup_matches_original_title(index):
+    assert index.lookup("Le fabuleux destin d'Amelie Poulain") == [(1, 1.0)]
+
+
+def test_fuzzy_lookup_tolerates_typos(index):
+    point_id, similarity = index.lookup("Seksmisa")[0]
+
+    assert point_id == 4
+    assert 0.85 <= similarity < 1.0
+
+
+def test_fuzzy_lookup_ranks_closest_title_first(index):
+    results = index.lookup("The Godfather Part 2", min_similarity=0.7)
+
+    assert [point_id for point_id, _ in results] == [6, 5]
+
+
+def test_lookup_without_match(index):
+    assert index.lookup("Zupełnie inny film") == []
+    assert index.lookup("?!") == []
+
+
+class FakeBackend:
+    def scroll_payloads(self, fields):
+        for point_id, title, original_title, votes in ROWS:
+            yield point_id, {
+                "title": title,
+                "original_title": original_title,
+                "vote_count": votes,
+            }
+
+
+def test_build_title_index_saves_and_loads(tmp_path):
+    path = str(tmp_path / "titles.json")
+
+    built = build_title_index(FakeBackend(), path)
+    loaded = TitleIndex.load(path)
+
+    assert len(loaded) == len(built) == len(ROWS)
+    assert loaded.lookup("Amelie") == built.lookup("Amelie") == [(1, 1.0)]
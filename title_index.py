@@ -0,0 +1,165 @@
+"""
+Indeks tytułów filmów (`title` i `original_title`) dla pytań o konkretny film.
+
+Pytanie "opowiedz o Titanicu" nie potrzebuje wyszukiwania hybrydowego ani rerankera:
+intencja ma już `specific_title`, więc wystarczy znaleźć punkt o tym tytule.
+  - dopasowanie dokładne: słownik znormalizowany tytuł -> punkty (bez wielkości liter,
+    akcentów i interpunkcji),
+  - dopasowanie przybliżone: kandydaci z odwróconego indeksu trygramów (współczynnik Dice),
+    potwierdzani podobieństwem edycyjnym (`difflib`) - literówki, "Amelie" vs "Amélie" itp.
+
+Indeks budowany jest z payloadów kolekcji (`SearchBackend.scroll_payloads`) i zapisywany
+do pliku JSON przez `ingest.py`; aplikacja wczytuje plik albo buduje indeks sama, gdy pliku
+nie ma lub jest starszy niż ostatnie indeksowanie.
+"""
+
+import difflib
+import json
+import logging
+import re
+import unicodedata
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TITLE_FIELDS = ["title", "original_title", "vote_count"]
+# Kandydaci z trygramów sprawdzani podobieństwem edycyjnym
+FUZZY_CANDIDATES = 20
+# Minimalny współczynnik Dice trygramów, żeby kandydat w ogóle był sprawdzany
+MIN_TRIGRAM_DICE = 0.4
+
+_NON_ALNUM = re.compile(r"[^\w]+")
+
+
+def normalize_title(title: str) -> str:
+    """Małe litery bez akcentów i interpunkcji: "Amélie (2001)!" -> "amelie 2001"."""
+    decomposed = unicodedata.normalize("NFKD", title.casefold())
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return " ".join(_NON_ALNUM.sub(" ", stripped).replace("_", " ").split())
+
+
+def trigrams(normalized: str) -> set:
+    padded = f"  {normalized} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class TitleIndex:
+    """Dokładne i przybliżone wyszukiwanie punktów po tytule."""
+
+    def __init__(self, rows: Iterable[Tuple[int, str, Optional[str], int]]):
+        # Wiersze (id, tytuł, tytuł oryginalny, liczba głosów) - w tej postaci idą też do pliku
+        self.rows = [
+            (point_id, title, original_title, votes or 0)
+            for point_id, title, original_title, votes in rows
+        ]
+
+        points: Dict[str, Dict[int, int]] = defaultdict(dict)
+        for point_id, title, original_title, votes in self.rows:
+            for name in (title, original_title):
+                key = normalize_title(name) if name else ""
+                if key:
+                    points[key][point_id] = votes
+
+        self.keys: List[str] = list(points)
+        # Przy tym samym tytule (remaki) najpierw filmy z większą liczbą głosów
+        self.points: Dict[str, List[int]] = {
+            key: sorted(ids, key=ids.get, reverse=True) for key, ids in points.items()
+        }
+
+        postings = defaultdict(list)
+        sizes = np.zeros(len(self.keys), dtype=np.int32)
+        for position, key in enumerate(self.keys):
+            grams = trigrams(key)
+            sizes[position] = len(grams)
+            for gram in grams:
+                postings[gram].append(position)
+        self._trigram_sizes = sizes
+        self._postings = {
+            gram: np.asarray(positions, dtype=np.int32)
+            for gram, positions in postings.items()
+        }
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def lookup(
+        self, title: str, limit: int = 5, min_similarity: float = 0.85
+    ) -> List[Tuple[int, float]]:
+        """
+        Punkty pasujące do tytułu jako (id, podobieństwo): najpierw dopasowanie dokładne
+        (podobieństwo 1.0), a gdy go nie ma - najbliższe tytuły z podobieństwem >= `min_similarity`.
+        """
+        key = normalize_title(title)
+        if not key:
+            return []
+        if key in self.points:
+            return [(point_id, 1.0) for point_id in self.points[key][:limit]]
+        return self._fuzzy(key, limit, min_similarity)
+
+    def _fuzzy(
+        self, key: str, limit: int, min_similarity: float
+    ) -> List[Tuple[int, float]]:
+        query_grams = trigrams(key)
+        grams = [g for g in query_grams if g in self._postings]
+        if not grams:
+            return []
+        positions, shared = np.unique(
+            np.concatenate([self._postings[g] for g in grams]), return_counts=True
+        )
+        dice = 2.0 * shared / (len(query_grams) + self._trigram_sizes[positions])
+        keep = dice >= MIN_TRIGRAM_DICE
+        positions, dice = positions[keep], dice[keep]
+        if len(positions) > FUZZY_CANDIDATES:
+            best = np.argpartition(-dice, FUZZY_CANDIDATES)[:FUZZY_CANDIDATES]
+            positions = positions[best]
+
+        matches = []
+        for position in positions:
+            candidate = self.keys[position]
+            similarity = difflib.SequenceMatcher(None, key, candidate).ratio()
+            if similarity >= min_similarity:
+                matches.append((similarity, candidate))
+        matches.sort(key=lambda match: match[0], reverse=True)
+
+        results, seen = [], set()
+        for similarity, candidate in matches:
+            for point_id in self.points[candidate]:
+                if point_id not in seen:
+                    seen.add(point_id)
+                    results.append((point_id, similarity))
+        return results[:limit]
+
+    # ===== BUDOWA I ZAPIS =====
+
+    @classmethod
+    def from_backend(cls, backend) -> "TitleIndex":
+        return cls(
+            (
+                point_id,
+                payload.get("title"),
+                payload.get("original_title"),
+                payload.get("vote_count"),
+            )
+            for point_id, payload in backend.scroll_payloads(TITLE_FIELDS)
+        )
+
+    def save(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"rows": self.rows}, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path: str) -> "TitleIndex":
+        with open(path, encoding="utf-8") as f:
+            return cls(tuple(row) for row in json.load(f)["rows"])
+
+
+def build_title_index(backend, path: Optional[str] = None) -> TitleIndex:
+    """Buduje indeks z payloadów kolekcji i (opcjonalnie) zapisuje go do pliku."""
+    index = TitleIndex.from_backend(backend)
+    logger.info("🎬 Indeks tytułów: %d filmów, %d tytułów", len(index), len(index.keys))
+    if path:
+        index.save(path)
+    return index
@@ -1,18 +1,43 @@
 import streamlit as st
 import uuid
-from film_agent import app
+import config
+import telemetry
+from film_agent import session_messages, stream_answer
 from langchain_core.messages import HumanMessage
 
 st.set_page_config(page_title="Film Agent", page_icon="🎬")
 
+
+@st.cache_resource(show_spinner="Ładowanie modeli...")
+def warmup_resources():
+    # Modele ładują się raz na proces, zanim użytkownik zada pierwsze pytanie
+    config.warmup()
+    return True
+
+
+warmup_resources()
+
+with st.sidebar.expander("📊 Telemetria"):
+    # Czasy etapów (ms) i liczniki z telemetry.py, od startu procesu
+    snapshot = telemetry.metrics.snapshot()
+    if snapshot["histograms"]:
+        st.dataframe(snapshot["histograms"])
+    st.json(snapshot["counters"])
+    if config.is_loaded("llm_scheduler"):
+        # Kolejka wywołań LLM (llm_scheduler.py): oczekujące według priorytetu i budżet tokenów
+        st.json(config.llm_scheduler.stats())
+
 st.title("Filmowiec AI 🎬")
 st.markdown("Twój kinowy ekspert AI. Zapytaj o cokolwiek związanego z filmami!")
 
-if "messages" not in st.session_state:
-    st.session_state.messages = []
-
 if "thread_id" not in st.session_state:
-    st.session_state.thread_id = str(uuid.uuid4())
+    # Id rozmowy w adresie strony - odświeżenie lub restart serwera (z CHECKPOINTER=sqlite)
+    # wraca do tej samej rozmowy
+    st.session_state.thread_id = st.query_params.get("thread") or str(uuid.uuid4())
+    st.query_params["thread"] = st.session_state.thread_id
+
+if "messages" not in st.session_state:
+    st.session_state.messages = session_messages(st.session_state.thread_id)
 
 for message in st.session_state.messages:
     with st.chat_message(message["role"]):
@@ -39,20 +64,32 @@ if prompt := st.chat_input("Jakiego flmu szukasz? (np., 'Polska komedia z lat 90
                     "chat_history": [HumanMessage(content=prompt)],
                 }
 
-                config = {"configurable": {"thread_id": st.session_state.thread_id}}
-
-                for event in app.stream(inputs, config=config):
-                    for node, values in event.items():
-                        if node == "retrieve":
-                            status_placeholder.text("🔍 Szukanie filmów...")
-                        elif node == "grade_documents":
-                            status_placeholder.text("⚖️ Ocenianie relewancji...")
-                        elif node == "rewrite_query":
-                            status_placeholder.text("🔄 Poprawianie zapytania...")
-                        elif node == "generate":
+                run_config = {"configurable": {"thread_id": st.session_state.thread_id}}
+
+                for kind, payload, values in stream_answer(inputs, run_config):
+                    if kind == "token":
+                        if not full_response:
                             status_placeholder.empty()
-                            full_response = values["generation"]
-                            message_placeholder.markdown(full_response)
+                        full_response += payload
+                        message_placeholder.markdown(full_response + "▌")
+                        continue
+
+                    node = payload
+                    if node == "route":
+                        status_placeholder.text("🧭 Analizowanie pytania...")
+                    elif node == "retrieve":
+                        status_placeholder.text("🔍 Szukanie filmów...")
+                    elif node == "grade_documents":
+                        status_placeholder.text("⚖️ Ocenianie relewancji...")
+                    elif node == "rewrite_query":
+                        status_placeholder.text("🔄 Poprawianie zapytania...")
+                    elif node == "web_search":
+                        status_placeholder.text("🌐 Szukanie w internecie...")
+                    elif node == "generate":
+                        # Ostateczny tekst z węzła (także odpowiedź z cache'a, bez tokenów)
+                        status_placeholder.empty()
+                        full_response = values["generation"]
+                        message_placeholder.markdown(full_response)
 
                 if full_response:
                     st.session_state.messages.append(
@@ -1,17 +1,128 @@
-from typing import Optional, List
+import asyncio
+import contextvars
+import functools
+import json
+import logging
+from typing import Dict, Optional, List, Tuple
+
+import numpy as np
 from langchain_core.messages import BaseMessage
 
 from qdrant_client import models
 
+import config
 from config import (
-    client,
-    query_analyzer,
-    dense_model,
-    reranker,
-    sparse_model,
-    COLLECTION_NAME,
+    RELAXED_SEARCH_MODE,
+    SEARCH_BACKEND,
+    CANDIDATE_PAYLOAD_FIELDS,
+    RERANK_SOURCE_FIELDS,
+    TITLE_FUZZY_MIN,
+)
+from backends import RRF_K
+from cache import normalize_query
+from candidate_pool import (
+    build_pool,
+    is_narrower,
+    matches_intent,
+    pool_hits,
+    wants_more,
 )
 from models import MovieSearchIntent
+from fast_path import local_intent
+from telemetry import incr, observe, span
+
+logger = logging.getLogger(__name__)
+
+# Premia za zgodność tytułu z `specific_title` (ponad wynik cross-encodera)
+TITLE_MATCH_BOOST = 10.0
+
+
+def build_rerank_passage(payload: dict) -> str:
+    """
+    Tekst oceniany przez cross-encoder. Przy indeksowaniu trafia do payloadu jako `rerank_passage`,
+    a dla starszych kolekcji (bez tego pola) jest budowany w locie.
+    """
+    title = payload.get("title", "")
+    overview = payload.get("overview", "")
+    tagline = payload.get("tagline", "")
+    keywords = ", ".join(payload.get("keywords", []))
+
+    return f"{title} {tagline} {overview} {keywords}"
+
+
+def score_hits(query: str, hits: List[models.ScoredPoint]) -> Dict[int, float]:
+    """
+    Ocenia wyniki cross-encoderem jednym wywołaniem. Zwraca słownik: id punktu -> wynik rerankera.
+    Wyniki dla par (zapytanie, film) ocenionych wcześniej są brane z cache'a.
+    """
+    score_cache = config.rerank_score_cache
+    query_key = score_cache.query_key(query)
+
+    scores = {}
+    missing_hits = {}
+    for hit in hits:
+        if hit.id in scores or hit.id in missing_hits:
+            continue
+        cached_score = score_cache.get(query_key, hit.id)
+        if cached_score is None:
+            missing_hits[hit.id] = hit
+        else:
+            scores[hit.id] = cached_score
+
+    if missing_hits:
+        passages_by_id = {
+            point_id: hit.payload.get("rerank_passage")
+            for point_id, hit in missing_hits.items()
+        }
+        legacy_ids = [point_id for point_id, p in passages_by_id.items() if not p]
+        if legacy_ids:
+            # Kolekcja bez `rerank_passage` - dociągamy tylko pola potrzebne do złożenia tekstu
+            for point in fetch_payloads(legacy_ids, RERANK_SOURCE_FIELDS):
+                passages_by_id[point.id] = build_rerank_passage(point.payload)
+
+        passages = [passages_by_id.get(point_id) or "" for point_id in missing_hits]
+        rerank_pairs = [[query, passage] for passage in passages]
+
+        with span("rerank", pairs=len(rerank_pairs)):
+            predicted = config.reranker.predict(rerank_pairs)
+
+        for point_id, score in zip(missing_hits, predicted):
+            scores[point_id] = float(score)
+            score_cache.put(query_key, point_id, float(score))
+
+    incr("cache.rerank.hit", len(scores) - len(missing_hits))
+    incr("cache.rerank.miss", len(missing_hits))
+    return scores
+
+
+def fetch_payloads(point_ids: List[int], fields=True) -> List[models.Record]:
+    """Pobiera payloady wielu punktów jednym żądaniem (bez wektorów)."""
+    return config.search_backend.retrieve(point_ids, with_payload=fields)
+
+
+async def afetch_payloads(point_ids: List[int], fields=True) -> List[models.Record]:
+    return await config.search_backend.aretrieve(point_ids, with_payload=fields)
+
+
+def load_full_payloads(hits: List[models.ScoredPoint]) -> List[models.ScoredPoint]:
+    """Podmienia okrojone payloady kandydatów na pełne - tylko dla wyników pokazywanych modelowi."""
+    return _with_payloads(hits, fetch_payloads([h.id for h in hits]))
+
+
+async def aload_full_payloads(
+    hits: List[models.ScoredPoint],
+) -> List[models.ScoredPoint]:
+    return _with_payloads(hits, await afetch_payloads([h.id for h in hits]))
+
+
+def _with_payloads(
+    hits: List[models.ScoredPoint], records: List[models.Record]
+) -> List[models.ScoredPoint]:
+    full_payloads = {point.id: point.payload for point in records}
+    return [
+        hit.model_copy(update={"payload": full_payloads.get(hit.id, hit.payload)})
+        for hit in hits
+    ]
 
 
 def rerank_qdrant_hits(
@@ -19,26 +130,16 @@ def rerank_qdrant_hits(
     hits: List[models.ScoredPoint],
     specific_title: Optional[str] = None,
     top_k: int = 5,
+    scores: Optional[Dict[int, float]] = None,
 ) -> List[models.ScoredPoint]:
     """
     Funkcja bierze wyniki z Qdranta (hits), ocenia je rerankerem i zwraca najlepsze obiekty.
+    Jeśli podano `scores` (wyniki z `score_hits`), reranker nie jest wywoływany ponownie.
     """
-    passages = []
-    for hit in hits:
-        title = hit.payload.get("title", "")
-        # orig_title = hit.payload.get("original_title", "")
-        overview = hit.payload.get("overview", "")
-        tagline = hit.payload.get("tagline", "")
-        keywords = ", ".join(hit.payload.get("keywords", []))
-
-        passage = f"{title} {tagline} {overview} {keywords}"
-        passages.append(passage)
+    if scores is None:
+        scores = score_hits(query, hits)
 
-    rerank_pairs = [[query, passage] for passage in passages]
-
-    scores = reranker.predict(rerank_pairs)
-
-    scored_hits = list(zip(hits, scores))
+    scored_hits = [(hit, scores[hit.id]) for hit in hits]
 
     if specific_title:
         boosted_hits = []
@@ -46,7 +147,7 @@ def rerank_qdrant_hits(
             title = hit.payload.get("title", "").lower()
             target = specific_title.lower()
             is_match = target == title or target in title
-            final_score = score + 10.0 if is_match else score
+            final_score = score + TITLE_MATCH_BOOST if is_match else score
             boosted_hits.append((hit, final_score))
 
         scored_hits = boosted_hits
@@ -160,37 +261,212 @@ def build_qdrant_filter(intent: MovieSearchIntent) -> Optional[models.Filter]:
     return models.Filter(must=must_conditions)
 
 
-def run_qdrant_search(
-    english_query: str, qdrant_filter: Optional[models.Filter], limit: int = 20
-):
-    query_dense = dense_model.encode(english_query).tolist()
+def encode_query(english_query: str) -> Tuple[List[float], models.SparseVector]:
+    """
+    Zwraca wektor gęsty i rzadki zapytania. Wyniki są cache'owane po znormalizowanym tekście,
+    więc ponowne wyszukiwanie tego samego zapytania (luzowanie filtrów, pętla rewrite) nie koduje go drugi raz.
+    """
+    return encode_queries([english_query])[0]
 
-    raw_sparse_output = list(sparse_model.embed([english_query]))[0]
-    query_sparse = models.SparseVector(
-        indices=raw_sparse_output.indices.tolist(),
-        values=raw_sparse_output.values.tolist(),
-    )
 
-    results = client.query_points(
-        collection_name=COLLECTION_NAME,
-        prefetch=[
-            models.Prefetch(
-                query=query_dense,
-                using="text-dense",
-                filter=qdrant_filter,
-                limit=50,
-            ),
-            models.Prefetch(
-                query=query_sparse,
-                using="text-sparse",
-                filter=qdrant_filter,
-                limit=50,
-            ),
-        ],
-        query=models.FusionQuery(fusion=models.Fusion.RRF),
-        limit=limit,
+def encode_queries(
+    english_queries: List[str],
+) -> List[Tuple[List[float], models.SparseVector]]:
+    """Jak `encode_query`, ale zapytania spoza cache'a są kodowane jednym batchem."""
+    texts = [normalize_query(q) for q in english_queries]
+    cached, missing = _cached_embeddings(texts)
+    if missing:
+        _store_embeddings(
+            cached, missing, _encode_dense(missing), _encode_sparse(missing)
+        )
+    return _encoded(texts, cached)
+
+
+async def aencode_queries(
+    english_queries: List[str],
+) -> List[Tuple[List[float], models.SparseVector]]:
+    """Jak `encode_queries`, ale modele dense i sparse liczą równolegle w puli wątków."""
+    texts = [normalize_query(q) for q in english_queries]
+    cached, missing = _cached_embeddings(texts)
+    if missing:
+        dense, sparse = await asyncio.gather(
+            run_inference(_encode_dense, missing),
+            run_inference(_encode_sparse, missing),
+        )
+        _store_embeddings(cached, missing, dense, sparse)
+    return _encoded(texts, cached)
+
+
+async def aencode_query(english_query: str) -> Tuple[List[float], models.SparseVector]:
+    return (await aencode_queries([english_query]))[0]
+
+
+async def run_inference(fn, *args):
+    """Wywołanie modelu (CPU) w puli `config.inference_executor`, bez blokowania pętli zdarzeń."""
+    loop = asyncio.get_running_loop()
+    # run_in_executor nie przenosi contextvars (spany OTel, callbacki LangChain)
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        config.inference_executor, functools.partial(context.run, fn, *args)
     )
-    return results.points
+
+
+def _cached_embeddings(texts: List[str]) -> Tuple[Dict[str, tuple], List[str]]:
+    cached = {text: config.query_embedding_cache.get(text) for text in texts}
+    missing = [text for text, value in cached.items() if value is None]
+    incr("cache.embedding.hit", len(cached) - len(missing))
+    incr("cache.embedding.miss", len(missing))
+    return cached, missing
+
+
+def _encode_dense(texts: List[str]) -> list:
+    with span("encode.dense", texts=len(texts)):
+        if len(texts) == 1:
+            return [config.dense_model.encode(texts[0])]
+        return list(config.dense_model.encode(texts))
+
+
+def _encode_sparse(texts: List[str]) -> list:
+    with span("encode.sparse", texts=len(texts)):
+        return list(config.sparse_model.embed(texts))
+
+
+def _store_embeddings(cached: Dict[str, tuple], missing: List[str], dense, sparse):
+    for text, query_dense, raw_sparse_output in zip(missing, dense, sparse):
+        cached[text] = (
+            query_dense.tolist(),
+            raw_sparse_output.indices.tolist(),
+            raw_sparse_output.values.tolist(),
+        )
+        config.query_embedding_cache.put(text, cached[text])
+
+
+def _encoded(
+    texts: List[str], cached: Dict[str, tuple]
+) -> List[Tuple[List[float], models.SparseVector]]:
+    encoded = []
+    for text in texts:
+        query_dense, sparse_indices, sparse_values = cached[text]
+        query_sparse = models.SparseVector(indices=sparse_indices, values=sparse_values)
+        encoded.append((query_dense, query_sparse))
+    return encoded
+
+
+def run_hybrid_search(
+    english_query: str, qdrant_filter: Optional[models.Filter], limit: int = 20
+) -> List[models.ScoredPoint]:
+    return run_hybrid_search_batch(english_query, [qdrant_filter], limit)[0]
+
+
+def run_hybrid_search_batch(
+    english_query: str,
+    qdrant_filters: List[Optional[models.Filter]],
+    limit: int = 20,
+) -> List[List[models.ScoredPoint]]:
+    """
+    Kilka zapytań hybrydowych (ten sam wektor, różne filtry) jednym wywołaniem backendu -
+    w Qdrancie to jedno żądanie, w indeksie NumPy wektor gęsty liczony jest raz.
+    """
+    query_dense, query_sparse = encode_query(english_query)
+
+    with span("search.query", requests=len(qdrant_filters)) as search_span:
+        results = config.search_backend.search_batch(
+            query_dense,
+            query_sparse,
+            qdrant_filters,
+            limit=limit,
+            with_payload=CANDIDATE_PAYLOAD_FIELDS,
+        )
+        search_span.set(candidates=sum(len(points) for points in results))
+    _observe_candidates([results])
+    return results
+
+
+async def arun_hybrid_search_batch(
+    english_query: str,
+    qdrant_filters: List[Optional[models.Filter]],
+    limit: int = 20,
+) -> List[List[models.ScoredPoint]]:
+    query_dense, query_sparse = await aencode_query(english_query)
+
+    with span("search.query", requests=len(qdrant_filters)) as search_span:
+        results = await config.search_backend.asearch_batch(
+            query_dense,
+            query_sparse,
+            qdrant_filters,
+            limit=limit,
+            with_payload=CANDIDATE_PAYLOAD_FIELDS,
+        )
+        search_span.set(candidates=sum(len(points) for points in results))
+    _observe_candidates([results])
+    return results
+
+
+def run_hybrid_search_multi(
+    english_queries: List[str],
+    qdrant_filters: List[Optional[models.Filter]],
+    limit: int = 20,
+) -> List[List[List[models.ScoredPoint]]]:
+    """Wszystkie zapytania x filtry jednym wywołaniem backendu; wynik [zapytanie][filtr]."""
+    queries = encode_queries(english_queries)
+
+    with span(
+        "search.query", requests=len(queries) * len(qdrant_filters)
+    ) as search_span:
+        results = config.search_backend.search_many(
+            queries,
+            qdrant_filters,
+            limit=limit,
+            with_payload=CANDIDATE_PAYLOAD_FIELDS,
+        )
+        search_span.set(
+            candidates=sum(len(points) for per_query in results for points in per_query)
+        )
+    _observe_candidates(results)
+    return results
+
+
+async def arun_hybrid_search_multi(
+    english_queries: List[str],
+    qdrant_filters: List[Optional[models.Filter]],
+    limit: int = 20,
+) -> List[List[List[models.ScoredPoint]]]:
+    queries = await aencode_queries(english_queries)
+
+    with span(
+        "search.query", requests=len(queries) * len(qdrant_filters)
+    ) as search_span:
+        results = await config.search_backend.asearch_many(
+            queries,
+            qdrant_filters,
+            limit=limit,
+            with_payload=CANDIDATE_PAYLOAD_FIELDS,
+        )
+        search_span.set(
+            candidates=sum(len(points) for per_query in results for points in per_query)
+        )
+    _observe_candidates(results)
+    return results
+
+
+def _observe_candidates(results: List[List[List[models.ScoredPoint]]]):
+    for per_query in results:
+        for points in per_query:
+            observe("search.candidates", len(points))
+
+
+def fuse_rankings(
+    rankings: List[List[models.ScoredPoint]],
+) -> List[models.ScoredPoint]:
+    """Suma wyników kilku zapytań połączona RRF (jak fuzja dense/sparse w backendzie)."""
+    fused: Dict[int, float] = {}
+    points: Dict[int, models.ScoredPoint] = {}
+    for ranking in rankings:
+        for position, hit in enumerate(ranking):
+            fused[hit.id] = fused.get(hit.id, 0.0) + 1.0 / (RRF_K + position)
+            points.setdefault(hit.id, hit)
+    ranked = sorted(fused, key=fused.get, reverse=True)
+    return [points[i].model_copy(update={"score": fused[i]}) for i in ranked]
 
 
 def relax_intent(intent: MovieSearchIntent) -> MovieSearchIntent:
@@ -215,75 +491,487 @@ def relax_intent(intent: MovieSearchIntent) -> MovieSearchIntent:
     return new_intent
 
 
-def retrieve_movies(query: str, chat_history: List[BaseMessage] = []) -> List[str]:
+def _same_topic(pool_topic: str, intent: MovieSearchIntent) -> bool:
+    """Temat puli i nowej intencji: identyczny tekst albo bliskie embeddingi (z cache'a)."""
+    topic = normalize_query(intent.query_english or "")
+    if topic == pool_topic:
+        return True
+    if not topic or not pool_topic:
+        return False
+    a = np.asarray(encode_query(topic)[0])
+    b = np.asarray(encode_query(pool_topic)[0])
+    similarity = float(a @ b / (np.linalg.norm(a) * np.linalg.norm(b) or 1.0))
+    return similarity >= config.CANDIDATE_POOL_SIMILARITY
+
+
+def search_pool(
+    pool: dict, intent: MovieSearchIntent, english_query: str, more: bool
+) -> Optional[Tuple[List[models.ScoredPoint], Dict[int, float], dict]]:
     """
-    Zwraca: (sformatowane_dokumenty, zsyntezowane_zapytanie_angielskie)
+    Wyniki z puli kandydatów poprzedniej tury: (najlepsze, wyniki_rerankera, nowa_pula),
+    albo None, gdy intencja nie jest zawężeniem puli lub pula się wyczerpała.
+    Z `more` pomija filmy już pokazane (kolejna strona rankingu).
     """
+    base_intent = MovieSearchIntent(**pool["intent"])
+    if not is_narrower(intent, base_intent) or not _same_topic(pool["topic"], intent):
+        return None
+
+    candidates = pool_hits(pool)
+    shown = set(pool["shown"]) if more else set()
+
+    def available(points):
+        return [
+            hit
+            for hit in points
+            if hit.id not in shown and matches_intent(hit.payload, intent)
+        ]
+
+    hits = available(candidates)
+    if more and not hits:
+        # Wszystko już pokazane - głębsza lista dla tych samych filtrów puli
+        incr("pool.refill")
+        candidates = run_hybrid_search(
+            english_query,
+            build_qdrant_filter(base_intent),
+            limit=max(2 * len(candidates), 20),
+        )
+        hits = available(candidates)
+
+    # Zawężenie musi zostawić tyle filmów, ile wymaga ścisłe wyszukiwanie (bez luzowania)
+    if len(hits) < (1 if more else 3):
+        incr("pool.miss")
+        return None
+
+    incr("pool.hit")
+    scores = score_hits(english_query, hits)
+    top_hits = rerank_qdrant_hits(
+        english_query, hits, intent.specific_title, top_k=5, scores=scores
+    )
+    shown_ids = (pool["shown"] if more else []) + [hit.id for hit in top_hits]
+    return top_hits, scores, build_pool(base_intent, candidates, shown_ids)
+
+
+MAX_HISTORY_LENGTH = 6
+# Id wiadomości ze streszczeniem starszej części rozmowy (HISTORY_COMPACTION=summarize)
+HISTORY_SUMMARY_ID = "history-summary"
+
 
-    print(f"\n🧠 Analizuję intencję zapytania: '{query}'...")
+def recent_history(chat_history: List[BaseMessage]) -> List[BaseMessage]:
+    """Ostatnie wiadomości rozmowy przekazywane do analizatora intencji (plus streszczenie)."""
+    if len(chat_history) > MAX_HISTORY_LENGTH:
+        recent = chat_history[-MAX_HISTORY_LENGTH:]
+        if chat_history[0].id == HISTORY_SUMMARY_ID:
+            return [chat_history[0]] + recent
+        return recent
+    return chat_history
 
-    MAX_HISTORY_LENGHT = 6
 
-    if len(chat_history) > MAX_HISTORY_LENGHT:
-        chat_history_for_llm = chat_history[-MAX_HISTORY_LENGHT:]
+def analyze_intent(
+    query: str,
+    chat_history: List[BaseMessage] = [],
+    intent: Optional[MovieSearchIntent] = None,
+) -> MovieSearchIntent:
+    """Intencja z routera, z reguł szybkiej ścieżki albo z analizatora LLM (w tej kolejności)."""
+    if intent is None and config.FAST_PATH:
+        intent = local_intent(query, chat_history)
+
+    if intent is None:
+        logger.info("\n🧠 Analizuję intencję zapytania: '%s'...", query)
+        with span("analyze_intent"):
+            intent = config.query_analyzer.invoke(
+                {"query": query, "chat_history": recent_history(chat_history)}
+            )
     else:
-        chat_history_for_llm = chat_history
+        logger.info("\n🧠 Intencja zapytania już znana: '%s'", query)
+    return intent
 
-    intent = query_analyzer.invoke(
-        {"query": query, "chat_history": chat_history_for_llm}
+
+async def aanalyze_intent(
+    query: str,
+    chat_history: List[BaseMessage] = [],
+    intent: Optional[MovieSearchIntent] = None,
+    prefetch_query: bool = False,
+) -> MovieSearchIntent:
+    """
+    Jak `analyze_intent`. Z `prefetch_query` zapytanie jest kodowane w czasie wywołania
+    analizatora - tylko dla zapytania po przepisaniu (pętla rewrite): jest już po angielsku,
+    zsyntezowane zapytanie zwykle jest jego dosłowną kopią, więc wyszukiwanie trafia w cache
+    embeddingów. Pierwotne pytanie (zwykle po polsku) nie jest wyszukiwane, więc go nie kodujemy.
+    """
+    if intent is None and config.FAST_PATH:
+        intent = await run_inference(local_intent, query, chat_history)
+    if intent is not None:
+        logger.info("\n🧠 Intencja zapytania już znana: '%s'", query)
+        return intent
+
+    logger.info("\n🧠 Analizuję intencję zapytania: '%s'...", query)
+    analyze = config.query_analyzer.ainvoke(
+        {"query": query, "chat_history": recent_history(chat_history)}
     )
+    with span("analyze_intent"):
+        if not prefetch_query:
+            return await analyze
+        intent, _ = await asyncio.gather(analyze, aencode_query(query))
+    return intent
+
+
+def build_search_query(intent: MovieSearchIntent, query: str) -> str:
     english_query = intent.synthesized_query
 
     if intent.specific_title:
-        print(f"Wykryto konkretny film: {intent.specific_title}")
         english_query = f"{english_query} | Movie title: {intent.specific_title}"
 
-    print(f"\n Obecne zsyntezowane zapytanie: '{english_query}'")
+    return english_query or query
+
+
+def intent_filter_key(intent: MovieSearchIntent) -> str:
+    """Kanoniczna postać filtrów intencji (bez opisów tekstowych) - klucz cache'a odpowiedzi."""
+    filters = {}
+    for key, value in intent.model_dump().items():
+        if key in ["query_english", "synthesized_query"] or value is None:
+            continue
+        if isinstance(value, list):
+            value = sorted(str(v).casefold() for v in value)
+        elif isinstance(value, str):
+            value = value.casefold()
+        elif isinstance(value, float):
+            value = round(value, 1)
+        filters[key] = value
+    return json.dumps(filters, sort_keys=True)
+
+
+RELAXED_FILTERS_INFO = (
+    "UWAGA DLA MODELU: Nie znaleziono idealnych dopasowań dla ścisłych filtrów (np. konkretny rok czy wysoka ocena). "
+    "Filtry zostały lekko poluzowane (rozszerzono zakres lat lub obniżono minimalną ocenę), "
+    "aby znaleźć najbardziej zbliżone filmy. Poinformuj o tym użytkownika.\n\n"
+)
+
+
+def _search_movies(english_query: str, intent: MovieSearchIntent) -> Tuple[
+    List[models.ScoredPoint],
+    Dict[int, float],
+    str,
+    MovieSearchIntent,
+    List[models.ScoredPoint],
+]:
+    """
+    Wyszukiwanie z rerankingiem i luzowaniem filtrów, gdy ścisłych wyników jest za mało.
+    Zwraca: (najlepsze, wyniki_rerankera, uwaga_o_luzowaniu, filtry_kandydatów, kandydaci)
+    """
+    relaxed_intent = relax_intent(intent)
+    relaxed_hits = None
+    if RELAXED_SEARCH_MODE == "batched" and relaxed_intent != intent:
+        # Ścisłe i poluzowane zapytanie jednym wywołaniem backendu
+        hits, relaxed_hits = run_hybrid_search_batch(
+            english_query,
+            [build_qdrant_filter(intent), build_qdrant_filter(relaxed_intent)],
+        )
+    else:
+        hits = run_hybrid_search(english_query, build_qdrant_filter(intent))
+    return _rank_search_results(
+        english_query, intent, relaxed_intent, hits, relaxed_hits
+    )
+
+
+async def _asearch_movies(english_query: str, intent: MovieSearchIntent) -> Tuple[
+    List[models.ScoredPoint],
+    Dict[int, float],
+    str,
+    MovieSearchIntent,
+    List[models.ScoredPoint],
+]:
+    """
+    Jak `_search_movies`. Poluzowane zapytanie idzie zawsze w tym samym żądaniu co ścisłe -
+    dodatkowe żądanie po rerankingu byłoby drugim czekaniem na sieć.
+    """
+    relaxed_intent = relax_intent(intent)
+    filters = [build_qdrant_filter(intent)]
+    if relaxed_intent != intent:
+        filters.append(build_qdrant_filter(relaxed_intent))
+    results = await arun_hybrid_search_batch(english_query, filters)
+    hits, relaxed_hits = results[0], results[1] if len(results) > 1 else []
+    return await run_inference(
+        _rank_search_results, english_query, intent, relaxed_intent, hits, relaxed_hits
+    )
+
+
+def _rank_search_results(
+    english_query: str,
+    intent: MovieSearchIntent,
+    relaxed_intent: MovieSearchIntent,
+    hits: List[models.ScoredPoint],
+    relaxed_hits: Optional[List[models.ScoredPoint]],
+) -> Tuple[
+    List[models.ScoredPoint],
+    Dict[int, float],
+    str,
+    MovieSearchIntent,
+    List[models.ScoredPoint],
+]:
+    """
+    Reranking kandydatów ścisłych i - gdy jest ich za mało - poluzowanych. Przy `relaxed_hits`
+    równym None poluzowane wyszukiwanie jest wykonywane dopiero tutaj (RELAXED_SEARCH_MODE=sequential).
+    Reranking nie zmienia liczby wyników, więc o luzowaniu decyduje sama liczba trafień:
+    gdy ścisłych jest dość, reranker ocenia tylko je, w przeciwnym razie sumę obu zbiorów.
+    """
+    filters_info = ""
+    # Do puli trafiają kandydaci filtrów, z których pochodzą pokazane filmy
+    pool_intent, candidates = intent, hits
+
+    if len(hits) >= 3:
+        scores = score_hits(english_query, hits)
+        top_hits = rerank_qdrant_hits(
+            english_query, hits, intent.specific_title, top_k=5, scores=scores
+        )
+        return top_hits, scores, filters_info, pool_intent, candidates
+
+    logger.info("\n⚠️  Mało wyników. Uruchamiam 'Lekkie Luzowanie' filtrów...")
+    incr("retrieve.relaxed")
+    active_relaxed = {
+        k: v
+        for k, v in relaxed_intent.model_dump().items()
+        if v is not None and k not in ["query_english", "synthesized_query"]
+    }
+    logger.info("   -> Nowe filtry (Relaxed): %s", active_relaxed)
+
+    if relaxed_hits is None:
+        relaxed_hits = (
+            run_hybrid_search(english_query, build_qdrant_filter(relaxed_intent))
+            if relaxed_intent != intent
+            else hits
+        )
+    scores = score_hits(english_query, hits + relaxed_hits)
+    top_hits = rerank_qdrant_hits(
+        english_query, hits, intent.specific_title, top_k=5, scores=scores
+    )
+    relaxed_top_hits = rerank_qdrant_hits(
+        english_query, relaxed_hits, top_k=5, scores=scores
+    )
+
+    if len(relaxed_top_hits) > len(top_hits):
+        top_hits = relaxed_top_hits
+        pool_intent, candidates = relaxed_intent, relaxed_hits
+        filters_info = RELAXED_FILTERS_INFO
+    else:
+        logger.info("   -> Luzowanie nie pomogło (nadal brak wyników).")
+
+    return top_hits, scores, filters_info, pool_intent, candidates
+
+
+def search_title(intent: MovieSearchIntent) -> Optional[List[models.ScoredPoint]]:
+    """
+    Filmy o tytule `intent.specific_title` z indeksu tytułów, z pełnymi payloadami i spełniające
+    filtry intencji (np. rok przy remakach). None, gdy indeks nic nie znalazł - wtedy zwykłe
+    wyszukiwanie. Wynikiem trafienia jest podobieństwo tytułu - cross-encoder nie jest wołany.
+    """
+    matches = _lookup_title(intent)
+    if not matches:
+        return None
+    return _title_hits(intent, matches, fetch_payloads([m[0] for m in matches]))
+
+
+async def asearch_title(
+    intent: MovieSearchIntent,
+) -> Optional[List[models.ScoredPoint]]:
+    matches = _lookup_title(intent)
+    if not matches:
+        return None
+    records = await afetch_payloads([m[0] for m in matches])
+    return _title_hits(intent, matches, records)
+
+
+def _lookup_title(intent: MovieSearchIntent) -> List[Tuple[int, float]]:
+    with span("retrieve.title_lookup"):
+        matches = config.title_index.lookup(
+            intent.specific_title, limit=5, min_similarity=TITLE_FUZZY_MIN
+        )
+    if not matches:
+        incr("retrieve.title.miss")
+    return matches
+
+
+def _title_hits(
+    intent: MovieSearchIntent,
+    matches: List[Tuple[int, float]],
+    records: List[models.Record],
+) -> Optional[List[models.ScoredPoint]]:
+    similarity = dict(matches)
+    records = {record.id: record for record in records}
+    hits = [
+        models.ScoredPoint(
+            id=point_id,
+            version=0,
+            score=similarity[point_id],
+            payload=records[point_id].payload,
+        )
+        for point_id in similarity
+        if point_id in records and matches_intent(records[point_id].payload, intent)
+    ]
+    if not hits:
+        incr("retrieve.title.miss")
+        return None
+    incr("retrieve.title.hit")
+    return hits
+
+
+def retrieve_movies(
+    query: str,
+    chat_history: List[BaseMessage] = [],
+    intent: Optional[MovieSearchIntent] = None,
+    pool: Optional[dict] = None,
+    question: Optional[str] = None,
+) -> Tuple[str, str, Optional[List[float]], Optional[dict]]:
+    """
+    Zwraca: (sformatowane_dokumenty, zsyntezowane_zapytanie_angielskie, wyniki_rerankera, pula)
+    Wyniki rerankera to None, gdy filmy pochodzą z indeksu tytułów (bez cross-encodera).
+    Jeśli `intent` jest już znana (np. z połączonego routera), analizator nie jest wywoływany.
+    Z `pool` (pula kandydatów poprzedniej tury) zawężające dopytania i prośby o więcej wyników
+    (rozpoznawane w `question`) są obsługiwane bez nowego wyszukiwania.
+    """
+
+    intent = analyze_intent(query, chat_history, intent)
+    english_query = _log_search_query(intent, query)
+
+    titled = None
+    if intent.specific_title and config.TITLE_INDEX:
+        titled = search_title(intent)
+    if titled is not None:
+        logger.info("\n🎬 Film znaleziony w indeksie tytułów - bez wyszukiwania.")
+        return _render_results(titled, None, english_query, "", None)
+
+    pooled = None
+    if pool and config.CANDIDATE_POOL:
+        more = question is not None and wants_more(question)
+        pooled = search_pool(pool, intent, english_query, more)
+
+    if pooled is not None:
+        _log_pooled(more)
+        top_hits, scores, pool = pooled
+        filters_info = ""
+    else:
+        logger.info("\n🔍 Szukam w bazie (%s, Hybrid + Filters)...", SEARCH_BACKEND)
+        top_hits, scores, filters_info, pool_intent, candidates = _search_movies(
+            english_query, intent
+        )
+        pool = _candidate_pool(pool_intent, candidates, top_hits)
+
+    return _format_results(top_hits, scores, english_query, filters_info, pool)
+
+
+async def aretrieve_movies(
+    query: str,
+    chat_history: List[BaseMessage] = [],
+    intent: Optional[MovieSearchIntent] = None,
+    pool: Optional[dict] = None,
+    question: Optional[str] = None,
+) -> Tuple[str, str, Optional[List[float]], Optional[dict]]:
+    """
+    Jak `retrieve_movies`, bez blokowania pętli zdarzeń: LLM i Qdrant przez klientów
+    asynchronicznych, modele (embedder, cross-encoder) w puli `config.inference_executor`.
+    """
+    intent = await aanalyze_intent(query, chat_history, intent)
+    english_query = _log_search_query(intent, query)
+
+    titled = None
+    if intent.specific_title and config.TITLE_INDEX:
+        titled = await asearch_title(intent)
+    if titled is not None:
+        logger.info("\n🎬 Film znaleziony w indeksie tytułów - bez wyszukiwania.")
+        return _render_results(titled, None, english_query, "", None)
+
+    pooled = None
+    if pool and config.CANDIDATE_POOL:
+        more = question is not None and wants_more(question)
+        # Pula to reranking lokalnych kandydatów (CPU) - rzadkie dociąganie wyników idzie tym samym wątkiem
+        pooled = await run_inference(search_pool, pool, intent, english_query, more)
+
+    if pooled is not None:
+        _log_pooled(more)
+        top_hits, scores, pool = pooled
+        filters_info = ""
+    else:
+        logger.info("\n🔍 Szukam w bazie (%s, Hybrid + Filters)...", SEARCH_BACKEND)
+        top_hits, scores, filters_info, pool_intent, candidates = await _asearch_movies(
+            english_query, intent
+        )
+        pool = _candidate_pool(pool_intent, candidates, top_hits)
+
+    return await _aformat_results(top_hits, scores, english_query, filters_info, pool)
+
+
+def _log_search_query(intent: MovieSearchIntent, query: str) -> str:
+    english_query = build_search_query(intent, query)
+
+    if intent.specific_title:
+        logger.info("Wykryto konkretny film: %s", intent.specific_title)
+
+    logger.info("\n Obecne zsyntezowane zapytanie: '%s'", english_query)
 
-    qdrant_filter = build_qdrant_filter(intent)
     active_filters = {
         k: v
         for k, v in intent.model_dump().items()
         if v is not None and k not in ["query_english", "synthesized_query"]
     }
 
-    print(f"   -> Temat (EN): '{english_query}'")
-    print(f"   -> Wykryte filtry: {active_filters}")
+    logger.info("   -> Temat (EN): '%s'", english_query)
+    logger.info("   -> Wykryte filtry: %s", active_filters)
+    return english_query
 
-    if not english_query:
-        english_query = query
 
-    print(f"\n🔍 Szukam w Qdrant (Hybrid + Filters)...")
+def _log_pooled(more: bool):
+    logger.info(
+        "\n♻️  Zawężam wyniki z poprzedniej tury (%s)...",
+        "kolejna strona" if more else "filtry",
+    )
 
-    hits = run_qdrant_search(english_query, qdrant_filter)
-    top_hits = rerank_qdrant_hits(english_query, hits, intent.specific_title, top_k=5)
 
-    filters_info = ""
+def _candidate_pool(
+    pool_intent: MovieSearchIntent,
+    candidates: List[models.ScoredPoint],
+    top_hits: List[models.ScoredPoint],
+) -> Optional[dict]:
+    if not config.CANDIDATE_POOL:
+        return None
+    return build_pool(pool_intent, candidates, [hit.id for hit in top_hits])
 
-    if len(top_hits) < 3:
-        print("\n⚠️  Mało wyników. Uruchamiam 'Lekkie Luzowanie' filtrów...")
-        relaxed_intent = relax_intent(intent)
-        relaxed_filter = build_qdrant_filter(relaxed_intent)
 
-        active_relaxed = {
-            k: v
-            for k, v in relaxed_intent.model_dump().items()
-            if v is not None and k not in ["query_english", "synthesized_query"]
-        }
-        print(f"   -> Nowe filtry (Relaxed): {active_relaxed}")
+def _format_results(
+    top_hits: List[models.ScoredPoint],
+    scores: Dict[int, float],
+    english_query: str,
+    filters_info: str,
+    pool: Optional[dict],
+) -> Tuple[str, str, List[float], Optional[dict]]:
+    """Dociąga pełne payloady pokazywanych filmów i formatuje je dla modelu."""
+    return _render_results(
+        load_full_payloads(top_hits), scores, english_query, filters_info, pool
+    )
 
-        relaxed_hits = run_qdrant_search(english_query, relaxed_filter)
-        relaxed_top_hits = rerank_qdrant_hits(english_query, relaxed_hits, top_k=5)
 
-        if len(relaxed_top_hits) > len(top_hits):
-            top_hits = relaxed_top_hits
-            filters_info = (
-                "UWAGA DLA MODELU: Nie znaleziono idealnych dopasowań dla ścisłych filtrów (np. konkretny rok czy wysoka ocena). "
-                "Filtry zostały lekko poluzowane (rozszerzono zakres lat lub obniżono minimalną ocenę), "
-                "aby znaleźć najbardziej zbliżone filmy. Poinformuj o tym użytkownika.\n\n"
-            )
-        else:
-            print("   -> Luzowanie nie pomogło (nadal brak wyników).")
+async def _aformat_results(
+    top_hits: List[models.ScoredPoint],
+    scores: Dict[int, float],
+    english_query: str,
+    filters_info: str,
+    pool: Optional[dict],
+) -> Tuple[str, str, List[float], Optional[dict]]:
+    return _render_results(
+        await aload_full_payloads(top_hits), scores, english_query, filters_info, pool
+    )
+
+
+def _render_results(
+    top_hits: List[models.ScoredPoint],
+    scores: Optional[Dict[int, float]],
+    english_query: str,
+    filters_info: str,
+    pool: Optional[dict],
+) -> Tuple[str, str, Optional[List[float]], Optional[dict]]:
+    # Surowe wyniki cross-encodera (bez bonusu za tytuł) - używa ich szybki sędzia.
+    # None dla trafień z indeksu tytułów: nie przeszły przez cross-encoder
+    rerank_scores = None
+    if scores is not None:
+        rerank_scores = [scores[hit.id] for hit in top_hits]
 
     formatted_docs = []
     for hit in top_hits:
@@ -311,6 +999,96 @@ def retrieve_movies(query: str, chat_history: List[BaseMessage] = []) -> List[st
         formatted_docs.append(doc_content)
 
     if not formatted_docs:
-        return "Nie znaleziono filmów spełniających kryteria.", english_query
+        return "Nie znaleziono filmów spełniających kryteria.", english_query, [], pool
+
+    return (
+        filters_info + "\n\n".join(formatted_docs),
+        english_query,
+        rerank_scores,
+        pool,
+    )
+
+
+def retrieve_movies_fanout(
+    english_queries: List[str], intent: MovieSearchIntent
+) -> Tuple[str, str, List[float], Optional[dict]]:
+    """
+    Jedna runda wyszukiwania dla kilku alternatywnych zapytań z rewritera (REWRITE_MODE=fanout):
+    kodowanie jednym batchem, wszystkie zapytania (ścisłe i poluzowane filtry) jednym wywołaniem
+    backendu, fuzja RRF list z różnych zapytań i jeden reranking sumy względem pierwszego zapytania.
+    Zwraca to samo co `retrieve_movies`.
+    """
+    english_queries, relaxed_intent, filters = _fanout_queries(english_queries, intent)
+    results = run_hybrid_search_multi(english_queries, filters)
+    top_hits, scores, filters_info, pool = _rank_fanout_results(
+        english_queries[0], intent, relaxed_intent, results
+    )
+    return _format_results(top_hits, scores, english_queries[0], filters_info, pool)
+
+
+async def aretrieve_movies_fanout(
+    english_queries: List[str], intent: MovieSearchIntent
+) -> Tuple[str, str, List[float], Optional[dict]]:
+    english_queries, relaxed_intent, filters = _fanout_queries(english_queries, intent)
+    results = await arun_hybrid_search_multi(english_queries, filters)
+    top_hits, scores, filters_info, pool = await run_inference(
+        _rank_fanout_results, english_queries[0], intent, relaxed_intent, results
+    )
+    return await _aformat_results(
+        top_hits, scores, english_queries[0], filters_info, pool
+    )
+
+
+def _fanout_queries(
+    english_queries: List[str], intent: MovieSearchIntent
+) -> Tuple[List[str], MovieSearchIntent, List[Optional[models.Filter]]]:
+    english_queries = [
+        build_search_query(intent.model_copy(update={"synthesized_query": q}), q)
+        for q in english_queries
+    ]
+    logger.info("\n🔍 Szukam w bazie dla %d zapytań naraz...", len(english_queries))
+    for query in english_queries:
+        logger.info("   -> '%s'", query)
+
+    relaxed_intent = relax_intent(intent)
+    filters = [build_qdrant_filter(intent)]
+    if relaxed_intent != intent:
+        filters.append(build_qdrant_filter(relaxed_intent))
+    return english_queries, relaxed_intent, filters
+
+
+def _rank_fanout_results(
+    primary: str,
+    intent: MovieSearchIntent,
+    relaxed_intent: MovieSearchIntent,
+    results: List[List[List[models.ScoredPoint]]],
+) -> Tuple[List[models.ScoredPoint], Dict[int, float], str, Optional[dict]]:
+    hits = fuse_rankings([per_query[0] for per_query in results])
+    filters_info, pool_intent, candidates = "", intent, hits
+    if len(hits) >= 3 or len(results[0]) == 1:
+        scores = score_hits(primary, hits)
+        top_hits = rerank_qdrant_hits(
+            primary, hits, intent.specific_title, top_k=5, scores=scores
+        )
+    else:
+        logger.info("\n⚠️  Mało wyników. Używam poluzowanych filtrów...")
+        incr("retrieve.relaxed")
+        relaxed_hits = fuse_rankings([per_query[1] for per_query in results])
+        scores = score_hits(primary, hits + relaxed_hits)
+        top_hits = rerank_qdrant_hits(
+            primary, hits, intent.specific_title, top_k=5, scores=scores
+        )
+        relaxed_top_hits = rerank_qdrant_hits(
+            primary, relaxed_hits, top_k=5, scores=scores
+        )
+        if len(relaxed_top_hits) > len(top_hits):
+            top_hits = relaxed_top_hits
+            filters_info = RELAXED_FILTERS_INFO
+            pool_intent, candidates = relaxed_intent, relaxed_hits
 
-    return filters_info + "\n\n".join(formatted_docs), english_query
+    return (
+        top_hits,
+        scores,
+        filters_info,
+        _candidate_pool(pool_intent, candidates, top_hits),
+    )